@@ -0,0 +1,274 @@
+import os
+import time
+import logging
+import threading
+from datetime import date, datetime, timezone
+from dotenv import load_dotenv
+from sheets import (
+    get_google_sheets_service, get_drive_service, get_or_create_spreadsheet,
+    list_warehouse_spreadsheets, get_sheet_index, get_inventory_titles,
+    parse_inventory_title, is_ledger_inventory, batch_update, get_or_create_folder,
+    read_inventory_values, allocate_sheet_title,
+    list_folder_files, find_drive_files, forget_drive_file, refresh_drive_ids, FOLDER_NAME, FOLDER_MIME_TYPE,
+    SPREADSHEET_MIME_TYPE, DRIVE_ID_TTL
+)
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Константы
+ARCHIVE_ENABLED = os.getenv('ARCHIVE_ENABLED', '1') == '1'
+ARCHIVE_MAX_TABS = int(os.getenv('ARCHIVE_MAX_TABS', '200'))  # Сколько инвентаризаций оставлять в рабочей таблице
+# Сколько последних инвентаризаций остается в рабочей таблице независимо от года:
+# по ним строятся сводный отчет и расхождения
+ARCHIVE_KEEP_TABS = int(os.getenv('ARCHIVE_KEEP_TABS', '10'))
+ARCHIVE_INTERVAL = 24 * 3600  # Интервал архивации в секундах
+ARCHIVE_START_DELAY = 600  # Первая архивация после запуска в секундах: бот, перезапускаемый чаще раза в сутки, тоже архивирует
+ARCHIVE_BATCH_SIZE = 20  # Листов в одной пачке копирования и удаления
+REGISTRY_TTL = 600  # Сколько секунд список таблиц склада считается актуальным
+RECONCILE_INTERVAL = 3600  # Интервал поиска одноименных папок и таблиц в секундах
+# Дубликат обрабатывается, только если не менялся дольше, чем процессы помнят найденные id:
+# к этому времени все они уже пишут в основной файл
+RECONCILE_GRACE = max(2 * DRIVE_ID_TTL, 1800)
+
+# Реестр таблиц: {название таблицы: id}; рабочая таблица склада называется как склад,
+# архивные — по шаблону archive_name. read_at — время последнего запроса реестра без обновления
+registry = {'spreadsheets': {}, 'loaded_at': 0.0, 'read_at': 0.0}
+registry_lock = threading.Lock()
+
+def archive_name(warehouse, year):
+    """Название архивной таблицы склада за год"""
+    return f"{warehouse} (архив {year})"
+
+def is_archive_name(name):
+    """Название архивной таблицы"""
+    return ' (архив ' in name and name.endswith(')')
+
+def duplicate_name(name, file_id):
+    """Название, под которым остается дубликат таблицы, требующий ручного разбора"""
+    return f"{name} (дубликат {file_id[:8]})"
+
+def is_duplicate_name(name):
+    """Название отложенного дубликата"""
+    return ' (дубликат ' in name and name.endswith(')')
+
+def get_registry(drive_service, refresh=False):
+    """Таблицы складов и архивов из папки инвентаризаций"""
+    with registry_lock:
+        if not refresh:
+            registry['read_at'] = time.time()
+        if refresh or time.time() - registry['loaded_at'] > REGISTRY_TTL:
+            registry['spreadsheets'] = list_warehouse_spreadsheets(drive_service)
+            registry['loaded_at'] = time.time()
+        return registry['spreadsheets']
+
+def refresh_lookups(within):
+    """Заранее перечитать реестр таблиц и найти заново файлы Drive, срок которых истекает в ближайшие
+    within секунд (блокирующий вызов). Обновляется только то, что запрашивали за время их жизни:
+    реестр — /history и /export, найденные id — сохранение. Возвращает число обновленных записей"""
+    drive_service = get_drive_service()
+    refreshed = 0
+    now = time.time()
+    if now - registry['read_at'] < REGISTRY_TTL and now - registry['loaded_at'] + within > REGISTRY_TTL:
+        # Список папки заодно обновляет найденные id таблиц складов
+        get_registry(drive_service, refresh=True)
+        refreshed += 1
+    return refreshed + refresh_drive_ids(drive_service, within)
+
+def warehouse_spreadsheet_ids(drive_service, warehouse):
+    """Рабочая таблица склада и его архивы, от новых к старым"""
+    spreadsheets = get_registry(drive_service)
+    if warehouse not in spreadsheets:
+        # Таблица могла появиться после загрузки реестра
+        spreadsheets = get_registry(drive_service, refresh=True)
+    ids = [spreadsheets[warehouse]] if warehouse in spreadsheets else []
+    prefix = archive_name(warehouse, '')[:-1]
+    ids.extend(spreadsheets[name] for name in sorted(spreadsheets, reverse=True) if name.startswith(prefix))
+    return ids
+
+def list_inventories(sheets_service, drive_service, warehouse):
+    """Инвентаризации склада из рабочей таблицы и архивов: пары (spreadsheet_id, лист), от новых к старым"""
+    entries = []
+    for spreadsheet_id in warehouse_spreadsheet_ids(drive_service, warehouse):
+        entries.extend((spreadsheet_id, title) for title in get_inventory_titles(sheets_service, spreadsheet_id))
+    entries.sort(key=lambda entry: parse_inventory_title(entry[1]), reverse=True)
+    return entries
+
+def select_tabs_to_archive(titles, today, max_tabs=ARCHIVE_MAX_TABS, keep_tabs=ARCHIVE_KEEP_TABS):
+    """Листы для переноса в архив по годам: прошлые годы и все, что сверх max_tabs последних.
+    titles идут от новых к старым; первые keep_tabs остаются всегда"""
+    plan = {}
+    for position, title in enumerate(titles):
+        if position < keep_tabs:
+            continue
+        year = int(parse_inventory_title(title)[0][:4])
+        if year < today.year or position >= max_tabs:
+            plan.setdefault(year, []).append(title)
+    return plan
+
+def move_tabs(service, source_id, archive_id, titles):
+    """Перенести листы в другую таблицу (архивную или основную): copyTo пачкой, затем переименование и удаление
+    по одному batchUpdate. Одноименный лист в целевой таблице с тем же содержимым — копия прошлого прерванного
+    запуска, такой лист только удаляется; с другим содержимым (листы одновременно созданных таблиц нумеруются
+    независимо) лист копируется под следующим свободным номером. Возвращает перенесенные листы"""
+    source_titles = get_sheet_index(service, source_id)['titles']
+    archive_titles = get_sheet_index(service, archive_id)['titles']
+    existing = [title for title in titles if title in archive_titles]
+    same = set()
+    if existing:
+        source_values = read_inventory_values(service, source_id, existing)
+        archive_values = read_inventory_values(service, archive_id, existing)
+        same = {title for title, ours, theirs in zip(existing, source_values, archive_values) if ours == theirs}
+    to_copy = [title for title in titles if title not in same]
+    # Название копии в целевой таблице
+    target_titles = {
+        title: allocate_sheet_title(service, archive_id, f"Инвентаризация {parse_inventory_title(title)[0]}")
+        if title in archive_titles else title
+        for title in to_copy
+    }
+    copied = {}
+
+    def on_copied(request_id, response, exception):
+        if exception:
+            logging.error("Ошибка копирования листа '%s' в архив: %s", to_copy[int(request_id)], exception)
+        else:
+            copied[to_copy[int(request_id)]] = response['sheetId']
+
+    if to_copy:
+        batch = service.new_batch_http_request()
+        for i, title in enumerate(to_copy):
+            batch.add(
+                service.spreadsheets().sheets().copyTo(
+                    spreadsheetId=source_id,
+                    sheetId=source_titles[title],
+                    body={'destinationSpreadsheetId': archive_id},
+                    fields='sheetId'
+                ),
+                callback=on_copied,
+                request_id=str(i)
+            )
+        batch.execute()
+
+    if copied:
+        # Копия получает название «Копия …»: возвращаем исходное, индекс архива обновится по запросам
+        batch_update(service, archive_id, [
+            {'updateSheetProperties': {'properties': {'sheetId': sheet_id, 'title': target_titles[title]}, 'fields': 'title'}}
+            for title, sheet_id in copied.items()
+        ])
+        for title in copied:
+            if target_titles[title] != title:
+                logging.warning("Лист '%s' перенесен под названием '%s': такой лист уже есть в %s", title, target_titles[title], archive_id)
+
+    done = [title for title in titles if title in same or title in copied]
+    # В таблице должен остаться хотя бы один лист; его копия уже есть в целевой таблице
+    deleted = done[:max(0, len(source_titles) - 1)]
+    if deleted:
+        batch_update(service, source_id, [{'deleteSheet': {'sheetId': source_titles[title]}} for title in deleted])
+    return done
+
+def archive_warehouse(sheets_service, drive_service, warehouse, spreadsheet_id, today=None):
+    """Перенести старые листы склада в архивные таблицы по годам"""
+    today = today or date.today()
+    titles = [
+        title for title in get_inventory_titles(sheets_service, spreadsheet_id)
+        if not is_ledger_inventory(sheets_service, spreadsheet_id, title)
+    ]
+    moved = 0
+    for year, year_titles in sorted(select_tabs_to_archive(titles, today).items()):
+        archive_id = get_or_create_spreadsheet(sheets_service, drive_service, archive_name(warehouse, year))
+        for start in range(0, len(year_titles), ARCHIVE_BATCH_SIZE):
+            moved += len(move_tabs(sheets_service, spreadsheet_id, archive_id, year_titles[start:start + ARCHIVE_BATCH_SIZE]))
+    if moved:
+        logging.info("Склад %s: в архив перенесено листов %s", warehouse, moved)
+        get_registry(drive_service, refresh=True)
+    return moved
+
+def run_archival():
+    """Архивация всех складов (блокирующий вызов)"""
+    sheets_service = get_google_sheets_service()
+    drive_service = get_drive_service()
+    spreadsheets = get_registry(drive_service, refresh=True)
+    moved = 0
+    for name, spreadsheet_id in spreadsheets.items():
+        if is_archive_name(name) or is_duplicate_name(name):
+            continue
+        try:
+            moved += archive_warehouse(sheets_service, drive_service, name, spreadsheet_id)
+        except Exception as e:
+            logging.error("Ошибка архивации склада %s: %s", name, e)
+    return moved
+
+def _is_settled(file, now):
+    """Файл не менялся дольше RECONCILE_GRACE секунд"""
+    modified = datetime.fromisoformat(file['modifiedTime'].replace('Z', '+00:00'))
+    return (now - modified).total_seconds() > RECONCILE_GRACE
+
+def _trash(drive_service, file_id):
+    drive_service.files().update(fileId=file_id, body={'trashed': True}).execute()
+    forget_drive_file(file_id)
+
+def merge_folders(drive_service, now):
+    """Перенести содержимое одноименных папок инвентаризаций в основную и удалить их"""
+    folders = find_drive_files(drive_service, FOLDER_NAME, FOLDER_MIME_TYPE)
+    merged = 0
+    for folder in folders[1:]:
+        if not _is_settled(folder, now):
+            continue
+        for file in list_folder_files(drive_service, folder['id'], SPREADSHEET_MIME_TYPE):
+            drive_service.files().update(
+                fileId=file['id'],
+                addParents=folders[0]['id'],
+                removeParents=folder['id'],
+                fields='id, parents'
+            ).execute()
+        _trash(drive_service, folder['id'])
+        logging.warning("Папка-дубликат %s объединена с основной %s", folder['id'], folders[0]['id'])
+        merged += 1
+    return merged
+
+def merge_spreadsheet(sheets_service, drive_service, name, target_id, duplicate):
+    """Перенести листы дубликата таблицы в основную и удалить дубликат.
+    Инвентаризации из листа-журнала не переносятся: такой дубликат переименовывается для ручного разбора"""
+    duplicate_id = duplicate['id']
+    titles = get_inventory_titles(sheets_service, duplicate_id)
+    if any(is_ledger_inventory(sheets_service, duplicate_id, title) for title in titles):
+        drive_service.files().update(fileId=duplicate_id, body={'name': duplicate_name(name, duplicate_id)}).execute()
+        forget_drive_file(duplicate_id)
+        logging.error(
+            "Таблица '%s' (%s) дублирует %s и содержит журнал инвентаризаций: "
+            "переименована в '%s', объедините вручную",
+            name, duplicate_id, target_id, duplicate_name(name, duplicate_id)
+        )
+        return False
+    moved = []
+    for start in range(0, len(titles), ARCHIVE_BATCH_SIZE):
+        moved.extend(move_tabs(sheets_service, duplicate_id, target_id, titles[start:start + ARCHIVE_BATCH_SIZE]))
+    # Удаляется только дубликат, все листы которого перенесены (или совпадают с листами основной таблицы)
+    missing = [title for title in titles if title not in moved]
+    if missing:
+        logging.error("Таблица '%s' (%s): не перенесены листы %s, повтор при следующей проверке", name, duplicate_id, missing)
+        return False
+    _trash(drive_service, duplicate_id)
+    logging.warning("Таблица-дубликат '%s' (%s) объединена с %s, листов перенесено %s", name, duplicate_id, target_id, len(titles))
+    return True
+
+def reconcile_duplicates():
+    """Объединить одноименные папки и таблицы, созданные одновременно разными процессами (блокирующий вызов)"""
+    sheets_service = get_google_sheets_service()
+    drive_service = get_drive_service()
+    now = datetime.now(timezone.utc)
+    merged = merge_folders(drive_service, now)
+    folder_id = get_or_create_folder(drive_service)
+    files = list_folder_files(drive_service, folder_id, SPREADSHEET_MIME_TYPE)
+    canonical = {}
+    for file in files:
+        if file['name'] not in canonical:
+            canonical[file['name']] = file['id']
+        elif _is_settled(file, now):
+            try:
+                merged += merge_spreadsheet(sheets_service, drive_service, file['name'], canonical[file['name']], file)
+            except Exception as e:
+                logging.error("Ошибка объединения дубликата таблицы '%s' (%s): %s", file['name'], file['id'], e)
+    if merged:
+        get_registry(drive_service, refresh=True)
+    return merged
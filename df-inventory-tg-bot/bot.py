@@ -1,15 +1,51 @@
 import os
-import logging
+import json
 import time
+import logging
+import math
+import uuid
+import asyncio
+from functools import lru_cache
 from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup, ReplyKeyboardRemove
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
+from telegram.error import BadRequest
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, TypeHandler, filters, ContextTypes
 from sheets import (
-    get_google_sheets_service, get_drive_service, get_or_create_spreadsheet,
-    create_new_sheet, save_inventory_data, get_inventory_history,
-    move_existing_files_to_folder
+    get_google_sheets_service, get_drive_service, get_inventory_history,
+    move_existing_files_to_folder, parse_inventory_title, read_inventory_values,
+    is_ledger_inventory, build_ledger_view, get_sheet_index_metrics, is_transport_error, describe_error,
+    INVENTORY_HEADER_ROWS
+)
+from export import EXPORT_FORMATS, build_export, iter_warehouse_rows
+from archive import ARCHIVE_ENABLED, ARCHIVE_INTERVAL, ARCHIVE_START_DELAY, RECONCILE_INTERVAL, list_inventories
+from report import build_report, find_report_products, format_quantity, report_summary, write_report_csv
+from variance import format_variance
+from forecast import (
+    build_forecast, warehouse_forecast, reorder_list, format_reorder_list,
+    REORDER_REPORT_TIME, shutdown_pool
+)
+from offline import (
+    build_record, push_record, save_pending, is_google_available,
+    mark_google_unavailable, run_sync_engine, editing_changes
+)
+from config import WAREHOUSES, ADMIN_IDS
+from catalog import get_catalog, watch_catalog, new_quantities, iter_quantities
+from profiles import get_catalog_view, load_learned_profiles, record_learned_items
+from ratelimit import SendScheduler
+from progress import Progress
+from warmup import WARMUP_ON_START, run_warmup, get_warmup_status
+from cache import get_cache_stats
+from logconfig import setup_logging, bind, clear_context
+from sessions import create_session_store, build_session, dump_session, load_session, SESSION_TTL
+from jobs import (
+    schedule_repeating, schedule_daily, get_job_metrics, refresh_caches_job, refresh_lookups_job, consolidation_report_job,
+    reorder_job, archive_job, reconcile_job, compact_journal_job, CACHE_REFRESH_INTERVAL,
+    CONSOLIDATION_REPORT_TIME, JOURNAL_COMPACT_TIME
+)
+from journal import (
+    log_start, log_meta, log_quantity, close_session, flush as flush_journal,
+    replay_sessions, run_journal_flusher
 )
-from config import WAREHOUSES, PRODUCT_CATEGORIES
 from googleapiclient.discovery import build
 from google.oauth2.credentials import Credentials
 from google.oauth2 import service_account
@@ -19,73 +55,141 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Константы
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')  # Получаем токен из переменных окружения
-CACHE_TIMEOUT = 300  # Увеличиваем время жизни кэша до 5 минут
 REQUEST_TIMEOUT = 30  # Таймаут для запросов в секундах
 
-# Словари для хранения данных пользователей и кэша
+# Словари для хранения данных пользователей и фоновых задач
 user_data = {}
-sheets_cache = {}
-drive_cache = {}
+background_tasks = {}
+# Хранилище сессий, общее для процессов бота; в режиме одного процесса сессии живут только в user_data
+session_store = create_session_store()
+# Номер процесса и число процессов: пользователь всегда обслуживается процессом user_id % count
+worker = {'index': 0, 'count': 1}
+# Долгие операции пользователей: user_id -> {(вид операции, задача)}
+user_tasks = {}
+# Время последнего обновления от пользователя: user_id -> time.time()
+user_seen = {}
+SESSION_EVICT_INTERVAL = 3600  # Как часто закрывать заброшенные сессии, в секундах
 
-def get_cached_drive_files():
-    try:
-        current_time = time.time()
-        if 'drive_files' in sheets_cache and current_time - sheets_cache['drive_files']['timestamp'] < CACHE_TIMEOUT:
-            return sheets_cache['drive_files']['data']
-        
-        time.sleep(0.5)  # Добавляем задержку между запросами
-        files = drive_service.files().list(
-            q="mimeType='application/vnd.google-apps.spreadsheet'",
-            fields='files(id, name)'
-        ).execute()
-        
-        sheets_cache['drive_files'] = {
-            'timestamp': current_time,
-            'data': files.get('files', [])
-        }
-        return sheets_cache['drive_files']['data']
-    except Exception as e:
-        logging.error(f"Error getting drive files: {str(e)}")
-        return sheets_cache.get('drive_files', {}).get('data', []) if 'drive_files' in sheets_cache else []
+def start_user_task(context, user_id, kind, coroutine, replace=True):
+    """Выполнить долгую операцию пользователя в фоне, не задерживая обработку следующих обновлений.
+    При replace незавершенные операции того же вида отменяются: показываем результат последнего нажатия"""
+    tasks = user_tasks.setdefault(user_id, set())
+    if replace:
+        for running_kind, running in list(tasks):
+            if running_kind == kind:
+                running.cancel()
+    
+    async def run():
+        try:
+            await coroutine
+        finally:
+            # Операция меняет сессию уже после обработки обновления
+            await persist_session(user_id)
+    task = context.application.create_task(run())
+    entry = (kind, task)
+    tasks.add(entry)
+    task.add_done_callback(lambda finished: tasks.discard(entry))
+    return task
+
+async def new_session(user_id):
+    """Новая сессия пользователя, закрепленная за актуальной версией каталога"""
+    # Незавершенная предыдущая сессия уходит в архив журнала
+    previous = user_data.get(user_id)
+    if previous and 'session_id' in previous:
+        try:
+            await asyncio.to_thread(close_session, previous['session_id'], user_id, 'abandoned')
+        except Exception as e:
+            logging.error("Error closing journal session: %s", e)
+    
+    catalog = get_catalog()
+    session = {
+        'step': 'phone',
+        'session_id': uuid.uuid4().hex,
+        'catalog': catalog,
+        # Количества по номерам товаров каталога
+        'quantities': new_quantities(catalog)
+    }
+    log_start(session['session_id'], user_id, catalog.version)
+    return session
 
-def get_cached_sheets(spreadsheet_id):
+def restore_sessions():
+    """Восстановление незавершенных сессий из журнала после перезапуска"""
+    restored = []
+    for state in replay_sessions():
+        # Каждый процесс восстанавливает только своих пользователей
+        if state['user_id'] % worker['count'] != worker['index']:
+            continue
+        session = build_session(state['session_id'], state['meta'], state['quantities'])
+        if 'warehouse' in session:
+            session['step'] = 'selecting_category'
+        elif 'phone' in session:
+            session['step'] = 'name'
+        else:
+            session['step'] = 'phone'
+        user_data[state['user_id']] = session
+        # Срок заброшенной сессии отсчитывается заново с перезапуска
+        user_seen[state['user_id']] = time.time()
+        restored.append(state['user_id'])
+    return restored
+
+async def load_user_session(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Перед обработчиками: контекст логирования и сессия пользователя из общего хранилища,
+    если ее нет в памяти процесса. Обновления пользователя всегда приходят в один процесс,
+    поэтому копия в памяти остается актуальной"""
+    clear_context()
+    user = update.effective_user
+    bind(update_id=update.update_id, user_id=user.id if user else None)
+    if user is None:
+        return
+    user_seen[user.id] = time.time()
+    if session_store.shared and user.id not in user_data:
+        data = await asyncio.to_thread(session_store.get, user.id)
+        if data is not None:
+            user_data[user.id] = load_session(data)
+    bind(warehouse=user_data.get(user.id, {}).get('warehouse'))
+
+async def persist_session(user_id):
+    """Записать сессию пользователя в общее хранилище или удалить завершенную"""
+    session = user_data.get(user_id)
     try:
-        cache_key = f'sheets_{spreadsheet_id}'
-        current_time = time.time()
-        if cache_key in sheets_cache and current_time - sheets_cache[cache_key]['timestamp'] < CACHE_TIMEOUT:
-            return sheets_cache[cache_key]['data']
-        
-        time.sleep(0.5)  # Добавляем задержку между запросами
-        result = sheets_service.spreadsheets().get(
-            spreadsheetId=spreadsheet_id,
-            fields='sheets.properties.title'
-        ).execute()
-        
-        sheets_cache[cache_key] = {
-            'timestamp': current_time,
-            'data': result.get('sheets', [])
-        }
-        return sheets_cache[cache_key]['data']
+        if session is None:
+            await asyncio.to_thread(session_store.delete, user_id)
+        else:
+            await asyncio.to_thread(session_store.put, user_id, dump_session(session))
     except Exception as e:
-        logging.error(f"Error getting sheets for {spreadsheet_id}: {str(e)}")
-        return sheets_cache.get(f'sheets_{spreadsheet_id}', {}).get('data', []) if f'sheets_{spreadsheet_id}' in sheets_cache else []
+        logging.error("Error saving session of user %s: %s", user_id, e)
+
+async def save_user_session(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """После обработчиков: изменения сессии попадают в общее хранилище"""
+    if update.effective_user is not None:
+        await persist_session(update.effective_user.id)
+
+def get_user_catalog(user_id):
+    """Версия каталога, закрепленная за сессией пользователя, с учетом профиля склада"""
+    session = user_data.get(user_id)
+    if session is None:
+        return get_catalog()
+    if 'catalog' not in session:
+        session['catalog'] = get_catalog()
+    if 'warehouse' in session and not session.get('full_catalog'):
+        # Представление тоже закрепляется: кнопки товаров и разделов ссылаются на позиции в нем,
+        # а обученный профиль склада пополняется сохранениями других пользователей
+        view = session.get('catalog_view')
+        if view is None or view.catalog is not session['catalog'] or view.warehouse != session['warehouse']:
+            view = session['catalog_view'] = get_catalog_view(session['catalog'], session['warehouse'])
+        return view
+    return session['catalog']
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начало работы с ботом"""
     user_id = update.effective_user.id
-    user_data[user_id] = {
-        'step': 'phone',
-        'inventory_data': {}
-    }
+    user_data[user_id] = await new_session(user_id)
     
     keyboard = [[InlineKeyboardButton("📝 Начать новую инвентаризацию", callback_data="new_inventory")]]
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -102,6 +206,27 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if query.data == "new_inventory":
         await start_new_inventory(update, context)
+    elif query.data.startswith("hist_view_"):
+        start_user_task(context, user_id, 'ledger_view', show_ledger_view(update, context, int(query.data[10:])))
+    elif query.data.startswith("hist_wh_"):
+        start_user_task(context, user_id, 'history', show_warehouse_history(update, context, int(query.data[8:])))
+    elif query.data.startswith("hist_edit_"):
+        if not context.user_data.get('history'):
+            await query.answer("Выберите склад в /history")
+            return
+        start_user_task(context, user_id, 'history', start_edit_inventory(update, context, int(query.data[10:])))
+    elif query.data.startswith("hist_"):
+        history = context.user_data.get('history')
+        if not history:
+            await query.answer("Выберите склад в /history")
+            return
+        index = int(query.data[5:])
+        start_user_task(
+            context, user_id, 'history',
+            show_inventory_details(update, context, history['spreadsheets'][index], history['titles'][index])
+        )
+    elif query.data.startswith("export_"):
+        start_user_task(context, user_id, 'export', handle_history_export(update, context), replace=False)
     elif query.data.startswith("warehouse_"):
         await handle_warehouse_selection(update, context)
     elif query.data.startswith("confirm_warehouse_"):
@@ -110,15 +235,22 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_data[user_id]['step'] = 'selecting_category'
         user_data[user_id]['category_path'] = []  # Сбрасываем путь категории
         
-        # Отправляем новое сообщение с категориями
+        # Показываем категории в том же сообщении
         reply_markup = get_product_category_keyboard(user_id)
-        message = await query.message.reply_text(
+        message = await query.message.edit_text(
             "Выберите категорию продукта:",
             reply_markup=reply_markup
         )
         user_data[user_id]['last_category_message_id'] = message.message_id
-        
-        await query.message.delete()
+        await query.answer()
+    elif query.data == "toggle_full_catalog":
+        # Переключаем отображение: профиль склада или весь каталог
+        user_data[user_id]['full_catalog'] = not user_data[user_id].get('full_catalog')
+        user_data[user_id]['category_path'] = []
+        await query.message.edit_text(
+            "Выберите категорию продукта:",
+            reply_markup=get_product_category_keyboard(user_id)
+        )
         await query.answer()
     elif query.data == "back_to_warehouse":
         # Возвращаемся к выбору склада
@@ -154,8 +286,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
     elif query.data.startswith("category_"):
         category_index = int(query.data[9:])
-        categories = list(PRODUCT_CATEGORIES.keys())
-        category = categories[category_index]
+        category = get_user_catalog(user_id).categories[category_index]
         
         # Инициализируем или очищаем путь категории
         user_data[user_id]['category_path'] = [category]
@@ -168,11 +299,12 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=reply_markup
         )
     elif query.data.startswith("subcat_"):
-        _, index, subcat_name = query.data.split('_')
+        subcat_index = int(query.data[7:])
         
         # Добавляем подкатегорию в путь
         if 'category_path' not in user_data[user_id]:
             user_data[user_id]['category_path'] = []
+        subcat_name = get_user_catalog(user_id).get_child(user_data[user_id]['category_path'], subcat_index)['name']
         user_data[user_id]['category_path'].append(subcat_name)
         
         reply_markup = get_product_category_keyboard(user_id)
@@ -180,25 +312,18 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"Подкатегория {subcat_name}:",
             reply_markup=reply_markup
         )
-    elif query.data == "confirm_save":
-        await finish_inventory(update, context)
     elif query.data == "cancel_save":
-        # Удаляем сообщение с итогами
-        try:
-            if 'summary_message_id' in user_data[user_id]:
-                await context.bot.delete_message(
-                    chat_id=query.message.chat_id,
-                    message_id=user_data[user_id]['summary_message_id']
-                )
-        except Exception as e:
-            logging.error(f"Error deleting summary message: {str(e)}")
-        
+        if user_data.get(user_id, {}).get('save_state') == 'saving':
+            await query.answer("⏳ Сохранение уже выполняется")
+            return
         # Очищаем данные пользователя
         if user_id in user_data:
+            if 'session_id' in user_data[user_id]:
+                await asyncio.to_thread(close_session, user_data[user_id]['session_id'], user_id, 'cancelled')
             del user_data[user_id]
         
-        # Отправляем сообщение об отмене
-        await query.message.reply_text(
+        # Заменяем сообщение с итогами сообщением об отмене
+        await query.message.edit_text(
             "❌ Инвентаризация отменена",
             reply_markup=InlineKeyboardMarkup([[
                 InlineKeyboardButton("📝 Начать новую", callback_data="new_inventory")
@@ -209,29 +334,34 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif query.data.startswith("product_"):
         product_index = int(query.data[8:])
         
-        # Получаем текущую категорию на основе пути
-        current_category = PRODUCT_CATEGORIES
-        for path_item in user_data[user_id]['category_path']:
-            if isinstance(current_category, dict) and 'subcategories' in current_category:
-                current_category = current_category['subcategories'][path_item]
-            else:
-                current_category = current_category[path_item]
+        # Получаем товар текущей категории на основе пути
+        catalog = get_user_catalog(user_id)
+        product_id = catalog.get_node(user_data[user_id]['category_path'])['items'][product_index]
+        product = catalog.products[product_id].display
         
-        # Получаем список товаров
-        items = current_category.get('items', []) if isinstance(current_category, dict) else current_category
-        product = items[product_index]
-        
-        user_data[user_id]['current_product'] = product
+        user_data[user_id]['current_product'] = product_id
         user_data[user_id]['step'] = 'entering_quantity'
         
-        # Отправляем сообщение и сохраняем его ID
+        # Запрос количества показываем в закрепленном сообщении сессии
         message = await query.message.edit_text(
             f"Введите количество для {product}:",
-            reply_markup=InlineKeyboardMarkup([[
-                InlineKeyboardButton("⬅️ Назад", callback_data="back_category")
-            ]])
+            reply_markup=get_quantity_keyboard(user_id, product_id)
+        )
+        user_data[user_id]['last_category_message_id'] = message.message_id
+    elif query.data == "clear_product":
+        product_id = user_data[user_id]['current_product']
+        previous = user_data[user_id]['quantities'][product_id]
+        user_data[user_id]['quantities'][product_id] = float('nan')
+        user_data[user_id]['step'] = 'selecting_category'
+        product = get_user_catalog(user_id).products[product_id].display
+        if previous == previous:
+            log_quantity(user_data[user_id]['session_id'], user_id, product, None, previous)
+        
+        await query.message.edit_text(
+            f"🗑 Количество для {product} удалено\n\nВыберите следующую категорию продукта:",
+            reply_markup=get_product_category_keyboard(user_id)
         )
-        user_data[user_id]['quantity_request_message_id'] = message.message_id
+        await query.answer()
     elif query.data == "back_to_products":
         user_data[user_id]['step'] = 'selecting_product'
         await show_products(update, context)
@@ -244,72 +374,60 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message_text = update.message.text
     
     if user_id not in user_data:
-        user_data[user_id] = {
-            'step': 'phone',
-            'inventory_data': {}
-        }
+        user_data[user_id] = await new_session(user_id)
     
     current_step = user_data[user_id]['step']
     
     if current_step == 'name':
         user_data[user_id]['name'] = message_text
         user_data[user_id]['date'] = datetime.now().strftime("%Y-%m-%d")
+        log_meta(user_data[user_id]['session_id'], user_id, name=message_text, date=user_data[user_id]['date'])
         user_data[user_id]['step'] = 'warehouse'
         await update.message.reply_text(
             "Выберите склад:", 
             reply_markup=get_warehouse_keyboard()
         )
     elif current_step == 'entering_quantity':
+        chat_id = update.message.chat_id
+        product_id = user_data[user_id]['current_product']
+        product = get_user_catalog(user_id).products[product_id].display
+        
+        # Сообщение с введенным количеством удаляем в фоне, не дожидаясь ответа Telegram
+        delete_message_later(context, chat_id, update.message.message_id)
+        
         try:
-            quantity = float(message_text)
-            if quantity < 0:
-                await update.message.reply_text("Пожалуйста, введите положительное число:")
-                return
-                
-            product = user_data[user_id]['current_product']
-            user_data[user_id]['inventory_data'][product] = quantity
-            user_data[user_id]['step'] = 'selecting_category'
-            
-            # Сохраняем ID сообщения с введенным количеством
-            user_data[user_id]['quantity_message_id'] = update.message.message_id
-            
-            # Удаляем предыдущее сообщение с категориями, если оно есть
-            try:
-                if 'last_category_message_id' in user_data[user_id]:
-                    await context.bot.delete_message(
-                        chat_id=update.message.chat_id,
-                        message_id=user_data[user_id]['last_category_message_id']
-                    )
-            except Exception as e:
-                logging.error(f"Error deleting previous category message: {str(e)}")
-            
-            # Удаляем сообщение с запросом количества
-            try:
-                if 'quantity_request_message_id' in user_data[user_id]:
-                    await context.bot.delete_message(
-                        chat_id=update.message.chat_id,
-                        message_id=user_data[user_id]['quantity_request_message_id']
-                    )
-            except Exception as e:
-                logging.error(f"Error deleting quantity request message: {str(e)}")
-            
-            # Удаляем сообщение с введенным количеством
-            try:
-                await update.message.delete()
-            except Exception as e:
-                logging.error(f"Error deleting quantity message: {str(e)}")
-            
-            # Отправляем сообщение с категориями
-            reply_markup = get_product_category_keyboard(user_id)
-            message = await update.message.reply_text(
-                f"✅ Количество для {product} сохранено: {quantity}\n\nВыберите следующую категорию продукта:",
-                reply_markup=reply_markup
-            )
-            # Сохраняем ID нового сообщения с категориями
-            user_data[user_id]['last_category_message_id'] = message.message_id
-            
+            quantity = float(message_text.replace(',', '.'))
         except ValueError:
-            await update.message.reply_text("Пожалуйста, введите корректное число:")
+            quantity = None
+        if quantity is None or not math.isfinite(quantity):
+            await update_anchor_message(
+                context, user_id, chat_id,
+                f"Пожалуйста, введите корректное число.\n\nВведите количество для {product}:",
+                get_quantity_keyboard(user_id, product_id)
+            )
+            return
+        if quantity < 0:
+            await update_anchor_message(
+                context, user_id, chat_id,
+                f"Пожалуйста, введите положительное число.\n\nВведите количество для {product}:",
+                get_quantity_keyboard(user_id, product_id)
+            )
+            return
+        
+        previous = user_data[user_id]['quantities'][product_id]
+        user_data[user_id]['quantities'][product_id] = quantity
+        log_quantity(
+            user_data[user_id]['session_id'], user_id, product, quantity,
+            previous if previous == previous else None
+        )
+        user_data[user_id]['step'] = 'selecting_category'
+        
+        # Обновляем закрепленное сообщение вместо удаления и повторной отправки
+        await update_anchor_message(
+            context, user_id, chat_id,
+            f"✅ Количество для {product} сохранено: {quantity}\n\nВыберите следующую категорию продукта:",
+            get_product_category_keyboard(user_id)
+        )
 
 async def handle_contact(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка получения контакта"""
@@ -321,6 +439,7 @@ async def handle_contact(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Сохраняем номер телефона
     user_data[user_id]['phone'] = contact.phone_number
+    log_meta(user_data[user_id]['session_id'], user_id, phone=contact.phone_number)
     user_data[user_id]['step'] = 'name'
     
     # Убираем клавиатуру с кнопкой "Поделиться номером"
@@ -329,89 +448,100 @@ async def handle_contact(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=ReplyKeyboardRemove()
     )
 
-async def show_history_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показать меню истории инвентаризаций"""
-    try:
-        if not context.user_data.get('selected_warehouse'):
-            await update.message.reply_text(
-                "Пожалуйста, сначала выберите склад.",
-                reply_markup=ReplyKeyboardMarkup([['Выбрать склад']], resize_keyboard=True)
-            )
-            return
-
-        warehouse_name = context.user_data['selected_warehouse']
-        
-        # Получаем список файлов из кэша
-        files = get_cached_drive_files()
-        
-        # Ищем нужный файл
-        spreadsheet = next((file for file in files if file['name'] == warehouse_name), None)
-        if not spreadsheet:
-            await update.message.reply_text(
-                f"Не найден файл для склада {warehouse_name}",
-                reply_markup=ReplyKeyboardMarkup([['Выбрать склад']], resize_keyboard=True)
-            )
-            return
-
-        # Получаем список листов из кэша
-        sheets = get_cached_sheets(spreadsheet['id'])
-        
-        if not sheets:
-            keyboard = [[InlineKeyboardButton("Начать новую", callback_data="new_inventory")]]
-            await update.message.reply_text(
-                "История инвентаризаций пуста.",
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-            return
+HISTORY_PAGE_SIZE = 30  # Сколько последних инвентаризаций показывать кнопками
+MESSAGE_TEXT_LIMIT = 3500  # Запас до лимита Telegram в 4096 символов
 
-        # Создаем клавиатуру с кнопками для каждого листа
-        keyboard = []
-        for i, sheet in enumerate(sheets):
-            sheet_title = sheet['properties']['title']
-            if sheet_title.startswith('Инвентаризация_'):
-                date_str = sheet_title.split('_')[1]
-                button = InlineKeyboardButton(
-                    f"📋 {date_str}",
-                    callback_data=f"h{i}"
-                )
-                keyboard.append([button])
-
-        # Добавляем кнопку "Начать новую"
-        keyboard.append([InlineKeyboardButton("Начать новую", callback_data="new_inventory")])
-
-        # Сохраняем mapping для callback
-        context.bot_data['sheet_mapping'] = {
-            f"h{i}": sheet['properties']['title']
-            for i, sheet in enumerate(sheets)
-        }
-        context.bot_data['current_spreadsheet_id'] = spreadsheet['id']
+async def show_history_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показать меню истории инвентаризаций: выбор склада"""
+    keyboard = [
+        [InlineKeyboardButton(f"🏭 {warehouse}", callback_data=f"hist_wh_{i}")]
+        for i, warehouse in enumerate(WAREHOUSES)
+    ]
+    await update.message.reply_text(
+        "📊 История инвентаризаций. Выберите склад:",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
 
-        await update.message.reply_text(
-            f"📊 История инвентаризаций для склада {warehouse_name}:",
-            reply_markup=InlineKeyboardMarkup(keyboard)
-        )
+def load_warehouse_history(warehouse_name):
+    """Инвентаризации склада из рабочей таблицы и архивов (блокирующий вызов)"""
+    return list_inventories(get_google_sheets_service(), get_drive_service(), warehouse_name)
 
+async def show_warehouse_history(update: Update, context: ContextTypes.DEFAULT_TYPE, warehouse_index):
+    """Показать список инвентаризаций склада"""
+    query = update.callback_query
+    warehouse_name = WAREHOUSES[warehouse_index]
+    await query.answer()
+    await query.message.edit_text(f"⏳ Загружаем историю склада {warehouse_name}…")
+    
+    try:
+        entries = await asyncio.to_thread(load_warehouse_history, warehouse_name)
     except Exception as e:
-        logging.error(f"Error in show_history_menu: {str(e)}")
-        await update.message.reply_text(
+        logging.error("Error in show_warehouse_history: %s", e)
+        await query.message.edit_text(
             "Произошла ошибка при получении истории инвентаризаций. Пожалуйста, попробуйте позже."
         )
+        return
+    
+    if not entries:
+        await query.message.edit_text(
+            f"История инвентаризаций склада {warehouse_name} пуста.",
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("Начать новую", callback_data="new_inventory")]])
+        )
+        return
+    
+    # Сохраняем выбор для обработки следующих нажатий
+    context.user_data['history'] = {
+        'warehouse_index': warehouse_index,
+        'warehouse': warehouse_name,
+        # Инвентаризация может лежать в рабочей таблице или в архиве
+        'spreadsheets': [spreadsheet_id for spreadsheet_id, _ in entries],
+        'titles': [title for _, title in entries]
+    }
+    titles = context.user_data['history']['titles']
+    
+    keyboard = []
+    for i, title in enumerate(titles[:HISTORY_PAGE_SIZE]):
+        date, number = parse_inventory_title(title)
+        formatted_date = datetime.strptime(date, '%Y-%m-%d').strftime('%d.%m.%Y')
+        keyboard.append([InlineKeyboardButton(f"📋 {formatted_date} №{number}", callback_data=f"hist_{i}")])
+    keyboard.append([
+        InlineKeyboardButton("📎 Экспорт всех CSV", callback_data="export_all_csv"),
+        InlineKeyboardButton("📎 XLSX", callback_data="export_all_xlsx")
+    ])
+    keyboard.append([InlineKeyboardButton("Начать новую", callback_data="new_inventory")])
+    
+    await query.message.edit_text(
+        f"📊 История инвентаризаций для склада {warehouse_name} (всего {len(titles)}):",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
 
 async def show_inventory_details(update: Update, context: ContextTypes.DEFAULT_TYPE, spreadsheet_id, sheet_title):
     """Показать детали инвентаризации"""
-    sheets_service = get_google_sheets_service()
+    query = update.callback_query
+    history = context.user_data['history']
+    back_button = InlineKeyboardButton("⬅️ Назад", callback_data=f"hist_wh_{history['warehouse_index']}")
+    await query.answer()
+    await query.message.edit_text(f"⏳ Загружаем {sheet_title}…")
     
-    # Получаем данные с листа
-    result = sheets_service.spreadsheets().values().get(
-        spreadsheetId=spreadsheet_id,
-        range=f"{sheet_title}!A1:C50"
-    ).execute()
+    # Получаем данные с листа или из журнала склада
+    def load_values():
+        service = get_google_sheets_service()
+        values = read_inventory_values(service, spreadsheet_id, [sheet_title], value_render_option='FORMATTED_VALUE')[0]
+        return values, is_ledger_inventory(service, spreadsheet_id, sheet_title)
     
-    values = result.get('values', [])
+    try:
+        values, in_ledger = await asyncio.to_thread(load_values)
+    except Exception as e:
+        logging.error("Error in show_inventory_details: %s", e)
+        await query.message.edit_text(
+            "Произошла ошибка при получении данных инвентаризации. Пожалуйста, попробуйте позже.",
+            reply_markup=InlineKeyboardMarkup([[back_button]])
+        )
+        return
     if not values:
-        await update.message.reply_text(
+        await query.message.edit_text(
             "Данные не найдены.",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад", callback_data="view_history")]])
+            reply_markup=InlineKeyboardMarkup([[back_button]])
         )
         return
     
@@ -419,12 +549,11 @@ async def show_inventory_details(update: Update, context: ContextTypes.DEFAULT_T
     message_parts = []
     
     # Добавляем заголовок
-    try:
-        date_str = sheet_title.split('_')[1]
-        date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-        formatted_date = date_obj.strftime('%d.%m.%Y')
+    parsed = parse_inventory_title(sheet_title)
+    if parsed:
+        formatted_date = datetime.strptime(parsed[0], '%Y-%m-%d').strftime('%d.%m.%Y')
         message_parts.append(f"📊 Инвентаризация от {formatted_date}\n")
-    except (IndexError, ValueError):
+    else:
         message_parts.append("📊 Инвентаризация\n")
     
     # Добавляем информацию о складе и ответственном лице
@@ -432,62 +561,343 @@ async def show_inventory_details(update: Update, context: ContextTypes.DEFAULT_T
     responsible_person = values[1][0] if len(values) > 1 and len(values[1]) > 0 else "Не указан"
     phone = values[2][0] if len(values) > 2 and len(values[2]) > 0 else "Не указан"
     
-    message_parts.append(f"🏭 Склад: {warehouse_info}")
-    message_parts.append(f"👤 Ответственное лицо: {responsible_person}")
-    message_parts.append(f"📱 Телефон: {phone}\n")
+    message_parts.append(f"🏭 {warehouse_info}")
+    message_parts.append(f"👤 {responsible_person}")
+    message_parts.append(f"📱 {phone}\n")
     
     # Добавляем заголовок таблицы
     message_parts.append("📝 Результаты инвентаризации:")
     message_parts.append("№  |  Продукт  |  Количество")
     message_parts.append("-" * 40)
     
-    # Добавляем данные о продуктах
-    for i, row in enumerate(values[5:], 1):  # Пропускаем первые 5 строк (заголовки)
-        if len(row) >= 2:
-            product = row[1] if len(row) > 1 else ""
-            quantity = row[2] if len(row) > 2 else ""
-            message_parts.append(f"{i}. {product}: {quantity}")
+    # Добавляем данные о продуктах, пока сообщение помещается в лимит Telegram
+    length = sum(len(part) + 1 for part in message_parts)
+    rows = [row for row in values[6:] if len(row) >= 2]
+    for i, row in enumerate(rows, 1):
+        quantity = row[2] if len(row) > 2 else ""
+        unit = row[3] if len(row) > 3 else ""
+        line = f"{row[0]}. {row[1]}: {quantity} {unit}".rstrip()
+        if length + len(line) > MESSAGE_TEXT_LIMIT:
+            message_parts.append(f"… и еще {len(rows) - i + 1} позиций, полный список — в экспорте")
+            break
+        message_parts.append(line)
+        length += len(line) + 1
     
     # Объединяем все части сообщения
     message = "\n".join(message_parts)
     
-    # Добавляем кнопку "Назад"
-    keyboard = [[InlineKeyboardButton("⬅️ Назад", callback_data="view_history")]]
+    index = history['titles'].index(sheet_title)
+    keyboard = [
+        [
+            InlineKeyboardButton("📎 Экспорт CSV", callback_data=f"export_csv_{index}"),
+            InlineKeyboardButton("📎 XLSX", callback_data=f"export_xlsx_{index}")
+        ],
+        [InlineKeyboardButton("✏️ Редактировать", callback_data=f"hist_edit_{index}")],
+        [back_button]
+    ]
+    if in_ledger:
+        # Инвентаризация из журнала оформляется отдельным листом только по запросу
+        keyboard.insert(1, [InlineKeyboardButton("📄 Оформить в таблице", callback_data=f"hist_view_{index}")])
     
-    await update.message.reply_text(
+    await query.message.edit_text(
         message,
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
 
-async def start_edit_inventory(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Начало редактирования инвентаризации"""
+async def show_ledger_view(update: Update, context: ContextTypes.DEFAULT_TYPE, index):
+    """Оформить инвентаризацию из журнала на листе «Просмотр» и прислать ссылку"""
+    query = update.callback_query
+    history = context.user_data.get('history')
+    if not history:
+        await query.answer("Выберите склад в /history")
+        return
+    await query.answer("📄 Оформляем лист…")
+    
+    spreadsheet_id = history['spreadsheets'][index]
+    sheet_title = history['titles'][index]
+    try:
+        sheet_id = await asyncio.to_thread(build_ledger_view, get_google_sheets_service(), spreadsheet_id, sheet_title)
+    except Exception as e:
+        logging.error("Error building ledger view: %s", e)
+        sheet_id = None
+    if sheet_id is None:
+        await query.message.reply_text("❌ Не удалось оформить лист. Пожалуйста, попробуйте позже.")
+        return
+    await query.message.reply_text(
+        f"📄 {sheet_title}: https://docs.google.com/spreadsheets/d/{spreadsheet_id}/edit#gid={sheet_id}"
+    )
+
+async def send_export(context: ContextTypes.DEFAULT_TYPE, chat_id, export_format, file_name, sources):
+    """Собрать файл экспорта в фоне и отправить его документом"""
+    try:
+        output, count = await asyncio.to_thread(build_export, export_format, sources)
+    except Exception as e:
+        logging.error("Error building export: %s", e)
+        await context.bot.send_message(chat_id=chat_id, text="❌ Не удалось подготовить экспорт. Пожалуйста, попробуйте позже.")
+        return
+    
+    with output:
+        if not count:
+            await context.bot.send_message(chat_id=chat_id, text="Нет данных для экспорта.")
+            return
+        await context.bot.send_document(
+            chat_id=chat_id,
+            document=output,
+            filename=f"{file_name}.{export_format}",
+            caption=f"📎 Экспорт: {count} строк"
+        )
+
+async def handle_history_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Экспорт одной или всех инвентаризаций выбранного склада"""
+    query = update.callback_query
+    history = context.user_data.get('history')
+    if not history:
+        await query.answer("Выберите склад в /history")
+        return
+    
+    _, export_format, target = query.data.split('_')
+    entries = list(zip(history['spreadsheets'], history['titles']))
+    if target != 'all':
+        entries = [entries[int(target)]]
+    await query.answer("📎 Готовим файл…")
+    
+    file_name = history['warehouse'] if target == 'all' else entries[0][1]
+    sources = [iter_warehouse_rows(get_google_sheets_service(), history['warehouse'], entries)]
+    await send_export(context, query.message.chat_id, export_format, file_name, sources)
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Экспорт инвентаризаций всех складов за период: /export ГГГГ-ММ [ГГГГ-ММ] [csv|xlsx]"""
+    args = context.args or []
+    export_format = 'csv'
+    months = []
+    for arg in args:
+        if arg.lower() in EXPORT_FORMATS:
+            export_format = arg.lower()
+        else:
+            try:
+                months.append(datetime.strptime(arg, '%Y-%m').strftime('%Y-%m'))
+            except ValueError:
+                await update.message.reply_text("Использование: /export ГГГГ-ММ [ГГГГ-ММ] [csv|xlsx]")
+                return
+    if not months:
+        months = [datetime.now().strftime('%Y-%m')]
+    first_month, last_month = min(months), max(months)
+    
+    def warehouse_sources():
+        """Строки всех складов; таблицы читаются по очереди, по мере записи файла"""
+        sheets_service = get_google_sheets_service()
+        drive_service = get_drive_service()
+        for warehouse in WAREHOUSES:
+            entries = [
+                (spreadsheet_id, title)
+                for spreadsheet_id, title in list_inventories(sheets_service, drive_service, warehouse)
+                if first_month <= parse_inventory_title(title)[0][:7] <= last_month
+            ]
+            if entries:
+                yield iter_warehouse_rows(sheets_service, warehouse, entries[::-1])
+    
+    await update.message.reply_text(f"📎 Готовим экспорт за {first_month} — {last_month}…")
+    start_user_task(context, update.effective_user.id, 'export', send_export(
+        context,
+        update.message.chat_id,
+        export_format,
+        f"Инвентаризации {first_month}_{last_month}",
+        warehouse_sources()
+    ), replace=False)
+
+REPORT_PRODUCTS_LIMIT = 20  # Сколько найденных товаров показывать в сообщении
+
+async def report_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Сводные остатки по всем складам: /report [часть названия товара]"""
+    text = " ".join(context.args or []).strip()
+    status_message = await update.message.reply_text("📦 Собираем остатки по складам…")
+    start_user_task(context, update.effective_user.id, 'report', send_report(update, context, status_message, text))
+
+async def send_report(update: Update, context: ContextTypes.DEFAULT_TYPE, status_message, text):
+    """Собрать сводный отчет, показывая ход чтения складов, и отправить результат"""
+    try:
+        async with Progress(status_message) as progress:
+            report = await build_report(progress.stage)
+    except Exception as e:
+        logging.error("Error building report: %s", e)
+        await status_message.edit_text("❌ Не удалось собрать отчет. Пожалуйста, попробуйте позже.")
+        return
+    
+    message_parts = report_summary(report)
+    
+    if not text:
+        message_parts.append("\nПоиск по товару: /report <часть названия>")
+        await status_message.edit_text("\n".join(message_parts))
+        output, count = await asyncio.to_thread(write_report_csv, report)
+        with output:
+            await context.bot.send_document(
+                chat_id=update.message.chat_id,
+                document=output,
+                filename=f"Остатки {datetime.now().strftime('%Y-%m-%d')}.csv",
+                caption=f"📎 Сводный отчет: {count} товаров"
+            )
+        return
+    
+    product_ids = find_report_products(report, text)
+    if not product_ids:
+        message_parts.append(f"\nТовары «{text}» в инвентаризациях не найдены.")
+    catalog = report['catalog']
+    length = sum(len(part) + 1 for part in message_parts)
+    for product_id in product_ids[:REPORT_PRODUCTS_LIMIT]:
+        product = catalog.products[product_id]
+        lines = [f"\n📦 {product.display}: {format_quantity(report['totals'][product_id])} (складов: {report['counted'][product_id]})"]
+        for warehouse, entry in report['stocks'].items():
+            quantity = entry['quantities'][product_id]
+            if quantity == quantity:
+                lines.append(f"  🏭 {warehouse}: {format_quantity(quantity)} ({entry['date']})")
+        block = "\n".join(lines)
+        if length + len(block) > MESSAGE_TEXT_LIMIT:
+            break
+        message_parts.append(block)
+        length += len(block) + 1
+    if len(product_ids) > REPORT_PRODUCTS_LIMIT:
+        message_parts.append(f"\n… найдено товаров: {len(product_ids)}, уточните запрос")
+    
+    await status_message.edit_text("\n".join(message_parts))
+
+FORECAST_ROWS_LIMIT = 30  # Сколько товаров склада показывать в прогнозе
+
+async def forecast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Прогноз запасов: /forecast — список к заказу, /forecast <часть названия склада> — прогноз склада"""
+    text = " ".join(context.args or []).strip().lower()
+    try:
+        forecast = await build_forecast()
+    except Exception as e:
+        logging.error("Error building forecast: %s", e)
+        await update.message.reply_text("❌ Не удалось рассчитать прогноз. Пожалуйста, попробуйте позже.")
+        return
+    
+    if not text:
+        await update.message.reply_text(format_reorder_list(reorder_list(forecast)))
+        return
+    
+    warehouses = [warehouse for warehouse in WAREHOUSES if text in warehouse.lower()]
+    if len(warehouses) != 1:
+        matches = "\n".join(f"🏭 {warehouse}" for warehouse in warehouses[:20])
+        await update.message.reply_text(
+            f"Уточните склад:\n{matches}" if warehouses else "Склад не найден."
+        )
+        return
+    
+    warehouse = warehouses[0]
+    rows = warehouse_forecast(forecast, warehouse)
+    if not rows:
+        await update.message.reply_text(
+            f"Для склада {warehouse} нужно минимум две инвентаризации в истории."
+        )
+        return
+    
+    message_parts = [
+        f"📈 Прогноз запасов: {warehouse}",
+        f"Последняя инвентаризация: {forecast['warehouses'][warehouse]['last_date']}",
+        "Продукт | остаток | расход в день | дней запаса",
+        "-" * 40
+    ]
+    for name, unit, remaining, rate, days_left in rows[:FORECAST_ROWS_LIMIT]:
+        title = f"{name} [{unit}]" if unit else name
+        days_text = "∞" if days_left == float('inf') else f"{days_left:.0f}"
+        message_parts.append(f"{title} | {remaining:.1f} | {rate:.2f} | {days_text}")
+    if len(rows) > FORECAST_ROWS_LIMIT:
+        message_parts.append(f"… и еще {len(rows) - FORECAST_ROWS_LIMIT}")
+    await update.message.reply_text("\n".join(message_parts))
+
+async def start_edit_inventory(update: Update, context: ContextTypes.DEFAULT_TYPE, index):
+    """Загрузить сохраненную инвентаризацию в сессию для исправления количеств"""
     query = update.callback_query
     user_id = query.from_user.id
-    sheet_title = query.data.split('_')[1]
+    history = context.user_data['history']
+    spreadsheet_id = history['spreadsheets'][index]
+    sheet_title = history['titles'][index]
+    back_button = InlineKeyboardButton("⬅️ Назад", callback_data=f"hist_{index}")
+    await query.answer()
+    await query.message.edit_text(f"⏳ Загружаем {sheet_title} для редактирования…")
     
-    service = get_google_sheets_service()
-    result = service.spreadsheets().values().get(
-        spreadsheetId=SPREADSHEET_ID,
-        range=f"{sheet_title}!A1:E"
-    ).execute()
+    def load_values():
+        service = get_google_sheets_service()
+        values = read_inventory_values(service, spreadsheet_id, [sheet_title])[0]
+        return values, is_ledger_inventory(service, spreadsheet_id, sheet_title)
     
-    values = result.get('values', [])
-    if not values:
-        await query.edit_message_text("Данные не найдены.")
+    try:
+        values, in_ledger = await asyncio.to_thread(load_values)
+    except Exception as e:
+        logging.error("Error in start_edit_inventory: %s", e)
+        await query.message.edit_text(
+            "Произошла ошибка при получении данных инвентаризации. Пожалуйста, попробуйте позже.",
+            reply_markup=InlineKeyboardMarkup([[back_button]])
+        )
+        return
+    if len(values) <= INVENTORY_HEADER_ROWS:
+        await query.message.edit_text("Данные не найдены.", reply_markup=InlineKeyboardMarkup([[back_button]]))
         return
     
-    user_data[user_id]['editing_sheet'] = sheet_title
-    user_data[user_id]['inventory_data'] = {}
+    session = await new_session(user_id)
+    catalog = session['catalog']
+    # Строки листа: № | Продукт | Количество | Единица; товар ищется по названию и единице
+    rows = {}
+    original = {}
+    extra = []
+    for row_number, row in enumerate(values[INVENTORY_HEADER_ROWS:], INVENTORY_HEADER_ROWS + 1):
+        if len(row) < 2 or row[1] == "":
+            continue
+        product_name = str(row[1])
+        quantity = row[2] if len(row) > 2 and isinstance(row[2], (int, float)) else None
+        unit = str(row[3]) if len(row) > 3 else ""
+        product_id = catalog.find_product(product_name, unit)
+        if product_id is None or catalog.products[product_id].display in rows:
+            # Товара нет в каталоге (или он повторяется): строка остается на листе без изменений
+            if quantity is not None:
+                extra.append([product_name, quantity, unit])
+            continue
+        display = catalog.products[product_id].display
+        rows[display] = row_number
+        if quantity is not None:
+            original[display] = float(quantity)
+            session['quantities'][product_id] = float(quantity)
     
-    # Пропускаем заголовки
-    for row in values[5:]:
-        if len(row) >= 2:
-            user_data[user_id]['inventory_data'][row[0]] = row[1]
+    warehouse = history['warehouse']
+    # Шапка листа: «Материально ответственное лицо: …», «Телефон: …»
+    name, phone = (row[0].split(': ', 1)[-1] if row else "" for row in values[1:3])
+    parsed = parse_inventory_title(sheet_title)
+    session.update({
+        'warehouse': warehouse,
+        'warehouse_index': history['warehouse_index'],
+        'name': name,
+        'phone': phone,
+        'date': parsed[0] if parsed else datetime.now().strftime("%Y-%m-%d"),
+        'step': 'selecting_category',
+        'category_path': [],
+        'editing': {
+            'spreadsheet_id': spreadsheet_id,
+            'sheet_title': sheet_title,
+            'ledger': in_ledger,
+            'rows': rows,
+            'original': original,
+            'extra': extra,
+            'next_row': len(values) + 1
+        }
+    })
+    user_data[user_id] = session
+    # Журнал сессии должен восстановить и исправление, и исходные количества
+    log_meta(
+        session['session_id'], user_id, warehouse=warehouse, warehouse_index=session['warehouse_index'],
+        name=name, phone=phone, date=session['date'], editing=session['editing']
+    )
+    for product, quantity in iter_quantities(catalog, session['quantities']):
+        log_quantity(session['session_id'], user_id, product.display, quantity)
+    bind(warehouse=warehouse)
     
-    await query.edit_message_text(
-        "Выберите категорию продукта для редактирования:",
+    message = await query.message.edit_text(
+        f"✏️ Редактирование: {sheet_title}\n🏭 {warehouse}\n"
+        f"Исправьте количества и нажмите «Завершить инвентаризацию»: сохранятся только измененные товары.\n\n"
+        f"Выберите категорию продукта:",
         reply_markup=get_product_category_keyboard(user_id)
     )
+    session['last_category_message_id'] = message.message_id
 
 async def handle_warehouse_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка выбора склада"""
@@ -523,6 +933,8 @@ async def handle_warehouse_confirmation(update: Update, context: ContextTypes.DE
     
     user_data[user_id]['warehouse'] = original_warehouse
     user_data[user_id]['warehouse_index'] = warehouse_index  # Сохраняем индекс для кнопки "Назад"
+    user_data[user_id]['full_catalog'] = False
+    log_meta(user_data[user_id]['session_id'], user_id, warehouse=original_warehouse, warehouse_index=warehouse_index)
     user_data[user_id]['step'] = 'product_category'
     
     # Отправляем сообщение с категориями и сохраняем его ID
@@ -532,6 +944,46 @@ async def handle_warehouse_confirmation(update: Update, context: ContextTypes.DE
     )
     user_data[user_id]['last_category_message_id'] = message.message_id
 
+def delete_message_later(context, chat_id, message_id):
+    """Удалить сообщение в фоне: результат удаления не влияет на работу пользователя"""
+    async def delete():
+        try:
+            await context.bot.delete_message(chat_id=chat_id, message_id=message_id)
+        except Exception as e:
+            logging.warning("Error deleting message %s: %s", message_id, e)
+    
+    context.application.create_task(delete())
+
+async def update_anchor_message(context, user_id, chat_id, text, reply_markup):
+    """Обновить закрепленное сообщение сессии; если его нельзя изменить, отправить новое"""
+    session = user_data[user_id]
+    message_id = session.get('last_category_message_id')
+    if message_id:
+        try:
+            await context.bot.edit_message_text(
+                text,
+                chat_id=chat_id,
+                message_id=message_id,
+                reply_markup=reply_markup
+            )
+            return
+        except BadRequest as e:
+            if 'not modified' in str(e):
+                return
+            logging.warning("Error editing anchor message: %s", e)
+    
+    message = await context.bot.send_message(chat_id=chat_id, text=text, reply_markup=reply_markup)
+    session['last_category_message_id'] = message.message_id
+
+def get_quantity_keyboard(user_id, product_id):
+    """Клавиатура запроса количества"""
+    buttons = [InlineKeyboardButton("⬅️ Назад", callback_data="back_category")]
+    current_quantity = user_data[user_id]['quantities'][product_id]
+    if current_quantity == current_quantity:
+        # Количество уже введено: его можно исправить или удалить
+        buttons.insert(0, InlineKeyboardButton("🗑 Очистить", callback_data="clear_product"))
+    return InlineKeyboardMarkup([buttons])
+
 def get_warehouse_keyboard():
     """Создание клавиатуры со складами"""
     keyboard = []
@@ -543,112 +995,82 @@ def get_warehouse_keyboard():
     keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="new_inventory")])
     return InlineKeyboardMarkup(keyboard)
 
+CATEGORY_EMOJIS = {
+    "Фрукты": "🍎",
+    "Овощи": "🥕",
+    "Мясо и мясные продукты": "🥩",
+    "Молочные продукты": "🥛",
+    "Крупы и бобовые": "🫛",
+    "Мука и выпечка": "🍞",
+    "Консервы": "🥫",
+    "Напитки": "🥤",
+    "Специи и приправы": "🧂",
+    "Сладости и сухофрукты": "🍬",
+    "Орехи семена": "🥜",
+    "Бакалея": "🧈",
+    "Магазин/Буфет": "🏪"
+}
+
 def get_product_category_keyboard(user_id):
     """Создание клавиатуры с категориями продуктов"""
-    keyboard = []
-    
     # Получаем текущий путь категории из user_data
-    current_category_path = user_data.get(user_id, {}).get('category_path', [])
+    session = user_data.get(user_id, {})
+    current_category_path = session.get('category_path', [])
+    catalog = get_user_catalog(user_id)
     
+    # Кнопка переключения профиля склада нужна только в корне и только если профиль что-то скрывает
+    toggle = None
     if not current_category_path:
+        if session.get('full_catalog'):
+            toggle = 'profile'
+        elif getattr(catalog, 'filtered', False):
+            toggle = 'full'
+    
+    return build_category_keyboard(catalog, catalog.node_by_path[tuple(current_category_path)], toggle)
+
+@lru_cache(maxsize=4096)
+def build_category_keyboard(catalog, node_id, toggle=None):
+    """Клавиатура узла каталога; кэшируется по (версия каталога/профиль склада, узел)"""
+    keyboard = []
+    node = catalog.nodes[node_id]
+    
+    if not node['path']:
         # Показываем корневые категории
-        categories = list(PRODUCT_CATEGORIES.keys())
-        category_emojis = {
-            "Фрукты": "🍎",
-            "Овощи": "🥕",
-            "Мясо и мясные продукты": "🥩",
-            "Молочные продукты": "🥛",
-            "Крупы и бобовые": "🫛",
-            "Мука и выпечка": "🍞",
-            "Консервы": "🥫",
-            "Напитки": "🥤",
-            "Специи и приправы": "🧂",
-            "Сладости и сухофрукты": "🍬",
-            "Орехи семена": "🥜",
-            "Бакалея": "🧈",
-            "Магазин/Буфет": "🏪"
-        }
-        
-        for i, category in enumerate(categories):
-            emoji = category_emojis.get(category, "📦")
+        for i, child_id in enumerate(node['children']):
+            category = catalog.nodes[child_id]['name']
+            emoji = CATEGORY_EMOJIS.get(category, "📦")
             keyboard.append([InlineKeyboardButton(
                 f"{emoji} {category}",
                 callback_data=f"category_{i}"
             )])
+        if toggle == 'full':
+            keyboard.append([InlineKeyboardButton("📚 Показать весь каталог", callback_data="toggle_full_catalog")])
+        elif toggle == 'profile':
+            keyboard.append([InlineKeyboardButton("🏭 Только товары склада", callback_data="toggle_full_catalog")])
     else:
-        # Показываем подкатегории и товары текущей категории
-        current_category = PRODUCT_CATEGORIES
-        for path_item in current_category_path:
-            if isinstance(current_category, dict) and 'subcategories' in current_category:
-                current_category = current_category['subcategories'][path_item]
-            else:
-                current_category = current_category[path_item]
-        
         # Добавляем подкатегории
-        if isinstance(current_category, dict) and 'subcategories' in current_category:
-            for i, (subcat_name, _) in enumerate(current_category['subcategories'].items()):
-                keyboard.append([InlineKeyboardButton(
-                    f"📁 {subcat_name}",
-                    callback_data=f"subcat_{i}_{subcat_name}"
-                )])
+        for i, child_id in enumerate(node['children']):
+            keyboard.append([InlineKeyboardButton(
+                f"📁 {catalog.nodes[child_id]['name']}",
+                callback_data=f"subcat_{i}"
+            )])
         
         # Добавляем товары
-        items = current_category.get('items', []) if isinstance(current_category, dict) else current_category
-        for i, item in enumerate(items):
+        for i, product_id in enumerate(node['items']):
             keyboard.append([InlineKeyboardButton(
-                f"📦 {item}",
+                f"📦 {catalog.products[product_id].display}",
                 callback_data=f"product_{i}"
             )])
     
     # Добавляем кнопки навигации
     keyboard.append([InlineKeyboardButton("✅ Завершить инвентаризацию", callback_data="finish")])
-    if current_category_path:
+    if node['path']:
         keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="back_category")])
     else:
         keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="back_to_warehouse")])
     
     return InlineKeyboardMarkup(keyboard)
 
-async def handle_product_category_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработка выбора категории продукта"""
-    query = update.callback_query
-    user_id = query.from_user.id
-    category_index = int(query.data.split('_')[1])
-    
-    # Получаем оригинальное название категории по индексу
-    categories = list(PRODUCT_CATEGORIES.keys())
-    category = categories[category_index]
-    
-    user_data[user_id]['current_category'] = category
-    user_data[user_id]['step'] = 'product'
-    await query.edit_message_text("Выберите продукт:", reply_markup=get_product_keyboard(category))
-
-def get_product_keyboard(category):
-    """Создание клавиатуры с продуктами"""
-    keyboard = []
-    products = PRODUCT_CATEGORIES[category]
-    for i, product in enumerate(products):
-        keyboard.append([InlineKeyboardButton(
-            f"📦 {product}",
-            callback_data=f"product_{category}_{i}"
-        )])
-    keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="category")])
-    return InlineKeyboardMarkup(keyboard)
-
-async def handle_product_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработка выбора продукта"""
-    query = update.callback_query
-    user_id = query.from_user.id
-    _, category, product_index = query.data.split('_')
-    product_index = int(product_index)
-    
-    # Получаем оригинальное название продукта по индексу
-    product = PRODUCT_CATEGORIES[category][product_index]
-    
-    user_data[user_id]['current_product'] = product
-    user_data[user_id]['step'] = 'quantity'
-    await query.edit_message_text(f"Введите количество остатка для продукта {product}:")
-
 async def show_inventory_summary(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать итоги инвентаризации перед сохранением"""
     query = update.callback_query
@@ -673,6 +1095,11 @@ async def show_inventory_summary(update: Update, context: ContextTypes.DEFAULT_T
     message_parts.append(f"👤 Ответственное лицо: {user_data[user_id]['name']}")
     message_parts.append(f"📱 Телефон: {user_data[user_id]['phone']}")
     message_parts.append(f"📅 Дата: {user_data[user_id]['date']}")
+    if 'editing' in user_data[user_id]:
+        message_parts.append(
+            f"✏️ Исправление {user_data[user_id]['editing']['sheet_title']}: "
+            f"изменено товаров {len(editing_changes(user_data[user_id]))}"
+        )
     message_parts.append("=" * 40)
     
     # Добавляем заголовок таблицы
@@ -682,8 +1109,8 @@ async def show_inventory_summary(update: Update, context: ContextTypes.DEFAULT_T
     
     # Добавляем данные о продуктах
     counter = 1
-    for product, quantity in user_data[user_id]['inventory_data'].items():
-        message_parts.append(f"{counter}. {product} | {quantity}")
+    for product, quantity in iter_quantities(user_data[user_id]['catalog'], user_data[user_id]['quantities']):
+        message_parts.append(f"{counter}. {product.display} | {quantity}")
         counter += 1
     
     # Объединяем все части сообщения
@@ -697,117 +1124,145 @@ async def show_inventory_summary(update: Update, context: ContextTypes.DEFAULT_T
         ]
     ]
     
-    try:
-        # Удаляем сообщение с категориями
-        if 'category_message_id' in user_data[user_id]:
-            await context.bot.delete_message(
-                chat_id=query.message.chat_id,
-                message_id=user_data[user_id]['category_message_id']
-            )
-    except Exception as e:
-        logging.error(f"Error deleting category message: {str(e)}")
-    
-    # Отправляем новое сообщение с итогами и сохраняем его ID
-    summary_message = await query.message.reply_text(
+    # Показываем итоги в закрепленном сообщении сессии
+    summary_message = await query.message.edit_text(
         message,
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
     user_data[user_id]['summary_message_id'] = summary_message.message_id
-    
-    # Удаляем текущее сообщение
-    try:
-        await query.message.delete()
-    except Exception as e:
-        logging.error(f"Error deleting current message: {str(e)}")
+    user_data[user_id]['last_category_message_id'] = summary_message.message_id
     
     # Отвечаем на callback query, чтобы убрать "часики" на кнопке
     await query.answer()
 
+async def confirm_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Нажатие «Сохранить»: ответ сразу, сохранение — в фоновой задаче пользователя,
+    поэтому повторное нажатие во время сохранения тоже получает ответ сразу"""
+    query = update.callback_query
+    session = user_data.get(query.from_user.id)
+    if session is None or 'warehouse' not in session:
+        # Кнопка из старого сообщения: сессия завершена, закрыта по сроку или потеряна при перезапуске
+        await query.answer("Сессия не найдена, начните новую инвентаризацию")
+        return
+    if session.get('save_state') == 'saving':
+        await query.answer("⏳ Сохранение уже выполняется")
+        return
+    if session.get('save_state') == 'saved':
+        await query.answer("✅ Инвентаризация уже сохранена")
+        return
+    session['save_state'] = 'saving'
+    await query.answer("⏳ Сохраняем…")
+    
+    async def save():
+        try:
+            await finish_inventory(update, context)
+        finally:
+            if session.get('save_state') == 'saving':
+                del session['save_state']
+    start_user_task(context, query.from_user.id, 'save', save(), replace=False)
+
 async def finish_inventory(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Завершение инвентаризации и сохранение данных"""
     query = update.callback_query
     user_id = query.from_user.id
     
-    sheets_service = get_google_sheets_service()
-    drive_service = get_drive_service()
+    record = build_record(user_id, query.message.chat_id, user_data[user_id])
+    # Кнопки убираем сразу: ход сохранения показывается в том же сообщении
+    status_message = await query.message.edit_text("⏳ Сохраняем инвентаризацию…")
     
-    # Получаем или создаем таблицу для склада
-    spreadsheet_id = get_or_create_spreadsheet(
-        sheets_service,
-        drive_service,
-        user_data[user_id]['warehouse']
-    )
+    success = False
+    saved_offline = False
+    error = None
+    if is_google_available():
+        try:
+            # Сохранение выполняем в отдельном потоке, чтобы не блокировать бота
+            async with Progress(status_message) as progress:
+                success = await asyncio.to_thread(push_record, record, progress.stage)
+        except Exception as e:
+            logging.error("Error saving inventory to Google Sheets: %s", e)
+            if is_transport_error(e):
+                mark_google_unavailable()
+            else:
+                # Ошибку в данных или правах доступа повтор в фоне не исправит: показываем ее пользователю
+                error = e
     
-    if 'editing_sheet' in user_data[user_id]:
-        # Редактируем существующую инвентаризацию
-        sheet_title = user_data[user_id]['editing_sheet']
-        success = save_inventory_data(
-            sheets_service,
-            spreadsheet_id,
-            user_data[user_id]['warehouse'],
-            user_data[user_id]['date'],
-            user_data[user_id]['name'],
-            user_data[user_id]['phone'],
-            user_data[user_id]['inventory_data']
-        )
-    else:
-        # Создаем новую инвентаризацию
-        success = create_new_sheet(
-            sheets_service,
-            spreadsheet_id,
-            user_data[user_id]['warehouse'],
-            user_data[user_id]['date']
-        )
-        if success:
-            success = save_inventory_data(
-                sheets_service,
-                spreadsheet_id,
+    if not success and error is None:
+        # Google недоступен: сохраняем локально, отправит фоновая синхронизация
+        try:
+            save_pending(record)
+            success = saved_offline = True
+        except Exception as e:
+            logging.error("Error saving inventory locally: %s", e)
+    
+    if success:
+        user_data[user_id]['save_state'] = 'saved'
+        # Пополняем обученный профиль склада товарами из этой инвентаризации
+        try:
+            await asyncio.to_thread(
+                record_learned_items,
                 user_data[user_id]['warehouse'],
-                user_data[user_id]['date'],
-                user_data[user_id]['name'],
-                user_data[user_id]['phone'],
-                user_data[user_id]['inventory_data']
+                [product.display for product, _ in iter_quantities(user_data[user_id]['catalog'], user_data[user_id]['quantities'])]
+            )
+        except Exception as e:
+            logging.error("Error updating learned profile: %s", e)
+        
+        # Сессия завершена: журнал уходит в архив аудита
+        try:
+            await asyncio.to_thread(
+                close_session,
+                user_data[user_id]['session_id'],
+                user_id,
+                'saved_offline' if saved_offline else 'saved'
             )
+            del user_data[user_id]['session_id']
+        except Exception as e:
+            logging.error("Error closing journal session: %s", e)
     
     if success:
         # Формируем сообщение с итогами
         message_parts = []
         message_parts.append("📊 Итоги инвентаризации")
+        if saved_offline:
+            message_parts.append(
+                "💾 Нет связи с Google. Данные сохранены на сервере бота и будут "
+                "отправлены в Google Sheets автоматически, мы сообщим об этом."
+            )
         message_parts.append("=" * 40)
         message_parts.append(f"🏭 Склад: {user_data[user_id]['warehouse']}")
         message_parts.append(f"👤 Ответственное лицо: {user_data[user_id]['name']}")
         message_parts.append(f"📱 Телефон: {user_data[user_id]['phone']}")
         message_parts.append(f"📅 Дата: {user_data[user_id]['date']}")
+        if 'editing' in record:
+            message_parts.append(f"✏️ Исправлено товаров: {len(record['changes'])}" if record['changes'] else "✏️ Изменений нет")
+        if record.get('variance'):
+            message_parts.append("=" * 40)
+            message_parts.extend(format_variance(record['variance']))
         message_parts.append("=" * 40)
         message_parts.append("📝 Результаты инвентаризации:")
         message_parts.append("№  |  Продукт  |  Количество")
         message_parts.append("-" * 40)
         
         counter = 1
-        for product, quantity in user_data[user_id]['inventory_data'].items():
-            message_parts.append(f"{counter}. {product} | {quantity}")
+        for product, quantity in iter_quantities(user_data[user_id]['catalog'], user_data[user_id]['quantities']):
+            message_parts.append(f"{counter}. {product.display} | {quantity}")
             counter += 1
         
         message = "\n".join(message_parts)
         
-        try:
-            # Удаляем сообщение с итогами и кнопками подтверждения
-            if 'summary_message_id' in user_data[user_id]:
-                await context.bot.delete_message(
-                    chat_id=query.message.chat_id,
-                    message_id=user_data[user_id]['summary_message_id']
-                )
-        except Exception as e:
-            logging.error(f"Error deleting summary message: {str(e)}")
-        
-        # Отправляем итоговое сообщение как постоянное сообщение в чат
-        await query.message.reply_text(
+        # Заменяем сообщение о ходе сохранения постоянным итоговым сообщением
+        await query.message.edit_text(
             message,
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("📝 Начать новую", callback_data="new_inventory")]])
         )
-        
-        # Отвечаем на callback query
-        await query.answer("✅ Инвентаризация успешно завершена!")
+    elif error is not None:
+        # Сессия остается: после исправления причины сохранение можно повторить
+        await query.edit_message_text(
+            f"❌ Google Sheets не принял инвентаризацию: {describe_error(error)}",
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("🔄 Повторить", callback_data="confirm_save")],
+                [InlineKeyboardButton("📝 Начать новую", callback_data="new_inventory")]
+            ])
+        )
     else:
         await query.edit_message_text(
             "❌ Произошла ошибка при сохранении данных. Пожалуйста, попробуйте снова.",
@@ -819,10 +1274,7 @@ async def start_new_inventory(update: Update, context: ContextTypes.DEFAULT_TYPE
     query = update.callback_query
     user_id = query.from_user.id
     
-    user_data[user_id] = {
-        'step': 'phone',
-        'inventory_data': {}
-    }
+    user_data[user_id] = await new_session(user_id)
     
     keyboard = [[KeyboardButton("Поделиться номером", request_contact=True)]]
     reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True)
@@ -839,9 +1291,10 @@ async def show_products(update: Update, context: ContextTypes.DEFAULT_TYPE):
     category = user_data[user_id]['current_category']
     
     keyboard = []
-    for i, product in enumerate(PRODUCT_CATEGORIES[category]):
+    catalog = get_user_catalog(user_id)
+    for i, product_id in enumerate(catalog.get_node([category])['items']):
         keyboard.append([InlineKeyboardButton(
-            f"📦 {product}",
+            f"📦 {catalog.products[product_id].display}",
             callback_data=f"product_{i}"
         )])
     keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="back_to_categories")])
@@ -851,25 +1304,179 @@ async def show_products(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
 
-def main():
-    """Запуск бота"""
-    # Перемещаем существующие файлы в папку при запуске
-    try:
-        drive_service = get_drive_service()
-        move_existing_files_to_folder(drive_service)
-    except Exception as e:
-        logging.error(f"Error moving existing files: {str(e)}")
+async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Служебная статистика работы бота для администраторов"""
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    
+    message_parts = ["📈 Статистика бота"]
+    rate_limiter = context.bot.rate_limiter
+    if isinstance(rate_limiter, SendScheduler):
+        message_parts.append("\n📨 Отправка в Telegram:")
+        for key, value in rate_limiter.get_metrics().items():
+            message_parts.append(f"{key}: {value}")
+    message_parts.append("\n🗂 Кэш метаданных таблиц:")
+    for key, value in get_sheet_index_metrics().items():
+        message_parts.append(f"{key}: {value}")
+    if WARMUP_ON_START:
+        message_parts.append("\n🔥 Прогрев таблиц: " + ", ".join(f"{key} {value}" for key, value in get_warmup_status().items()))
+    for name, metrics in get_job_metrics().items():
+        message_parts.append(f"\n⏱ Задача {name}: " + ", ".join(f"{key} {value}" for key, value in metrics.items()))
+    for name, stats in get_cache_stats().items():
+        message_parts.append(f"\n🗃 Кэш {name}: " + ", ".join(f"{key} {value}" for key, value in stats.items()))
+    
+    await update.message.reply_text("\n".join(message_parts))
+
+async def on_startup(application: Application):
+    """Запуск фоновых задач после инициализации бота"""
+    # Восстанавливаем незавершенные инвентаризации из журнала
+    for user_id in restore_sessions():
+        session = user_data[user_id]
+        if session['step'] != 'selecting_category':
+            continue
+        try:
+            message = await application.bot.send_message(
+                chat_id=user_id,
+                text=f"♻️ Бот был перезапущен. Инвентаризация склада {session['warehouse']} восстановлена.\n\nВыберите категорию продукта:",
+                reply_markup=get_product_category_keyboard(user_id)
+            )
+            session['last_category_message_id'] = message.message_id
+        except Exception as e:
+            logging.error("Error notifying user %s about restored session: %s", user_id, e)
     
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    # Групповая запись журнала ввода количеств
+    background_tasks['journal'] = asyncio.create_task(run_journal_flusher())
+    # Отслеживание изменений файла каталога товаров
+    background_tasks['catalog'] = asyncio.create_task(watch_catalog())
+    # Прогрев таблиц складов, пока бот уже отвечает; создает недостающие таблицы только первый процесс
+    if WARMUP_ON_START:
+        background_tasks['warmup'] = asyncio.create_task(run_warmup(create=worker['index'] == 0))
+    # Периодические задачи обслуживания в JobQueue; сессии у каждого процесса свои
+    jobs = application.job_queue
+    schedule_repeating(jobs, 'session_eviction', evict_stale_sessions, SESSION_EVICT_INTERVAL)
+    # Заблаговременный поиск папки и таблиц в Drive: найденные id у каждого процесса свои
+    schedule_repeating(jobs, 'lookup_refresh', refresh_lookups_job, CACHE_REFRESH_INTERVAL)
+    # Общие фоновые задачи выполняет только первый процесс
+    if worker['index'] != 0:
+        return
+    # Заблаговременное обновление кэшей отчета: в остальных процессах кэши загружаются по запросу
+    schedule_repeating(jobs, 'cache_refresh', refresh_caches_job, CACHE_REFRESH_INTERVAL)
+    # Фоновая синхронизация инвентаризаций, сохраненных без связи с Google
+    background_tasks['sync'] = asyncio.create_task(run_sync_engine(application.bot))
+    # Ежедневные список товаров к заказу и сводный отчет для администраторов
+    schedule_daily(jobs, 'reorder', reorder_job, REORDER_REPORT_TIME)
+    schedule_daily(jobs, 'consolidation_report', consolidation_report_job, CONSOLIDATION_REPORT_TIME)
+    # Сжатие архива журнала ввода
+    schedule_daily(jobs, 'journal_compaction', compact_journal_job, JOURNAL_COMPACT_TIME)
+    # Перенос старых листов в архивные таблицы
+    if ARCHIVE_ENABLED:
+        schedule_repeating(jobs, 'archive', archive_job, ARCHIVE_INTERVAL, first=ARCHIVE_START_DELAY)
+    # Объединение папок и таблиц, одновременно созданных разными процессами
+    schedule_repeating(jobs, 'reconcile', reconcile_job, RECONCILE_INTERVAL, first=60)
+
+async def evict_stale_sessions(context: ContextTypes.DEFAULT_TYPE):
+    """Задача: закрыть сессии пользователей, от которых не было обновлений дольше SESSION_TTL"""
+    deadline = time.time() - SESSION_TTL
+    stale = [
+        user_id for user_id, session in user_data.items()
+        if user_seen.get(user_id, 0) < deadline and not user_tasks.get(user_id) and session.get('save_state') != 'saving'
+    ]
+    for user_id in stale:
+        session = user_data.pop(user_id)
+        user_seen.pop(user_id, None)
+        if 'session_id' in session:
+            try:
+                await asyncio.to_thread(close_session, session['session_id'], user_id, 'expired')
+            except Exception as e:
+                logging.error("Error closing journal session: %s", e)
+        await persist_session(user_id)
+    if stale:
+        logging.info("Закрыто заброшенных сессий: %s", len(stale))
+    # Просроченные записи общего хранилища удаляет один процесс
+    if worker['index'] == 0:
+        await asyncio.to_thread(session_store.evict)
+
+async def on_shutdown(application: Application):
+    """Остановка фоновых задач"""
+    for task in background_tasks.values():
+        task.cancel()
+    background_tasks.clear()
+    shutdown_pool()
+    # Дописываем на диск события, еще не попавшие в журнал
+    flush_journal()
+
+def build_application(updater=True):
+    """Приложение бота с обработчиками; без updater обновления передаются извне (режим нескольких процессов)"""
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        # Общий лимит Telegram на бота делится между процессами
+        .rate_limiter(SendScheduler(global_share=worker['count']))
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    if not updater:
+        builder = builder.updater(None)
+    application = builder.build()
+
+    # Сессия загружается до обработчиков и сохраняется после них
+    application.add_handler(TypeHandler(Update, load_user_session), group=-1)
+    if session_store.shared:
+        application.add_handler(TypeHandler(Update, save_user_session), group=1)
 
     # Добавляем обработчики
     application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("stats", show_stats))
+    application.add_handler(CommandHandler("history", show_history_menu))
+    application.add_handler(CommandHandler("export", export_command))
+    application.add_handler(CommandHandler("report", report_command))
+    application.add_handler(CommandHandler("forecast", forecast_command))
+    application.add_handler(CallbackQueryHandler(confirm_save, pattern="^confirm_save$"))
     application.add_handler(CallbackQueryHandler(handle_callback))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     application.add_handler(MessageHandler(filters.CONTACT, handle_contact))
+    return application
+
+def prepare():
+    """Подготовка перед запуском процесса бота"""
+    # Загружаем каталог до запуска, чтобы ошибка в файле была видна сразу
+    get_catalog()
+    load_learned_profiles()
+
+async def serve_worker(index, count, updates):
+    """Процесс бота в режиме нескольких процессов: обновления в JSON приходят из очереди диспетчера"""
+    worker['index'] = index
+    worker['count'] = count
+    prepare()
+    application = build_application(updater=False)
+    await application.initialize()
+    # post_init и post_shutdown вызываются только run_polling/run_webhook
+    await on_startup(application)
+    await application.start()
+    try:
+        while True:
+            data = await asyncio.to_thread(updates.get)
+            if data is None:
+                break
+            await application.update_queue.put(Update.de_json(json.loads(data), application.bot))
+    finally:
+        await application.stop()
+        await on_shutdown(application)
+        await application.shutdown()
 
+def main():
+    """Запуск бота"""
+    prepare()
+    
+    # Перемещаем существующие файлы в папку при запуске
+    try:
+        drive_service = get_drive_service()
+        move_existing_files_to_folder(drive_service)
+    except Exception as e:
+        logging.error("Error moving existing files: %s", e)
+    
     # Запускаем бота
-    application.run_polling()
+    build_application().run_polling()
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
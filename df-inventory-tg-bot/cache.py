@@ -0,0 +1,152 @@
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+
+# Все кэши процесса по названию, для /stats
+caches = {}
+
+class AsyncCache:
+    """Кэш результатов медленных запросов: не больше maxsize ключей (LRU), срок жизни ttl секунд.
+    Одновременные промахи по одному ключу ждут одну загрузку; она выполняется отдельной задачей,
+    поэтому отмена вызвавшего ее не затрагивает остальных ожидающих. Устаревшее значение еще stale_ttl
+    секунд отдается сразу, а свежее загружается в фоне. Пустой результат (None) хранится negative_ttl
+    секунд. invalidate() можно вызывать из любого потока"""
+
+    def __init__(self, name, maxsize=128, ttl=300, stale_ttl=0, negative_ttl=30):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        # key -> (значение, время загрузки, срок жизни)
+        self.entries = OrderedDict()
+        # key -> время последнего запроса через get(); фоновые обновления его не меняют
+        self.accessed = {}
+        # Загрузки в процессе: key -> Task; меняется под lock, так как invalidate() читает ее из других потоков
+        self.loading = {}
+        # Номер поколения ключа: загрузка, начатая до invalidate(), не сохраняет результат
+        self.generations = {}
+        self.refreshing = set()
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'stale': 0, 'misses': 0, 'shared': 0, 'loads': 0, 'errors': 0, 'evictions': 0}
+        caches[name] = self
+
+    def _lookup(self, key):
+        """Запись и ее возраст или (None, None)"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None, None
+            self.entries.move_to_end(key)
+        return entry, time.monotonic() - entry[1]
+
+    def peek(self, key, default=None):
+        """Свежее значение без загрузки (из любого потока)"""
+        entry, age = self._lookup(key)
+        if entry is None or age >= entry[2]:
+            return default
+        return entry[0]
+
+    async def get(self, key, loader):
+        """Значение ключа; loader() — корутина загрузки, вызывается только при промахе"""
+        self.accessed[key] = time.monotonic()
+        entry, age = self._lookup(key)
+        if entry is not None:
+            value, _, ttl = entry
+            if age < ttl:
+                self.stats['hits'] += 1
+                return value
+            if age < ttl + self.stale_ttl:
+                self.stats['stale'] += 1
+                self._refresh(key, loader)
+                return value
+        self.stats['misses'] += 1
+        return await self._load(key, loader)
+
+    async def _load(self, key, loader):
+        task = self.loading.get(key)
+        if task is not None:
+            self.stats['shared'] += 1
+        else:
+            with self.lock:
+                generation = self.generations.get(key, 0)
+                task = self.loading[key] = asyncio.create_task(self._run_loader(key, loader, generation))
+            # Ошибку получают ожидающие; если их уже нет (все отменены), она не должна попасть в лог asyncio
+            task.add_done_callback(lambda finished: finished.cancelled() or finished.exception())
+        # Отмена ожидающего не отменяет загрузку: ее результат нужен остальным и попадет в кэш
+        return await asyncio.shield(task)
+
+    async def _run_loader(self, key, loader, generation):
+        """Загрузка ключа; результат сохраняется, если ключ не сбросили, пока она шла"""
+        self.stats['loads'] += 1
+        try:
+            value = await loader()
+        except Exception:
+            self.stats['errors'] += 1
+            raise
+        finally:
+            with self.lock:
+                self.loading.pop(key, None)
+        with self.lock:
+            if self.generations.get(key, 0) == generation:
+                self._store(key, value)
+        return value
+
+    async def refresh(self, key, loader):
+        """Загрузить ключ заново, не дожидаясь истечения срока; совпадает с уже идущей загрузкой"""
+        return await self._load(key, loader)
+
+    def expiring(self, within):
+        """Ключи, срок жизни которых истекает в ближайшие within секунд (или уже истек, но значение еще отдается).
+        Только ключи, запрошенные за последние ttl секунд: то, что никто не читает, заранее не обновляется"""
+        now = time.monotonic()
+        with self.lock:
+            return [
+                key for key, (_, loaded_at, ttl) in self.entries.items()
+                if now - loaded_at + within >= ttl and now - loaded_at < ttl + self.stale_ttl
+                and now - self.accessed.get(key, float('-inf')) < self.ttl
+            ]
+
+    def _refresh(self, key, loader):
+        """Фоновая загрузка устаревшего ключа"""
+        if key in self.loading:
+            return
+        task = asyncio.create_task(self._load(key, loader))
+        self.refreshing.add(task)
+
+        def done(finished):
+            self.refreshing.discard(finished)
+            if not finished.cancelled() and finished.exception() is not None:
+                logging.warning("Кэш %s: ошибка фонового обновления %r: %s", self.name, key, finished.exception())
+        task.add_done_callback(done)
+
+    def _store(self, key, value):
+        ttl = self.negative_ttl if value is None else self.ttl
+        self.entries[key] = (value, time.monotonic(), ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            evicted, _ = self.entries.popitem(last=False)
+            self.accessed.pop(evicted, None)
+            self.stats['evictions'] += 1
+
+    def invalidate(self, key=None):
+        """Сбросить ключ (или весь кэш); загрузки, начатые раньше, результат не сохранят"""
+        with self.lock:
+            keys = list(self.entries) + list(self.loading) if key is None else [key]
+            for stale_key in keys:
+                self.generations[stale_key] = self.generations.get(stale_key, 0) + 1
+                self.entries.pop(stale_key, None)
+
+    def get_stats(self):
+        """Снимок метрик кэша"""
+        stats = dict(self.stats)
+        lookups = stats['hits'] + stats['stale'] + stats['misses']
+        stats['hit_ratio'] = round((stats['hits'] + stats['stale']) / lookups, 3) if lookups else 0.0
+        stats['size'] = len(self.entries)
+        return stats
+
+def get_cache_stats():
+    """Метрики всех кэшей процесса"""
+    return {name: cache.get_stats() for name, cache in caches.items()}
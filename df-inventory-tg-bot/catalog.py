@@ -0,0 +1,237 @@
+import os
+import csv
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from array import array
+from typing import NamedTuple
+from config import CATALOG_FILE, CATALOG_CHECK_INTERVAL
+
+CSV_PATH_SEPARATOR = ' > '  # Разделитель уровней категорий в CSV-файле каталога
+
+class CatalogError(Exception):
+    """Ошибка загрузки или проверки каталога товаров"""
+
+class Product(NamedTuple):
+    """Товар каталога с заранее разобранной единицей измерения"""
+    id: int  # Номер товара в версии каталога, индекс в массиве количеств сессии
+    name: str  # Название без единицы измерения
+    unit: str  # Единица измерения из квадратных скобок
+    path: tuple  # Путь категории, где товар встретился первым
+    sort_key: tuple  # Порядок товара в каталоге
+    display: str  # Полное название, как в каталоге
+
+def split_unit(title):
+    """Разделить название товара вида 'Название [ЕД]' на название и единицу измерения"""
+    if "[" in title and "]" in title:
+        return title[:title.find("[")].strip(), title[title.find("[")+1:title.find("]")]
+    return title, ""
+
+class Catalog:
+    """Скомпилированная неизменяемая версия каталога товаров"""
+
+    def __init__(self, tree, version):
+        self.version = version
+        self.tree = tree
+        # Узлы дерева: корень (id 0) и все категории/подкатегории
+        self.nodes = []
+        self.node_by_path = {}
+        # Товары уникальны по полному названию; узлы хранят номера товаров
+        self.products = []
+        self.product_index = {}
+        self.product_by_name = {}
+        self._add_node((), '', {'items': [], 'subcategories': tree})
+
+    def _add_node(self, path, name, data):
+        """Добавить узел и его потомков в плоские таблицы поиска"""
+        if isinstance(data, list):
+            data = {'items': data, 'subcategories': {}}
+        node = {
+            'id': len(self.nodes),
+            'name': name,
+            'path': path,
+            'children': [],
+            'items': []
+        }
+        self.nodes.append(node)
+        self.node_by_path[path] = node['id']
+        for position, item in enumerate(data.get('items', [])):
+            if item not in self.product_index:
+                product_name, unit = split_unit(item)
+                product = Product(len(self.products), product_name, unit, path, (node['id'], position), item)
+                self.product_index[item] = product.id
+                self.product_by_name.setdefault((product_name, unit), product.id)
+                self.products.append(product)
+            node['items'].append(self.product_index[item])
+        for child_name, child_data in data.get('subcategories', {}).items():
+            child_id = self._add_node(path + (child_name,), child_name, child_data)
+            node['children'].append(child_id)
+        return node['id']
+
+    @property
+    def categories(self):
+        """Названия корневых категорий"""
+        return [self.nodes[child_id]['name'] for child_id in self.nodes[0]['children']]
+
+    def get_node(self, path):
+        """Узел каталога по пути из названий категорий"""
+        return self.nodes[self.node_by_path[tuple(path)]]
+
+    def get_child(self, path, index):
+        """Дочерняя категория узла по ее порядковому номеру"""
+        return self.nodes[self.get_node(path)['children'][index]]
+
+    def find_product(self, name, unit=""):
+        """Номер товара по названию и единице измерения или None"""
+        return self.product_by_name.get((name, unit))
+
+def new_quantities(catalog):
+    """Пустой массив количеств сессии: NaN означает, что количество не вводилось"""
+    return array('d', [float('nan')]) * len(catalog.products)
+
+def iter_quantities(catalog, quantities):
+    """Введенные количества в порядке каталога: пары (Product, количество)"""
+    for product_id, quantity in enumerate(quantities):
+        if quantity == quantity:
+            yield catalog.products[product_id], quantity
+
+def align_items(catalog, items):
+    """Строки (название, количество, единица) как массив количеств каталога;
+    товары, которых нет в каталоге, возвращаются отдельно: {(название, единица): количество}"""
+    quantities = new_quantities(catalog)
+    extra = {}
+    for name, quantity, unit in items:
+        product_id = catalog.find_product(name, unit)
+        if product_id is None:
+            extra[(name, unit)] = extra.get((name, unit), 0.0) + quantity
+        elif quantities[product_id] != quantities[product_id]:
+            quantities[product_id] = quantity
+        else:
+            quantities[product_id] += quantity
+    return quantities, extra
+
+def _validate_items(items, where):
+    """Проверка списка товаров категории"""
+    if not isinstance(items, list):
+        raise CatalogError(f"{where}: список товаров должен быть массивом")
+    for item in items:
+        if not isinstance(item, str) or not item.strip():
+            raise CatalogError(f"{where}: некорректное название товара {item!r}")
+
+def validate_tree(tree, where='каталог'):
+    """Проверка структуры дерева категорий"""
+    if not isinstance(tree, dict) or not tree:
+        raise CatalogError(f"{where}: ожидается непустой словарь категорий")
+    for name, data in tree.items():
+        if not isinstance(name, str) or not name.strip():
+            raise CatalogError(f"{where}: некорректное название категории {name!r}")
+        path = f"{where} / {name}"
+        if isinstance(data, list):
+            _validate_items(data, path)
+        elif isinstance(data, dict):
+            unknown = set(data) - {'items', 'subcategories'}
+            if unknown:
+                raise CatalogError(f"{path}: неизвестные поля {sorted(unknown)}")
+            _validate_items(data.get('items', []), path)
+            subcategories = data.get('subcategories', {})
+            if subcategories:
+                validate_tree(subcategories, path)
+            elif not isinstance(subcategories, dict):
+                raise CatalogError(f"{path}: подкатегории должны быть словарем")
+        else:
+            raise CatalogError(f"{path}: категория должна быть списком или словарем")
+
+def _read_csv_tree(f):
+    """Построить дерево категорий из CSV со столбцами category и item"""
+    tree = {}
+    for row in csv.DictReader(f):
+        path = [part.strip() for part in row['category'].split(CSV_PATH_SEPARATOR)]
+        level = tree
+        for depth, name in enumerate(path):
+            node = level.setdefault(name, {'items': [], 'subcategories': {}})
+            if depth == len(path) - 1:
+                node['items'].append(row['item'].strip())
+            level = node['subcategories']
+    # Корневые категории без подкатегорий хранятся простым списком, как в JSON
+    return {
+        name: node['items'] if not node['subcategories'] else node
+        for name, node in tree.items()
+    }
+
+def read_catalog_file(path):
+    """Прочитать дерево категорий из файла JSON, YAML или CSV"""
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, 'rb') as f:
+        raw = f.read()
+    text = raw.decode('utf-8-sig')
+    if extension == '.json':
+        tree = json.loads(text)
+    elif extension in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise CatalogError("Для каталога в формате YAML установите пакет PyYAML")
+        tree = yaml.safe_load(text)
+    elif extension == '.csv':
+        tree = _read_csv_tree(text.splitlines())
+    else:
+        raise CatalogError(f"Неподдерживаемый формат файла каталога: {path}")
+    return tree, hashlib.sha1(raw).hexdigest()[:12]
+
+def load_catalog(path=CATALOG_FILE):
+    """Загрузить, проверить и скомпилировать каталог из файла"""
+    tree, digest = read_catalog_file(path)
+    validate_tree(tree)
+    return Catalog(tree, digest)
+
+# Текущая версия каталога; заменяется целиком при перезагрузке
+_state = {
+    'catalog': None,
+    'mtime': None
+}
+
+def _file_signature(path):
+    """Признак изменения файла: время модификации и размер"""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+def get_catalog():
+    """Актуальная версия каталога"""
+    if _state['catalog'] is None:
+        _state['mtime'] = _file_signature(CATALOG_FILE)
+        _state['catalog'] = load_catalog(CATALOG_FILE)
+        logging.info("Каталог загружен: версия %s, %s товаров", _state['catalog'].version, len(_state['catalog'].products))
+    return _state['catalog']
+
+def reload_catalog_if_changed():
+    """Перечитать каталог, если файл изменился; возвращает True при замене версии"""
+    signature = _file_signature(CATALOG_FILE)
+    if signature == _state['mtime']:
+        return False
+    started = time.perf_counter()
+    # Запоминаем признак до загрузки, чтобы ошибочный файл не перечитывался повторно
+    _state['mtime'] = signature
+    catalog = load_catalog(CATALOG_FILE)
+    if _state['catalog'] is not None and catalog.version == _state['catalog'].version:
+        return False
+    # Атомарная замена: начатые сессии продолжают работать со своей версией
+    _state['catalog'] = catalog
+    logging.info(
+        "Каталог перезагружен за %.1f мс: версия %s, %s товаров",
+        (time.perf_counter() - started) * 1000, catalog.version, len(catalog.products)
+    )
+    return True
+
+async def watch_catalog():
+    """Фоновая проверка файла каталога и перезагрузка без блокировки бота"""
+    while True:
+        await asyncio.sleep(CATALOG_CHECK_INTERVAL)
+        try:
+            await asyncio.to_thread(reload_catalog_if_changed)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Ошибочный файл не заменяет рабочую версию каталога
+            logging.error("Ошибка перезагрузки каталога: %s", e)
@@ -0,0 +1,89 @@
+import io
+import csv
+import logging
+import tempfile
+import itertools
+from operator import itemgetter
+from sheets import parse_inventory_title, read_inventory_values, INVENTORY_HEADER_ROWS
+
+EXPORT_HEADER = ['Склад', 'Дата', 'Лист', 'Ответственное лицо', '№', 'Продукт', 'Количество', 'Единица измерения']
+EXPORT_FORMATS = ('csv', 'xlsx')
+EXPORT_SPOOL_SIZE = 1024 * 1024  # До этого размера файл экспорта хранится в памяти, дальше — на диске
+BATCH_GET_RANGES = 50  # Листов в одном запросе values.batchGet
+
+def _field_value(row, prefix):
+    """Значение поля шапки вида 'Префикс: значение'"""
+    if row and isinstance(row[0], str) and row[0].startswith(prefix):
+        return row[0][len(prefix):].strip()
+    return ""
+
+def iter_sheet_rows(warehouse, sheet_title, values):
+    """Строки экспорта одного листа инвентаризации"""
+    parsed = parse_inventory_title(sheet_title)
+    date = parsed[0] if parsed else ""
+    responsible = _field_value(values[1], 'Материально ответственное лицо:') if len(values) > 1 else ""
+    for row in values[INVENTORY_HEADER_ROWS:]:
+        if len(row) < 2:
+            continue
+        number, product = row[0], row[1]
+        quantity = row[2] if len(row) > 2 else ""
+        unit = row[3] if len(row) > 3 else ""
+        yield [warehouse, date, sheet_title, responsible, number, product, quantity, unit]
+
+def iter_inventory_rows(service, spreadsheet_id, warehouse, sheet_titles):
+    """Строки экспорта нескольких инвентаризаций; листы читаются пачками через values.batchGet"""
+    for start in range(0, len(sheet_titles), BATCH_GET_RANGES):
+        chunk = sheet_titles[start:start + BATCH_GET_RANGES]
+        for title, values in zip(chunk, read_inventory_values(service, spreadsheet_id, chunk)):
+            yield from iter_sheet_rows(warehouse, title, values)
+
+def iter_warehouse_rows(service, warehouse, entries):
+    """Строки экспорта инвентаризаций склада из нескольких таблиц; entries — пары (spreadsheet_id, лист)"""
+    for spreadsheet_id, group in itertools.groupby(entries, key=itemgetter(0)):
+        yield from iter_inventory_rows(service, spreadsheet_id, warehouse, [title for _, title in group])
+
+def write_csv(rows, header=EXPORT_HEADER):
+    """Записать строки в CSV; возвращает файл, готовый к чтению с начала"""
+    output = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)
+    # utf-8-sig, чтобы Excel правильно открыл кириллицу
+    text = io.TextIOWrapper(output, encoding='utf-8-sig', newline='')
+    writer = csv.writer(text, delimiter=';')
+    writer.writerow(header)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    text.flush()
+    text.detach()
+    output.seek(0)
+    return output, count
+
+def write_xlsx(rows):
+    """Записать строки в XLSX в потоковом режиме openpyxl"""
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise RuntimeError("Для экспорта в XLSX установите пакет openpyxl")
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet('Инвентаризации')
+    worksheet.append(EXPORT_HEADER)
+    count = 0
+    for row in rows:
+        worksheet.append(row)
+        count += 1
+    output = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)
+    workbook.save(output)
+    output.seek(0)
+    return output, count
+
+def build_export(export_format, sources):
+    """Собрать файл экспорта; sources — итерируемые строки (например, из iter_inventory_rows)"""
+    def rows():
+        for source in sources:
+            yield from source
+    if export_format == 'xlsx':
+        output, count = write_xlsx(rows())
+    else:
+        output, count = write_csv(rows())
+    logging.info("Подготовлен экспорт %s: %s строк", export_format, count)
+    return output, count
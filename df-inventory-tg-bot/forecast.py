@@ -0,0 +1,169 @@
+import os
+import asyncio
+import logging
+import multiprocessing
+from contextlib import closing
+from datetime import date
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from dotenv import load_dotenv
+from history import connect
+from config import ADMIN_IDS
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Константы
+FORECAST_WINDOW = 8  # Сколько последних подсчетов склада учитывать
+FORECAST_WORKERS = int(os.getenv('FORECAST_WORKERS', '2'))  # Процессов для расчета по складам
+REORDER_HORIZON_DAYS = int(os.getenv('REORDER_HORIZON_DAYS', '7'))  # Заказывать, если запаса меньше чем на столько дней
+REORDER_REPORT_TIME = os.getenv('REORDER_REPORT_TIME', '06:00')  # Время ежедневного списка к заказу
+REORDER_MESSAGE_LIMIT = 40  # Сколько строк списка к заказу показывать в сообщении
+
+_pool = {'executor': None}
+
+def _get_pool():
+    """Пул процессов для расчета; spawn, чтобы не копировать потоки бота"""
+    if _pool['executor'] is None:
+        _pool['executor'] = ProcessPoolExecutor(
+            max_workers=FORECAST_WORKERS,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    return _pool['executor']
+
+def shutdown_pool():
+    """Остановить пул процессов"""
+    if _pool['executor'] is not None:
+        _pool['executor'].shutdown(cancel_futures=True)
+        _pool['executor'] = None
+
+def load_matrices(window=FORECAST_WINDOW):
+    """Последние подсчеты складов из локальной истории.
+    Возвращает список товаров [(название, единица)] и для каждого склада
+    (номера товаров, даты подсчетов, матрица количеств товар × дата с NaN на месте пропусков)"""
+    with closing(connect()) as connection:
+        products = connection.execute("SELECT id, name, unit FROM products ORDER BY id").fetchall()
+        # Из нескольких инвентаризаций одного дня берется последняя по номеру
+        rows = connection.execute(
+            """
+            SELECT w.name, i.date, c.product_id, c.qty
+            FROM inventories i
+            JOIN warehouses w ON w.id = i.warehouse_id
+            JOIN counts c ON c.inventory_id = i.id
+            WHERE i.seq = (
+                SELECT MAX(seq) FROM inventories latest
+                WHERE latest.warehouse_id = i.warehouse_id AND latest.date = i.date
+            )
+            """
+        ).fetchall()
+
+    by_warehouse = {}
+    for warehouse, count_date, product_id, quantity in rows:
+        by_warehouse.setdefault(warehouse, {}).setdefault(count_date, {})[product_id] = quantity
+
+    matrices = {}
+    for warehouse, counts in by_warehouse.items():
+        dates = sorted(counts)[-window:]
+        product_ids = sorted({product_id for count_date in dates for product_id in counts[count_date]})
+        row_of = {product_id: row for row, product_id in enumerate(product_ids)}
+        quantities = np.full((len(product_ids), len(dates)), np.nan)
+        for column, count_date in enumerate(dates):
+            for product_id, quantity in counts[count_date].items():
+                quantities[row_of[product_id], column] = quantity
+        days = np.array([date.fromisoformat(count_date).toordinal() for count_date in dates], dtype=float)
+        matrices[warehouse] = (np.array(product_ids), days, quantities)
+    return {product_id: (name, unit) for product_id, name, unit in products}, matrices
+
+def forecast_matrix(days, quantities, today):
+    """Расход в день и прогноз запаса по матрице товар × дата.
+    Расход — среднее снижение количества между соседними подсчетами, деленное на число дней;
+    рост количества означает поставку, такие интервалы не учитываются"""
+    last = quantities[:, -1] if quantities.shape[1] else np.full(quantities.shape[0], np.nan)
+    if quantities.shape[1] < 2:
+        rate = np.full(quantities.shape[0], np.nan)
+    else:
+        elapsed = np.diff(days)
+        drops = quantities[:, :-1] - quantities[:, 1:]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            per_day = np.where((drops >= 0) & (elapsed > 0), drops / elapsed, np.nan)
+            counted = np.sum(~np.isnan(per_day), axis=1)
+            rate = np.where(counted > 0, np.nansum(per_day, axis=1) / np.maximum(counted, 1), np.nan)
+    # Остаток на сегодня с учетом расхода после последнего подсчета
+    since_last = today - days[-1] if len(days) else 0.0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        remaining = np.maximum(last - rate * since_last, 0)
+        days_left = np.where(rate > 0, remaining / rate, np.inf)
+    return rate, last, remaining, days_left
+
+def _forecast_warehouse(args):
+    """Расчет одного склада в процессе пула"""
+    warehouse, product_ids, days, quantities, today = args
+    rate, last, remaining, days_left = forecast_matrix(days, quantities, today)
+    return warehouse, product_ids, rate, last, remaining, days_left
+
+async def build_forecast(today=None):
+    """Прогноз по всем складам: склады считаются параллельно в пуле процессов"""
+    today = float((today or date.today()).toordinal())
+    products, matrices = await asyncio.to_thread(load_matrices)
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    results = await asyncio.gather(*(
+        loop.run_in_executor(pool, _forecast_warehouse, (warehouse, product_ids, days, quantities, today))
+        for warehouse, (product_ids, days, quantities) in matrices.items()
+    ))
+    forecast = {'products': products, 'warehouses': {}}
+    for warehouse, product_ids, rate, last, remaining, days_left in results:
+        forecast['warehouses'][warehouse] = {
+            'last_date': date.fromordinal(int(matrices[warehouse][1][-1])).isoformat(),
+            'product_ids': product_ids,
+            'rate': rate,
+            'last': last,
+            'remaining': remaining,
+            'days_left': days_left
+        }
+    return forecast
+
+def warehouse_forecast(forecast, warehouse):
+    """Строки прогноза склада: (название, единица, остаток, расход в день, дней запаса), по возрастанию запаса"""
+    data = forecast['warehouses'].get(warehouse)
+    if not data:
+        return []
+    known = ~np.isnan(data['rate']) & ~np.isnan(data['last'])
+    order = np.argsort(data['days_left'][known], kind='stable')
+    rows = []
+    for index in np.flatnonzero(known)[order]:
+        name, unit = forecast['products'][int(data['product_ids'][index])]
+        rows.append((name, unit, float(data['remaining'][index]), float(data['rate'][index]), float(data['days_left'][index])))
+    return rows
+
+def reorder_list(forecast, horizon=REORDER_HORIZON_DAYS):
+    """Товары, запаса которых хватит меньше чем на horizon дней: (склад, название, единица, остаток, расход, дней)"""
+    rows = []
+    for warehouse in forecast['warehouses']:
+        for name, unit, remaining, rate, days_left in warehouse_forecast(forecast, warehouse):
+            if days_left > horizon:
+                break
+            rows.append((warehouse, name, unit, remaining, rate, days_left))
+    rows.sort(key=lambda row: row[5])
+    return rows
+
+def format_reorder_list(rows, limit=REORDER_MESSAGE_LIMIT):
+    """Сообщение со списком к заказу"""
+    if not rows:
+        return f"✅ Запаса всех товаров хватит больше чем на {REORDER_HORIZON_DAYS} дн."
+    lines = [f"🛒 К заказу (запас меньше {REORDER_HORIZON_DAYS} дн.): {len(rows)}"]
+    for warehouse, name, unit, remaining, rate, days_left in rows[:limit]:
+        title = f"{name} [{unit}]" if unit else name
+        lines.append(f"🏭 {warehouse} | {title}: ~{remaining:.1f}, расход {rate:.2f}/день, {days_left:.0f} дн.")
+    if len(rows) > limit:
+        lines.append(f"… и еще {len(rows) - limit}")
+    return "\n".join(lines)
+
+async def send_reorder_list(bot):
+    """Список к заказу администраторам (ежедневная задача)"""
+    message = format_reorder_list(reorder_list(await build_forecast()))
+    for admin_id in ADMIN_IDS:
+        try:
+            await bot.send_message(chat_id=admin_id, text=message)
+        except Exception as e:
+            logging.error("Error sending reorder list to %s: %s", admin_id, e)
@@ -0,0 +1,193 @@
+import os
+import sys
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import closing
+from dotenv import load_dotenv
+from sheets import (
+    get_google_sheets_service, get_drive_service, list_warehouse_spreadsheets,
+    get_inventory_titles, parse_inventory_title
+)
+from export import iter_inventory_rows
+from logconfig import setup_logging
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Константы
+HISTORY_DB = os.getenv('HISTORY_DB', 'history.sqlite3')  # Локальная копия всех сохраненных инвентаризаций
+
+# Измерения (склады, товары, ответственные) хранятся в отдельных таблицах,
+# строки инвентаризаций — только номерами, поэтому выборки по товару и складу идут по индексам
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS warehouses (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    unit TEXT NOT NULL,
+    UNIQUE (name, unit)
+);
+CREATE TABLE IF NOT EXISTS authors (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    UNIQUE (name, phone)
+);
+CREATE TABLE IF NOT EXISTS inventories (
+    id INTEGER PRIMARY KEY,
+    warehouse_id INTEGER NOT NULL REFERENCES warehouses (id),
+    date TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    sheet_title TEXT NOT NULL,
+    author_id INTEGER REFERENCES authors (id),
+    record_id TEXT,
+    saved_at REAL NOT NULL,
+    UNIQUE (warehouse_id, sheet_title)
+);
+CREATE INDEX IF NOT EXISTS inventories_by_date ON inventories (warehouse_id, date, seq);
+CREATE TABLE IF NOT EXISTS counts (
+    inventory_id INTEGER NOT NULL REFERENCES inventories (id) ON DELETE CASCADE,
+    product_id INTEGER NOT NULL REFERENCES products (id),
+    qty REAL NOT NULL,
+    PRIMARY KEY (inventory_id, product_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS counts_by_product ON counts (product_id, inventory_id);
+"""
+
+# Запись из нескольких потоков сохранения выполняется по одной
+_write_lock = threading.Lock()
+_schema_ready = {'path': None}
+
+def connect(path=None):
+    """Соединение с базой истории; схема создается при первом подключении"""
+    path = path or HISTORY_DB
+    connection = sqlite3.connect(path, timeout=30)
+    connection.execute("PRAGMA foreign_keys = ON")
+    if _schema_ready['path'] != path:
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.executescript(SCHEMA)
+        _schema_ready['path'] = path
+    return connection
+
+def _dimension_id(connection, table, **values):
+    """Номер строки таблицы измерения; строка создается при первом обращении"""
+    columns = ', '.join(values)
+    condition = ' AND '.join(f"{column} = ?" for column in values)
+    row = connection.execute(f"SELECT id FROM {table} WHERE {condition}", tuple(values.values())).fetchone()
+    if row:
+        return row[0]
+    placeholders = ', '.join('?' for _ in values)
+    return connection.execute(
+        f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", tuple(values.values())
+    ).lastrowid
+
+def store_inventory(connection, warehouse, date, sheet_title, items, author_name="", phone="", record_id=None, saved_at=None):
+    """Записать инвентаризацию; повторная запись того же листа заменяет прежние строки"""
+    warehouse_id = _dimension_id(connection, 'warehouses', name=warehouse)
+    author_id = _dimension_id(connection, 'authors', name=author_name or "", phone=phone or "")
+    parsed = parse_inventory_title(sheet_title)
+    seq = parsed[1] if parsed else 1
+    connection.execute(
+        "DELETE FROM inventories WHERE warehouse_id = ? AND sheet_title = ?", (warehouse_id, sheet_title)
+    )
+    inventory_id = connection.execute(
+        "INSERT INTO inventories (warehouse_id, date, seq, sheet_title, author_id, record_id, saved_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (warehouse_id, date, seq, sheet_title, author_id, record_id, saved_at or time.time())
+    ).lastrowid
+    # Повторы товара на листе складываются, как в сводном отчете
+    counts = {}
+    for name, quantity, unit in items:
+        product_id = _dimension_id(connection, 'products', name=name, unit=unit or "")
+        counts[product_id] = counts.get(product_id, 0.0) + float(quantity)
+    connection.executemany(
+        "INSERT INTO counts (inventory_id, product_id, qty) VALUES (?, ?, ?)",
+        [(inventory_id, product_id, quantity) for product_id, quantity in counts.items()]
+    )
+    return inventory_id
+
+def record_inventory(record, sheet_title, items):
+    """Сохранить в историю инвентаризацию, только что записанную в Google Sheets (блокирующий вызов)"""
+    try:
+        with _write_lock, closing(connect()) as connection, connection:
+            store_inventory(
+                connection,
+                record['warehouse'],
+                record['date'],
+                sheet_title,
+                items,
+                author_name=record['name'],
+                phone=record['phone'],
+                record_id=record['id'],
+                saved_at=record.get('created_at')
+            )
+    except Exception as e:
+        # История вторична: ошибка не должна отменять сохранение в Google Sheets
+        logging.error("Ошибка записи инвентаризации %s в историю: %s", record['id'], e)
+
+def product_history(warehouse, name, unit="", limit=12):
+    """Последние подсчеты товара на складе: [(дата, номер, количество)], от новых к старым"""
+    with closing(connect()) as connection:
+        return connection.execute(
+            """
+            SELECT i.date, i.seq, c.qty
+            FROM counts c
+            JOIN inventories i ON i.id = c.inventory_id
+            WHERE c.product_id = (SELECT id FROM products WHERE name = ? AND unit = ?)
+              AND i.warehouse_id = (SELECT id FROM warehouses WHERE name = ?)
+            ORDER BY i.date DESC, i.seq DESC
+            LIMIT ?
+            """,
+            (name, unit, warehouse, limit)
+        ).fetchall()
+
+def warehouse_inventories(warehouse):
+    """Инвентаризации склада в истории: [(дата, номер, лист, число товаров)], от новых к старым"""
+    with closing(connect()) as connection:
+        return connection.execute(
+            """
+            SELECT i.date, i.seq, i.sheet_title, COUNT(c.product_id)
+            FROM inventories i
+            LEFT JOIN counts c ON c.inventory_id = i.id
+            WHERE i.warehouse_id = (SELECT id FROM warehouses WHERE name = ?)
+            GROUP BY i.id
+            ORDER BY i.date DESC, i.seq DESC
+            """,
+            (warehouse,)
+        ).fetchall()
+
+def backfill():
+    """Загрузить в историю все инвентаризации из Google Sheets (блокирующий вызов)"""
+    sheets_service = get_google_sheets_service()
+    spreadsheets = list_warehouse_spreadsheets(get_drive_service())
+    total = 0
+    for warehouse, spreadsheet_id in spreadsheets.items():
+        titles = get_inventory_titles(sheets_service, spreadsheet_id)
+        if not titles:
+            continue
+        # Строки экспорта идут подряд по листам: собираем их в инвентаризации
+        sheets = {}
+        for _, date, title, responsible, _, product, quantity, unit in iter_inventory_rows(
+            sheets_service, spreadsheet_id, warehouse, titles
+        ):
+            if isinstance(quantity, (int, float)):
+                sheet = sheets.setdefault(title, {'date': date, 'author': responsible, 'items': []})
+                sheet['items'].append((str(product), quantity, str(unit)))
+        with _write_lock, closing(connect()) as connection, connection:
+            for title, sheet in sheets.items():
+                store_inventory(connection, warehouse, sheet['date'], title, sheet['items'], author_name=sheet['author'])
+        total += len(sheets)
+        logging.info("История склада %s: загружено инвентаризаций %s", warehouse, len(sheets))
+    return total
+
+if __name__ == '__main__':
+    setup_logging()
+    if sys.argv[1:] == ['--backfill']:
+        print(f"Загружено инвентаризаций: {backfill()}")
+    else:
+        print("Использование: python history.py --backfill")
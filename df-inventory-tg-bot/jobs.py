@@ -0,0 +1,151 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime
+from dotenv import load_dotenv
+from archive import run_archival, reconcile_duplicates, refresh_lookups
+from forecast import send_reorder_list
+from report import build_report, refresh_caches, report_summary, write_report_csv
+from journal import compact_archive
+from config import ADMIN_IDS
+from logconfig import bind, clear_context
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Константы
+JOB_JITTER = 0.1  # Случайный сдвиг запуска периодической задачи: доля интервала
+DAILY_JOB_JITTER = 300  # Случайный сдвиг запуска ежедневной задачи в секундах
+CACHE_REFRESH_INTERVAL = 120  # Как часто проверять кэши отчета, в секундах
+CACHE_REFRESH_AHEAD = 2 * CACHE_REFRESH_INTERVAL  # Обновлять записи, срок которых истекает раньше следующей проверки
+CONSOLIDATION_REPORT_TIME = os.getenv('CONSOLIDATION_REPORT_TIME', '21:00')  # Время ежедневного сводного отчета
+JOURNAL_COMPACT_TIME = '03:30'  # Время сжатия архива журнала
+
+# Метрики задач: название -> запуски, пропуски, ошибки и время выполнения
+job_metrics = {}
+_running = set()
+
+def _job_metrics(name):
+    return job_metrics.setdefault(name, {
+        'runs': 0, 'skipped': 0, 'errors': 0,
+        'last_duration': None, 'max_duration': 0.0, 'total_duration': 0.0, 'last_run': None
+    })
+
+def guarded(name, callback):
+    """Задача JobQueue с защитой от наложения: пока предыдущий запуск не закончился, новый пропускается
+    и учитывается в метриках"""
+    async def run(context):
+        metrics = _job_metrics(name)
+        if name in _running:
+            metrics['skipped'] += 1
+            logging.warning("Задача %s еще выполняется, запуск пропущен", name)
+            return
+        _running.add(name)
+        clear_context()
+        bind(job=name)
+        started = time.perf_counter()
+        try:
+            await callback(context)
+        except Exception as e:
+            metrics['errors'] += 1
+            logging.error("Ошибка задачи %s: %s", name, e)
+        finally:
+            _running.discard(name)
+            duration = time.perf_counter() - started
+            metrics['runs'] += 1
+            metrics['last_duration'] = round(duration, 3)
+            metrics['max_duration'] = round(max(metrics['max_duration'], duration), 3)
+            metrics['total_duration'] += duration
+            metrics['last_run'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    return run
+
+def _job_kwargs(jitter):
+    # Сам APScheduler молча пропускает запуск сверх max_instances; второй экземпляр допускается,
+    # чтобы пропуск прошел через guarded и попал в метрики. Накопленные пропуски не догоняются
+    return {'jitter': jitter, 'max_instances': 2, 'coalesce': True}
+
+def schedule_repeating(job_queue, name, callback, interval, first=None):
+    """Периодическая задача со сдвигом каждого запуска на случайные ±JOB_JITTER интервала"""
+    _job_metrics(name)
+    return job_queue.run_repeating(
+        guarded(name, callback),
+        interval=interval,
+        first=interval if first is None else first,
+        name=name,
+        job_kwargs=_job_kwargs(interval * JOB_JITTER)
+    )
+
+def schedule_daily(job_queue, name, callback, time_of_day):
+    """Ежедневная задача в ЧЧ:ММ по местному времени со сдвигом до DAILY_JOB_JITTER секунд"""
+    _job_metrics(name)
+    # JobQueue считает время без часового пояса временем UTC
+    local_time = datetime.strptime(time_of_day, '%H:%M').time().replace(tzinfo=datetime.now().astimezone().tzinfo)
+    return job_queue.run_daily(
+        guarded(name, callback),
+        time=local_time,
+        name=name,
+        job_kwargs=_job_kwargs(DAILY_JOB_JITTER)
+    )
+
+def get_job_metrics():
+    """Снимок метрик задач"""
+    metrics = {}
+    for name, job in job_metrics.items():
+        job = dict(job)
+        total = job.pop('total_duration')
+        job['avg_duration'] = round(total / job['runs'], 3) if job['runs'] else None
+        job['running'] = name in _running
+        metrics[name] = job
+    return metrics
+
+async def refresh_caches_job(context):
+    """Заранее обновить кэши сводного отчета, пока пользователи их не запросили"""
+    refreshed = await refresh_caches(CACHE_REFRESH_AHEAD)
+    if refreshed:
+        logging.info("Заранее обновлено записей кэшей отчета: %s", refreshed)
+
+async def refresh_lookups_job(context):
+    """Заранее найти заново папку и таблицы в Drive для сохранения и реестр таблиц для /history:
+    найденные id у каждого процесса свои, поэтому задача выполняется во всех процессах"""
+    refreshed = await asyncio.to_thread(refresh_lookups, CACHE_REFRESH_AHEAD)
+    if refreshed:
+        logging.info("Заранее обновлено записей поиска в Drive: %s", refreshed)
+
+async def consolidation_report_job(context):
+    """Ежедневный сводный отчет по остаткам администраторам"""
+    if not ADMIN_IDS:
+        return
+    report = await build_report()
+    text = "\n".join(["🌙 Сводный отчет за день"] + report_summary(report))
+    filename = f"Остатки {datetime.now().strftime('%Y-%m-%d')}.csv"
+    for admin_id in ADMIN_IDS:
+        output, count = await asyncio.to_thread(write_report_csv, report)
+        try:
+            with output:
+                await context.bot.send_document(
+                    chat_id=admin_id,
+                    document=output,
+                    filename=filename,
+                    caption=f"{text}\n📎 Товаров: {count}"
+                )
+        except Exception as e:
+            logging.error("Error sending consolidation report to %s: %s", admin_id, e)
+
+async def reorder_job(context):
+    """Ежедневный список к заказу администраторам"""
+    await send_reorder_list(context.bot)
+
+async def archive_job(context):
+    """Перенос старых листов в архивные таблицы"""
+    await asyncio.to_thread(run_archival)
+
+async def reconcile_job(context):
+    """Объединение папок и таблиц, одновременно созданных разными процессами"""
+    await asyncio.to_thread(reconcile_duplicates)
+
+async def compact_journal_job(context):
+    """Сжатие архива журнала ввода и удаление устаревших дней"""
+    compressed, removed = await asyncio.to_thread(compact_archive)
+    if compressed or removed:
+        logging.info("Архив журнала: сжато дней %s, удалено %s", compressed, removed)
@@ -0,0 +1,193 @@
+import os
+import gzip
+import json
+import shutil
+import time
+import asyncio
+import logging
+import threading
+from datetime import date, datetime
+from dotenv import load_dotenv
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Константы
+JOURNAL_DIR = os.getenv('JOURNAL_DIR', 'journal')
+JOURNAL_ACTIVE_DIR = os.path.join(JOURNAL_DIR, 'active')  # Журналы незавершенных сессий
+JOURNAL_ARCHIVE_DIR = os.path.join(JOURNAL_DIR, 'archive')  # Журнал аудита завершенных сессий по дням
+JOURNAL_FLUSH_INTERVAL = 0.5  # Не дольше этого события ждут записи на диск, в секундах
+JOURNAL_GROUP_SIZE = 64  # При таком числе событий в буфере запись начинается сразу
+JOURNAL_RETENTION_DAYS = int(os.getenv('JOURNAL_RETENTION_DAYS', '365'))  # Сколько дней хранится архив аудита
+
+# Буферы событий, еще не записанных на диск: session_id -> [строки]
+_buffers = {}
+_buffer_lock = threading.Lock()
+# Запись на диск выполняется по одной, чтобы не перемешать порядок строк
+_flush_lock = threading.Lock()
+_flush_requested = asyncio.Event()
+
+def _active_path(session_id):
+    """Путь к журналу активной сессии"""
+    return os.path.join(JOURNAL_ACTIVE_DIR, f"{session_id}.jsonl")
+
+def _buffer_event(session_id, user_id, event, fields):
+    """Сериализовать событие в буфер; возвращает число событий в буферах"""
+    entry = {'t': round(time.time(), 3), 'ev': event, 'u': user_id}
+    entry.update(fields)
+    line = json.dumps(entry, ensure_ascii=False, separators=(',', ':'))
+    with _buffer_lock:
+        _buffers.setdefault(session_id, []).append(line)
+        return sum(len(lines) for lines in _buffers.values())
+
+def append_event(session_id, user_id, event, **fields):
+    """Добавить событие в журнал сессии (на диск попадает групповой записью)"""
+    if _buffer_event(session_id, user_id, event, fields) >= JOURNAL_GROUP_SIZE:
+        _flush_requested.set()
+
+def log_start(session_id, user_id, catalog_version):
+    """Начало сессии"""
+    append_event(session_id, user_id, 'start', catalog=catalog_version)
+
+def log_meta(session_id, user_id, **fields):
+    """Изменение данных сессии: склад, ответственное лицо, телефон, дата"""
+    append_event(session_id, user_id, 'meta', **fields)
+
+def log_quantity(session_id, user_id, product, quantity, previous=None):
+    """Ввод количества: set — первый ввод, change — исправление, clear — удаление"""
+    if quantity is None:
+        event = 'clear'
+    elif previous is None:
+        event = 'set'
+    else:
+        event = 'change'
+    append_event(session_id, user_id, event, p=product, q=quantity, prev=previous)
+
+def flush():
+    """Записать накопленные события на диск одной операцией на файл"""
+    with _flush_lock:
+        with _buffer_lock:
+            buffers = dict(_buffers)
+            _buffers.clear()
+        if not buffers:
+            return 0
+        os.makedirs(JOURNAL_ACTIVE_DIR, exist_ok=True)
+        for session_id, lines in buffers.items():
+            with open(_active_path(session_id), 'a', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+        return sum(len(lines) for lines in buffers.values())
+
+def close_session(session_id, user_id, reason):
+    """Завершить сессию: записать событие и перенести журнал в архив аудита (блокирующий вызов)"""
+    _buffer_event(session_id, user_id, 'end', {'reason': reason})
+    with _flush_lock:
+        with _buffer_lock:
+            lines = _buffers.pop(session_id, [])
+        os.makedirs(JOURNAL_ARCHIVE_DIR, exist_ok=True)
+        active_path = _active_path(session_id)
+        archive_path = os.path.join(JOURNAL_ARCHIVE_DIR, f"{datetime.now().strftime('%Y-%m-%d')}.jsonl")
+        content = ''
+        if os.path.exists(active_path):
+            with open(active_path, encoding='utf-8') as f:
+                content = f.read()
+        # В архиве строки сессии помечаются ее идентификатором
+        with open(archive_path, 'a', encoding='utf-8') as f:
+            for line in content.splitlines() + lines:
+                if line:
+                    f.write(f'{{"s":"{session_id}",{line[1:]}\n')
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(active_path):
+            os.remove(active_path)
+
+def compact_archive(today=None):
+    """Сжать архивы аудита прошлых дней в .jsonl.gz и удалить архивы старше JOURNAL_RETENTION_DAYS
+    (блокирующий вызов); возвращает (сжато, удалено)"""
+    today = today or date.today()
+    if not os.path.isdir(JOURNAL_ARCHIVE_DIR):
+        return 0, 0
+    compressed = removed = 0
+    for name in sorted(os.listdir(JOURNAL_ARCHIVE_DIR)):
+        day_text, _, extension = name.partition('.')
+        try:
+            age = (today - datetime.strptime(day_text, '%Y-%m-%d').date()).days
+        except ValueError:
+            continue
+        path = os.path.join(JOURNAL_ARCHIVE_DIR, name)
+        if age > JOURNAL_RETENTION_DAYS:
+            os.remove(path)
+            removed += 1
+        elif extension == 'jsonl' and age > 1:
+            # Вчерашний архив еще может дописываться сессией, закрытой около полуночи
+            with open(path, 'rb') as source, gzip.open(f"{path}.gz", 'wb') as target:
+                shutil.copyfileobj(source, target)
+            os.remove(path)
+            compressed += 1
+    return compressed, removed
+
+def replay_session(path):
+    """Восстановить состояние сессии из журнала"""
+    state = {'session_id': os.path.basename(path)[:-len('.jsonl')], 'meta': {}, 'quantities': {}}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Недописанная последняя строка после сбоя
+                logging.warning("Пропущена поврежденная строка журнала %s", path)
+                continue
+            event = entry['ev']
+            state['user_id'] = entry['u']
+            if event == 'start':
+                state['catalog'] = entry.get('catalog')
+            elif event == 'meta':
+                state['meta'].update({k: v for k, v in entry.items() if k not in ('t', 'ev', 'u')})
+            elif event in ('set', 'change'):
+                state['quantities'][entry['p']] = entry['q']
+            elif event == 'clear':
+                state['quantities'].pop(entry['p'], None)
+            elif event == 'end':
+                return None
+    return state
+
+def replay_sessions():
+    """Восстановить все незавершенные сессии после перезапуска"""
+    if not os.path.isdir(JOURNAL_ACTIVE_DIR):
+        return []
+    started = time.perf_counter()
+    states = []
+    events = 0
+    # В порядке изменения: при нескольких сессиях пользователя последней остается самая свежая
+    paths = sorted(
+        (os.path.join(JOURNAL_ACTIVE_DIR, name) for name in os.listdir(JOURNAL_ACTIVE_DIR) if name.endswith('.jsonl')),
+        key=os.path.getmtime
+    )
+    for path in paths:
+        try:
+            state = replay_session(path)
+        except OSError as e:
+            logging.error("Не удалось прочитать журнал %s: %s", path, e)
+            continue
+        if state and 'user_id' in state:
+            states.append(state)
+            events += len(state['quantities'])
+    logging.info(
+        "Восстановлено сессий из журнала: %s (%s товаров) за %.1f мс",
+        len(states), events, (time.perf_counter() - started) * 1000
+    )
+    return states
+
+async def run_journal_flusher():
+    """Фоновая групповая запись журнала: по таймеру или при заполнении буфера"""
+    while True:
+        try:
+            await asyncio.wait_for(_flush_requested.wait(), JOURNAL_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _flush_requested.clear()
+        try:
+            await asyncio.to_thread(flush)
+        except Exception as e:
+            logging.error("Ошибка записи журнала: %s", e)
@@ -0,0 +1,129 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import contextvars
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from dotenv import load_dotenv
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Константы
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')  # json — по записи JSON в строке, text — прежний текстовый формат
+# Доля записей INFO и DEBUG, которые сохраняются для частых категорий (имя логгера=доля через запятую);
+# предупреждения и ошибки пишутся всегда
+LOG_SAMPLING = os.getenv('LOG_SAMPLING', 'httpx=0.1,apscheduler=0.1')
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Поля контекста (update_id, user_id, склад), которые попадают в каждую запись;
+# задачи asyncio и asyncio.to_thread получают копию контекста, в котором созданы
+log_context = contextvars.ContextVar('log_context', default={})
+# Поля процесса (номер процесса бота)
+process_fields = {}
+_listener = {'listener': None}
+
+def bind(**fields):
+    """Добавить поля в контекст логирования текущего обновления или задачи"""
+    log_context.set({**log_context.get(), **{key: value for key, value in fields.items() if value is not None}})
+
+def clear_context():
+    """Начать контекст логирования нового обновления"""
+    log_context.set({})
+
+def parse_sampling(value):
+    """Доли сохраняемых записей по категориям из строки вида 'httpx=0.1,sheets=0.5'"""
+    rates = {}
+    for part in value.split(','):
+        name, sep, rate = part.partition('=')
+        if sep and name.strip():
+            rates[name.strip()] = float(rate)
+    return rates
+
+class ContextFilter(logging.Filter):
+    """Переносит поля контекста в запись: фильтр работает в потоке, где вызван логгер"""
+
+    def filter(self, record):
+        record.context = {**process_fields, **log_context.get()}
+        return True
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только долю записей INFO и DEBUG частых категорий"""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def _rate(self, name):
+        # Категория — имя логгера или его родителя: 'httpx' действует и на 'httpx._client'
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition('.')[0]
+        return None
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        return rate is None or random.random() < rate
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler без форматирования в потоке вызова. Стандартный prepare() форматирует запись
+    и убирает exc_info; здесь подставляются только аргументы сообщения (объекты могут измениться
+    до вывода), а строку записи и трассировку собирает поток вывода"""
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+class JsonFormatter(logging.Formatter):
+    """Запись лога одной строкой JSON"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'context', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def setup_logging(**fields):
+    """Логирование через очередь: обработчики пишут записи, а вывод выполняет отдельный поток.
+    fields — постоянные поля процесса. Повторный вызов только обновляет поля"""
+    process_fields.update(fields)
+    if _listener['listener'] is not None:
+        return
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT))
+    records = queue.SimpleQueue()
+    # Фильтры работают в потоке вызова, форматирование — в потоке вывода
+    handler = DeferredQueueHandler(records)
+    handler.addFilter(SamplingFilter(parse_sampling(LOG_SAMPLING)))
+    handler.addFilter(ContextFilter())
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    listener = QueueListener(records, output, respect_handler_level=True)
+    listener.start()
+    _listener['listener'] = listener
+    atexit.register(stop_logging)
+
+def stop_logging():
+    """Дописать оставшиеся записи и остановить поток вывода"""
+    listener = _listener['listener']
+    if listener is not None:
+        _listener['listener'] = None
+        listener.stop()
@@ -0,0 +1,296 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from dotenv import load_dotenv
+from sheets import (
+    get_google_sheets_service, get_drive_service, save_inventory, save_inventory_ledger,
+    update_inventory_rows, find_saved_inventory, is_transport_error, describe_error
+)
+from catalog import split_unit, iter_quantities
+from report import invalidate_warehouse
+from variance import variance_hook
+from history import record_inventory
+from logconfig import bind
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Константы
+OFFLINE_STORE_DIR = os.getenv('OFFLINE_STORE_DIR', 'offline_store')
+# Записи, которые Google отклоняет не из-за связи: разбираются вручную
+OFFLINE_FAILED_DIR = os.getenv('OFFLINE_FAILED_DIR', os.path.join(OFFLINE_STORE_DIR, 'failed'))
+SYNC_MAX_ERRORS = int(os.getenv('SYNC_MAX_ERRORS', '5'))  # После стольких ошибок не связи запись откладывается в OFFLINE_FAILED_DIR
+SYNC_CONCURRENCY = int(os.getenv('SYNC_CONCURRENCY', '3'))  # Сколько складов синхронизируем одновременно
+HEALTH_CHECK_INTERVAL = 30  # Интервал проверки доступности Google в секундах
+HEALTH_CHECK_TIMEOUT = 15  # Таймаут проверки доступности в секундах
+
+# Состояние доступности Google
+google_status = {
+    'available': True,
+    'checked_at': 0.0
+}
+
+def is_google_available():
+    """Доступен ли Google по результатам последней проверки. Отметка о недоступности действует
+    HEALTH_CHECK_INTERVAL секунд: проверку в фоне выполняет только первый процесс, остальные
+    после этого срока пробуют сохранить в Google сами"""
+    return google_status['available'] or time.time() - google_status['checked_at'] >= HEALTH_CHECK_INTERVAL
+
+def mark_google_unavailable():
+    """Отметить Google как недоступный до следующей успешной проверки или на HEALTH_CHECK_INTERVAL секунд"""
+    if google_status['available']:
+        logging.warning("Google недоступен, включаем офлайн-режим")
+    google_status['available'] = False
+    google_status['checked_at'] = time.time()
+
+def editing_changes(session):
+    """Товары, количество которых изменилось при редактировании сохраненной инвентаризации:
+    строки [номер строки листа или None, название, количество или None, единица] в порядке каталога"""
+    editing = session['editing']
+    changes = []
+    for product in session['catalog'].products:
+        quantity = session['quantities'][product.id]
+        quantity = quantity if quantity == quantity else None
+        if quantity != editing['original'].get(product.display):
+            changes.append([editing['rows'].get(product.display), product.name, quantity, product.unit])
+    return changes
+
+def build_record(user_id, chat_id, session):
+    """Сформировать запись инвентаризации для сохранения.
+    ID записи — ID сессии: повторное сохранение той же сессии находит уже записанный лист"""
+    record = {
+        'id': session.get('session_id') or uuid.uuid4().hex,
+        'created_at': time.time(),
+        'user_id': user_id,
+        'chat_id': chat_id,
+        'warehouse': session['warehouse'],
+        'date': session['date'],
+        'name': session['name'],
+        'phone': session['phone'],
+        # Строки [название, количество, единица измерения] в порядке каталога
+        'items': [
+            [product.name, quantity, product.unit]
+            for product, quantity in iter_quantities(session['catalog'], session['quantities'])
+        ]
+    }
+    editing = session.get('editing')
+    if editing:
+        # Исправление сохраненной инвентаризации: на лист пишутся только изменения,
+        # а строки товаров не из каталога остаются на листе и в истории
+        record['editing'] = {key: editing[key] for key in ('spreadsheet_id', 'sheet_title', 'ledger', 'next_row')}
+        record['changes'] = editing_changes(session)
+        record['items'].extend(editing['extra'])
+    return record
+
+def record_items(record):
+    """Строки записи; записи старого формата хранят пары (полное название, количество)"""
+    if 'items' in record:
+        return record['items']
+    items = []
+    for product, quantity in record['inventory_data']:
+        name, unit = split_unit(product)
+        items.append([name, quantity, unit])
+    return items
+
+def push_record(record, progress=None):
+    """Отправить запись инвентаризации в Google Sheets (блокирующий вызов);
+    расхождения с предыдущей инвентаризацией склада попадают в record['variance'],
+    progress(текст) получает этапы сохранения. Ошибки пробрасываются"""
+    bind(warehouse=record['warehouse'], record_id=record['id'])
+    items = record_items(record)
+    editing = record.get('editing')
+    if editing and editing['ledger']:
+        # Журнал только дописывается: исправленная инвентаризация записывается целиком и заменяет прежнюю.
+        # Повтор после успешной записи находит ее по ID записи и не дописывает еще раз
+        service = get_google_sheets_service()
+        sheet_title = find_saved_inventory(service, editing['spreadsheet_id'], record['id']) or save_inventory_ledger(
+            service, editing['spreadsheet_id'], record['warehouse'], record['date'],
+            record['name'], record['phone'], items, editing_sheet=editing['sheet_title'], inventory_id=record['id'],
+            progress=progress
+        )
+    elif editing:
+        if progress:
+            progress(f"✍️ Записываем изменения: {len(record['changes'])}…")
+        update_inventory_rows(
+            get_google_sheets_service(), editing['spreadsheet_id'], editing['sheet_title'],
+            record['changes'], editing['next_row']
+        )
+        sheet_title = editing['sheet_title']
+    else:
+        sheet_title = save_inventory(
+            get_google_sheets_service(),
+            get_drive_service(),
+            record['warehouse'],
+            record['date'],
+            record['name'],
+            record['phone'],
+            items,
+            prepare_requests=variance_hook(record, items),
+            inventory_id=record['id'],
+            progress=progress
+        )
+    # Сводный отчет должен учесть новую инвентаризацию
+    invalidate_warehouse(record['warehouse'])
+    record_inventory(record, sheet_title, items)
+    return True
+
+def _write_record(path, record):
+    """Записать запись в файл атомарно: она либо есть целиком, либо ее нет"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def save_pending(record):
+    """Сохранить запись в локальное хранилище до восстановления связи"""
+    os.makedirs(OFFLINE_STORE_DIR, exist_ok=True)
+    # Префикс из времени создания задает порядок отправки
+    file_name = f"{time.time_ns():020d}_{record['id']}.json"
+    path = os.path.join(OFFLINE_STORE_DIR, file_name)
+    _write_record(path, record)
+    logging.info("Инвентаризация %s сохранена локально: %s", record['id'], path)
+    return path
+
+def record_sync_error(path, record, error):
+    """Учесть ошибку отправки записи, не связанную со связью (блокирующий вызов).
+    После SYNC_MAX_ERRORS ошибок запись переносится в OFFLINE_FAILED_DIR; возвращает True, если перенесена"""
+    record['sync_errors'] = record.get('sync_errors', 0) + 1
+    record['last_error'] = describe_error(error)
+    if record['sync_errors'] < SYNC_MAX_ERRORS:
+        _write_record(path, record)
+        return False
+    os.makedirs(OFFLINE_FAILED_DIR, exist_ok=True)
+    failed_path = os.path.join(OFFLINE_FAILED_DIR, os.path.basename(path))
+    _write_record(failed_path, record)
+    os.remove(path)
+    logging.error(
+        "Запись %s не отправлена после %s ошибок и перенесена в %s: %s",
+        record['id'], record['sync_errors'], failed_path, record['last_error']
+    )
+    return True
+
+def list_pending():
+    """Список локально сохраненных записей в порядке создания"""
+    if not os.path.isdir(OFFLINE_STORE_DIR):
+        return []
+    pending = []
+    for file_name in sorted(os.listdir(OFFLINE_STORE_DIR)):
+        if not file_name.endswith('.json'):
+            continue
+        path = os.path.join(OFFLINE_STORE_DIR, file_name)
+        try:
+            with open(path, encoding='utf-8') as f:
+                pending.append((path, json.load(f)))
+        except (OSError, ValueError) as e:
+            logging.error("Не удалось прочитать локальную запись %s: %s", path, e)
+    return pending
+
+def pending_count():
+    """Количество записей, ожидающих отправки"""
+    if not os.path.isdir(OFFLINE_STORE_DIR):
+        return 0
+    return sum(1 for name in os.listdir(OFFLINE_STORE_DIR) if name.endswith('.json'))
+
+def _probe():
+    """Дешевый запрос к Google Drive для проверки доступности"""
+    get_drive_service().about().get(fields='user(emailAddress)').execute()
+
+async def probe_google():
+    """Проверить доступность Google и обновить состояние"""
+    try:
+        await asyncio.wait_for(asyncio.to_thread(_probe), HEALTH_CHECK_TIMEOUT)
+        if not google_status['available']:
+            logging.info("Связь с Google восстановлена")
+        google_status['available'] = True
+    except Exception as e:
+        logging.warning("Google недоступен: %s", e)
+        google_status['available'] = False
+    google_status['checked_at'] = time.time()
+    return google_status['available']
+
+async def _notify(bot, record):
+    """Сообщить пользователю, что инвентаризация появилась в Google Sheets"""
+    try:
+        await bot.send_message(
+            chat_id=record['chat_id'],
+            text=(
+                f"✅ Инвентаризация склада {record['warehouse']} от {record['date']} "
+                f"отправлена в Google Sheets"
+            )
+        )
+    except Exception as e:
+        logging.error("Error notifying user %s: %s", record['user_id'], e)
+
+async def _notify_failed(bot, record):
+    """Сообщить пользователю, что инвентаризацию не удалось отправить в Google Sheets"""
+    try:
+        await bot.send_message(
+            chat_id=record['chat_id'],
+            text=(
+                f"❌ Инвентаризацию склада {record['warehouse']} от {record['date']} не удалось "
+                f"отправить в Google Sheets: {record['last_error']}. Данные сохранены на сервере бота, "
+                f"обратитесь к администратору."
+            )
+        )
+    except Exception as e:
+        logging.error("Error notifying user %s: %s", record['user_id'], e)
+
+async def _drain_warehouse(bot, records, semaphore):
+    """Отправить записи одного склада строго по порядку.
+    При сбое связи следующие записи склада ждут текущую; запись, которую Google отклоняет по другой причине,
+    повторяется до SYNC_MAX_ERRORS раз, затем откладывается, и очередь склада идет дальше"""
+    async with semaphore:
+        for path, record in records:
+            try:
+                await asyncio.to_thread(push_record, record)
+            except Exception as e:
+                logging.error("Ошибка синхронизации записи %s: %s", record['id'], e)
+                if is_transport_error(e):
+                    mark_google_unavailable()
+                    return
+                if not await asyncio.to_thread(record_sync_error, path, record, e):
+                    # Запись повторится при следующей синхронизации, порядок склада сохраняется
+                    return
+                await _notify_failed(bot, record)
+                continue
+
+            os.remove(path)
+            logging.info("Запись %s синхронизирована с Google Sheets", record['id'])
+            await _notify(bot, record)
+
+async def sync_pending(bot):
+    """Отправить накопленные записи: склады параллельно, записи склада по порядку"""
+    pending = list_pending()
+    if not pending:
+        return 0
+
+    by_warehouse = OrderedDict()
+    for path, record in pending:
+        by_warehouse.setdefault(record['warehouse'], []).append((path, record))
+
+    logging.info("Синхронизация %s записей для %s складов", len(pending), len(by_warehouse))
+    semaphore = asyncio.Semaphore(SYNC_CONCURRENCY)
+    await asyncio.gather(*(
+        _drain_warehouse(bot, records, semaphore)
+        for records in by_warehouse.values()
+    ))
+    return len(pending) - pending_count()
+
+async def run_sync_engine(bot):
+    """Фоновый цикл: проверка доступности Google и отправка накопленных записей"""
+    while True:
+        try:
+            if pending_count() or not google_status['available']:
+                if await probe_google():
+                    await sync_pending(bot)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error("Error in sync engine: %s", e)
+        await asyncio.sleep(HEALTH_CHECK_INTERVAL)
@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import fcntl
+import logging
+from contextlib import contextmanager
+import threading
+from functools import lru_cache
+from config import WAREHOUSE_PROFILES, LEARNED_PROFILES_FILE, LEARNED_PROFILES_ENABLED
+
+PROFILE_PATH_SEPARATOR = ' > '  # Разделитель уровней в путях правил профиля
+LEARNED_CHECK_INTERVAL = 5  # Как часто проверять, не дополнил ли файл обученных профилей другой процесс, в секундах
+
+# Товары, встречавшиеся в инвентаризациях склада: warehouse -> set(названий)
+learned_items = {}
+learned_lock = threading.Lock()
+# Номер версии обученных профилей; меняется при каждом обновлении
+learned_version = {'value': 0}
+# Признак файла на момент последнего чтения или записи и время последней проверки
+learned_file = {'signature': None, 'checked_at': 0.0}
+
+def _parse_rules(rules):
+    """Преобразовать пути правил в кортежи"""
+    return [tuple(part.strip() for part in rule.split(PROFILE_PATH_SEPARATOR)) for rule in rules or []]
+
+def _matches(rules, item_path):
+    """Попадает ли путь товара под одно из правил (правило — префикс пути)"""
+    return any(item_path[:len(rule)] == rule for rule in rules)
+
+class CatalogView:
+    """Каталог, отфильтрованный по профилю склада; интерфейс совпадает с Catalog"""
+
+    def __init__(self, catalog, warehouse, visible_items):
+        self.catalog = catalog
+        self.warehouse = warehouse
+        self.version = catalog.version
+        self.products = catalog.products
+        self.product_index = catalog.product_index
+        self.product_by_name = catalog.product_by_name
+        self.nodes = []
+        self.node_by_path = {}
+        # Узлы идут в порядке обхода в глубину, поэтому потомки стоят после родителя
+        has_items = [False] * len(catalog.nodes)
+        for node in reversed(catalog.nodes):
+            has_items[node['id']] = bool(visible_items[node['id']]) or any(
+                has_items[child_id] for child_id in node['children']
+            )
+        id_map = {}
+        for node in catalog.nodes:
+            if node['id'] and not has_items[node['id']]:
+                continue
+            id_map[node['id']] = len(self.nodes)
+            self.node_by_path[node['path']] = len(self.nodes)
+            self.nodes.append({
+                'id': len(self.nodes),
+                'name': node['name'],
+                'path': node['path'],
+                'children': [child_id for child_id in node['children'] if has_items[child_id]],
+                'items': visible_items[node['id']]
+            })
+        for node in self.nodes:
+            node['children'] = [id_map[child_id] for child_id in node['children']]
+        self.filtered = sum(len(node['items']) for node in catalog.nodes) != sum(
+            len(node['items']) for node in self.nodes
+        )
+
+    @property
+    def categories(self):
+        """Названия корневых категорий"""
+        return [self.nodes[child_id]['name'] for child_id in self.nodes[0]['children']]
+
+    def get_node(self, path):
+        """Узел по пути из названий категорий"""
+        return self.nodes[self.node_by_path[tuple(path)]]
+
+    def get_child(self, path, index):
+        """Дочерняя категория узла по ее порядковому номеру"""
+        return self.nodes[self.get_node(path)['children'][index]]
+
+    def find_product(self, name, unit=""):
+        """Номер товара по названию и единице измерения или None"""
+        return self.catalog.find_product(name, unit)
+
+def _use_learned(profile):
+    """Включен ли обученный профиль для склада"""
+    return profile.get('learned', LEARNED_PROFILES_ENABLED)
+
+@lru_cache(maxsize=256)
+def _compile_view(catalog, warehouse, version):
+    """Скомпилировать представление каталога для склада (кэшируется по версии)"""
+    profile = WAREHOUSE_PROFILES.get(warehouse, {})
+    allow = _parse_rules(profile.get('allow'))
+    deny = _parse_rules(profile.get('deny'))
+    learned = learned_items.get(warehouse) if _use_learned(profile) else None
+
+    visible_items = []
+    for node in catalog.nodes:
+        items = []
+        for product_id in node['items']:
+            title = catalog.products[product_id].display
+            item_path = node['path'] + (title,)
+            if allow and not _matches(allow, item_path):
+                continue
+            if deny and _matches(deny, item_path):
+                continue
+            if learned and title not in learned:
+                continue
+            items.append(product_id)
+        visible_items.append(items)
+
+    view = CatalogView(catalog, warehouse, visible_items)
+    logging.info(
+        "Профиль каталога для склада %s: %s из %s товаров",
+        warehouse, len({product_id for node in view.nodes for product_id in node['items']}), len(catalog.products)
+    )
+    return view
+
+def get_catalog_view(catalog, warehouse):
+    """Представление каталога для склада с учетом его профиля"""
+    profile = WAREHOUSE_PROFILES.get(warehouse, {})
+    if _use_learned(profile):
+        reload_learned_profiles_if_changed()
+        version = learned_version['value']
+    else:
+        version = 0
+    return _compile_view(catalog, warehouse, version)
+
+def _file_signature():
+    """Признак изменения файла обученных профилей или None, если файла нет"""
+    try:
+        stat = os.stat(LEARNED_PROFILES_FILE)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+@contextmanager
+def _file_lock():
+    """Блокировка файла обученных профилей между процессами бота"""
+    with open(LEARNED_PROFILES_FILE + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _read_file():
+    """Обученные профили из файла: warehouse -> set(названий)"""
+    if not os.path.exists(LEARNED_PROFILES_FILE):
+        return {}
+    with open(LEARNED_PROFILES_FILE, encoding='utf-8') as f:
+        return {warehouse: set(items) for warehouse, items in json.load(f).items()}
+
+def _merge(data):
+    """Добавить товары из файла к известным процессу; вызывается под learned_lock"""
+    changed = False
+    for warehouse, items in data.items():
+        known = learned_items.setdefault(warehouse, set())
+        if not items <= known:
+            known.update(items)
+            changed = True
+    if changed:
+        learned_version['value'] += 1
+    return changed
+
+def load_learned_profiles():
+    """Загрузить обученные профили складов из файла"""
+    try:
+        with learned_lock:
+            learned_file['signature'] = _file_signature()
+            learned_file['checked_at'] = time.monotonic()
+            _merge(_read_file())
+    except (OSError, ValueError) as e:
+        logging.error("Ошибка загрузки обученных профилей: %s", e)
+
+def reload_learned_profiles_if_changed():
+    """Дочитать товары, которые другие процессы добавили в файл; файл проверяется
+    не чаще раза в LEARNED_CHECK_INTERVAL секунд"""
+    if time.monotonic() - learned_file['checked_at'] < LEARNED_CHECK_INTERVAL:
+        return
+    learned_file['checked_at'] = time.monotonic()
+    if _file_signature() != learned_file['signature']:
+        load_learned_profiles()
+
+def record_learned_items(warehouse, items):
+    """Добавить товары из сохраненной инвентаризации в обученный профиль склада.
+    Файл общий для процессов: под блокировкой файла он перечитывается, и новые товары
+    добавляются к записанным другими процессами, а не заменяют их"""
+    with learned_lock:
+        if set(items) <= learned_items.get(warehouse, set()):
+            return False
+        with _file_lock():
+            data = _read_file()
+            for name, values in learned_items.items():
+                data.setdefault(name, set()).update(values)
+            new_items = set(items) - data.setdefault(warehouse, set())
+            if new_items:
+                data[warehouse].update(new_items)
+                tmp_path = f"{LEARNED_PROFILES_FILE}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({name: sorted(values) for name, values in data.items()}, f, ensure_ascii=False)
+                os.replace(tmp_path, LEARNED_PROFILES_FILE)
+        _merge(data)
+    if not new_items:
+        return False
+    logging.info("В профиль склада %s добавлено товаров: %s", warehouse, len(new_items))
+    return True
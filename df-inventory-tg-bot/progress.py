@@ -0,0 +1,54 @@
+import asyncio
+import logging
+from telegram.error import TelegramError
+
+# Константы
+PROGRESS_EDIT_INTERVAL = 2.0  # Не чаще одного редактирования сообщения о ходе операции за столько секунд
+
+class Progress:
+    """Сообщение о ходе долгой операции.
+    stage() можно вызывать из рабочих потоков: текст только запоминается, а сообщение
+    редактируется из цикла событий не чаще раза в PROGRESS_EDIT_INTERVAL секунд"""
+
+    def __init__(self, message, interval=PROGRESS_EDIT_INTERVAL):
+        self.message = message
+        self.interval = interval
+        self.text = message.text
+        self.shown = message.text
+        self.task = None
+
+    def stage(self, text):
+        """Запомнить текущий этап; в сообщении он появится при следующем редактировании"""
+        self.text = text
+
+    async def flush(self):
+        """Показать последний этап, если он изменился"""
+        text = self.text
+        if text == self.shown:
+            return
+        try:
+            await self.message.edit_text(text)
+        except TelegramError as e:
+            # Сообщение удалено, уже заменено результатом или Telegram не ответил: этап покажет следующее
+            # редактирование, а сама операция от сообщения о ходе не зависит
+            logging.warning("Не удалось обновить сообщение о ходе операции: %s", e)
+        self.shown = text
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def __aenter__(self):
+        self.task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            # Сбой показа хода не делает операцию неудачной
+            logging.warning("Ошибка обновления сообщения о ходе операции: %s", e)
@@ -0,0 +1,193 @@
+import time
+import asyncio
+import logging
+import itertools
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+# Лимиты Telegram: не более 30 сообщений в секунду на бота,
+# не более 1 сообщения в секунду в личный чат и 20 в минуту в группу
+GLOBAL_RATE = 30
+GLOBAL_BURST = 30
+PRIVATE_CHAT_RATE = 1
+PRIVATE_CHAT_BURST = 3
+GROUP_CHAT_RATE = 20 / 60
+GROUP_CHAT_BURST = 20
+MAX_RETRIES = 3
+STALE_DELETE_AGE = 15  # Удаление, ожидающее дольше этого времени в секундах, отбрасывается
+CHAT_BUCKET_IDLE = 300  # Через сколько секунд простоя забываем состояние чата
+
+# Приоритеты запросов: меньше — важнее
+PRIORITY_ANSWER = 0
+PRIORITY_REPLY = 1
+PRIORITY_DEFAULT = 2
+PRIORITY_COSMETIC = 3
+ENDPOINT_PRIORITIES = {
+    'answerCallbackQuery': PRIORITY_ANSWER,
+    'sendMessage': PRIORITY_REPLY,
+    'editMessageText': PRIORITY_REPLY,
+    'editMessageReplyMarkup': PRIORITY_REPLY,
+    'sendDocument': PRIORITY_REPLY,
+    'deleteMessage': PRIORITY_COSMETIC,
+}
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше capacity про запас"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0  # Пауза после RetryAfter
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """Сколько секунд ждать до появления токена"""
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+class SendScheduler(BaseRateLimiter):
+    """Планировщик исходящих запросов с глобальным и початовыми лимитами и приоритетами"""
+
+    def __init__(self, max_retries=MAX_RETRIES, global_share=1):
+        self.max_retries = max_retries
+        # При нескольких процессах бота каждый получает свою долю общего лимита
+        self._global = TokenBucket(GLOBAL_RATE / global_share, GLOBAL_BURST / global_share)
+        self._chats = {}
+        self._queue = None
+        self._dispatcher = None
+        self._sequence = itertools.count()
+        self.metrics = {
+            'requests': 0,
+            'unlimited': 0,
+            'retry_after': 0,
+            'retries': 0,
+            'dropped_deletes': 0,
+            'failed': 0,
+            'wait_total': 0.0,
+            'wait_max': 0.0,
+            'queue_max': 0,
+        }
+
+    async def initialize(self):
+        self._queue = asyncio.PriorityQueue()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self):
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        logging.info("Статистика отправки в Telegram: %s", self.get_metrics())
+
+    def get_metrics(self):
+        """Снимок метрик планировщика"""
+        metrics = dict(self.metrics)
+        granted = metrics['requests'] - metrics['unlimited']
+        metrics['wait_avg'] = round(metrics['wait_total'] / granted, 3) if granted else 0.0
+        metrics['wait_total'] = round(metrics['wait_total'], 3)
+        metrics['wait_max'] = round(metrics['wait_max'], 3)
+        metrics['queue'] = self._queue.qsize() if self._queue else 0
+        metrics['chats'] = len(self._chats)
+        return metrics
+
+    def _chat_bucket(self, chat_id, now):
+        """Корзина токенов чата"""
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 1000:
+                # Забываем чаты, которые давно не получали сообщений
+                self._chats = {
+                    key: value for key, value in self._chats.items()
+                    if now - value.updated < CHAT_BUCKET_IDLE
+                }
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            if is_group:
+                bucket = TokenBucket(GROUP_CHAT_RATE, GROUP_CHAT_BURST)
+            else:
+                bucket = TokenBucket(PRIVATE_CHAT_RATE, PRIVATE_CHAT_BURST)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def _dispatch(self):
+        """Выдача разрешений на отправку в порядке приоритета"""
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            priority, _, enqueued, chat_id, future = item
+            if future.done():
+                continue
+            now = time.monotonic()
+            if priority == PRIORITY_COSMETIC and now - enqueued > STALE_DELETE_AGE:
+                # Устаревшее удаление не стоит лимитов
+                future.set_result(False)
+                continue
+
+            chat_bucket = self._chat_bucket(chat_id, now)
+            chat_wait = chat_bucket.wait_time(now)
+            if chat_wait > 0:
+                # Чат исчерпал лимит: откладываем запрос, не задерживая другие чаты
+                loop.call_later(chat_wait, self._queue.put_nowait, item)
+                continue
+
+            global_wait = self._global.wait_time(now)
+            if global_wait > 0:
+                await asyncio.sleep(global_wait)
+            self._global.consume()
+            chat_bucket.consume()
+            future.set_result(True)
+
+    async def _acquire(self, priority, chat_id):
+        """Дождаться разрешения на отправку; False — запрос отброшен"""
+        future = asyncio.get_running_loop().create_future()
+        enqueued = time.monotonic()
+        self._queue.put_nowait((priority, next(self._sequence), enqueued, chat_id, future))
+        self.metrics['queue_max'] = max(self.metrics['queue_max'], self._queue.qsize())
+        granted = await future
+        waited = time.monotonic() - enqueued
+        self.metrics['wait_total'] += waited
+        self.metrics['wait_max'] = max(self.metrics['wait_max'], waited)
+        return granted
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        self.metrics['requests'] += 1
+        chat_id = data.get('chat_id')
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+        priority = ENDPOINT_PRIORITIES.get(endpoint, PRIORITY_DEFAULT)
+        max_retries = rate_limit_args if isinstance(rate_limit_args, int) else self.max_retries
+
+        for attempt in range(max_retries + 1):
+            if chat_id is None:
+                # Запросы без чата (ответы на callback) лимитами на сообщения не ограничены
+                self.metrics['unlimited'] += 1
+            elif not await self._acquire(priority, chat_id):
+                self.metrics['dropped_deletes'] += 1
+                return False
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                self.metrics['retry_after'] += 1
+                if attempt == max_retries:
+                    self.metrics['failed'] += 1
+                    logging.error("Telegram RetryAfter для %s: попытки исчерпаны", endpoint)
+                    raise
+                logging.warning("Telegram RetryAfter для %s: пауза %s с", endpoint, e.retry_after)
+                # Пауза для всех запросов: Telegram не уточняет, какой лимит превышен
+                pause_until = time.monotonic() + e.retry_after + 0.1
+                self._global.blocked_until = max(self._global.blocked_until, pause_until)
+                if chat_id is None:
+                    await asyncio.sleep(e.retry_after + 0.1)
+                self.metrics['retries'] += 1
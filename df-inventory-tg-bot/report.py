@@ -0,0 +1,249 @@
+import os
+import time
+import asyncio
+import logging
+import numpy as np
+from dotenv import load_dotenv
+from sheets import (
+    get_google_sheets_service, get_drive_service, list_warehouse_spreadsheets, get_sheet_index,
+    get_inventory_titles, parse_inventory_title, read_inventory_values, INVENTORY_HEADER_ROWS
+)
+from catalog import get_catalog, align_items
+from export import write_csv
+from archive import list_inventories
+from cache import AsyncCache
+from config import WAREHOUSES
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Константы
+REPORT_CONCURRENCY = int(os.getenv('REPORT_CONCURRENCY', '8'))  # Сколько таблиц читаем одновременно
+REPORT_CACHE_TTL = 600  # Сколько секунд отчет считается актуальным без новых сохранений
+
+# Таблицы складов из Google Drive
+spreadsheets_cache = AsyncCache('spreadsheets', maxsize=1, ttl=REPORT_CACHE_TTL, stale_ttl=REPORT_CACHE_TTL)
+# Остатки по складам из последних инвентаризаций: warehouse -> запись склада; None — инвентаризаций нет
+stock_cache = AsyncCache('stock', maxsize=len(WAREHOUSES), ttl=REPORT_CACHE_TTL, negative_ttl=60)
+# Собранный сводный отчет по версии каталога; сбрасывается при сохранении любой инвентаризации
+report_cache = AsyncCache('report', maxsize=1, ttl=REPORT_CACHE_TTL)
+
+def invalidate_warehouse(warehouse):
+    """Сбросить кэш отчета после сохранения инвентаризации склада (из любого потока)"""
+    stock_cache.invalidate(warehouse)
+    report_cache.invalidate()
+
+def _to_float(value):
+    """Количество из ячейки таблицы или None"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace(',', '.'))
+    except ValueError:
+        return None
+
+def sheet_items(rows):
+    """Строки товаров листа инвентаризации как (название, количество, единица)"""
+    for row in rows:
+        if len(row) < 3:
+            continue
+        quantity = _to_float(row[2])
+        if quantity is None:
+            continue
+        yield str(row[1]), quantity, str(row[3]) if len(row) > 3 else ""
+
+def read_stock(service, spreadsheet_id, sheet_title, catalog):
+    """Количества инвентаризации, выровненные по номерам товаров каталога (блокирующий вызов)"""
+    values = read_inventory_values(service, spreadsheet_id, [sheet_title])[0]
+    return align_items(catalog, sheet_items(values[INVENTORY_HEADER_ROWS:]))
+
+def _latest_candidates(service, spreadsheet_id, warehouse):
+    """Инвентаризации склада от новых к старым: сначала рабочая таблица без черновиков, затем архивы"""
+    # Лист, созданный для незавершенного сохранения, еще не заполнен
+    drafts = set(get_sheet_index(service, spreadsheet_id)['drafts'].values())
+    titles = [title for title in get_inventory_titles(service, spreadsheet_id) if title not in drafts]
+    yield from ((spreadsheet_id, title) for title in titles)
+    # Все листы склада могли уйти в архив до того, как последние стали оставаться в рабочей таблице
+    for source_id, title in list_inventories(service, get_drive_service(), warehouse):
+        if source_id != spreadsheet_id:
+            yield source_id, title
+
+def read_latest_stock(spreadsheet_id, warehouse, catalog):
+    """Остатки склада по последней инвентаризации (блокирующий вызов)"""
+    # Свой сервис на поток: клиент Google API не потокобезопасен
+    service = get_google_sheets_service()
+    for source_id, title in _latest_candidates(service, spreadsheet_id, warehouse):
+        values = read_inventory_values(service, source_id, [title])[0]
+        # Черновик другого процесса в индексе этого не отмечен, но у него нет шапки инвентаризации
+        if len(values) >= INVENTORY_HEADER_ROWS:
+            break
+    else:
+        return None
+    quantities, extra = align_items(catalog, sheet_items(values[INVENTORY_HEADER_ROWS:]))
+    return {
+        'title': title,
+        'date': parse_inventory_title(title)[0],
+        'catalog': catalog,
+        'loaded_at': time.time(),
+        'quantities': quantities,
+        'extra': extra
+    }
+
+def aggregate(catalog, stocks):
+    """Свести остатки складов: итоги (NaN — товар нигде не посчитан) и число складов по каждому товару.
+    Массивы количеств складов складываются как матрица склады × товары"""
+    # Массивы array('d') читаются без копирования
+    matrix = np.vstack(
+        [np.frombuffer(entry['quantities'], dtype=float) for entry in stocks.values()]
+        or [np.full(len(catalog.products), np.nan)]
+    )
+    present = ~np.isnan(matrix)
+    counted = present.sum(axis=0)
+    totals = np.where(counted > 0, np.where(present, matrix, 0.0).sum(axis=0), np.nan)
+    extra = {}
+    for warehouse, entry in stocks.items():
+        for key, quantity in entry['extra'].items():
+            extra.setdefault(key, {})[warehouse] = quantity
+    return totals, counted, extra
+
+def _list_spreadsheets():
+    """Таблицы складов (блокирующий вызов)"""
+    return list_warehouse_spreadsheets(get_drive_service())
+
+async def load_stock(warehouse, spreadsheet_id, catalog):
+    """Остатки склада из кэша или из последней инвентаризации"""
+    def loader():
+        return asyncio.to_thread(read_latest_stock, spreadsheet_id, warehouse, catalog)
+    entry = await stock_cache.get(warehouse, loader)
+    if entry is not None and entry['catalog'] is not catalog:
+        # Остатки выровнены по прежней версии каталога
+        stock_cache.invalidate(warehouse)
+        entry = await stock_cache.get(warehouse, loader)
+    return entry
+
+async def build_report(progress=None):
+    """Сводный отчет по последним инвентаризациям всех складов; progress(текст) получает число прочитанных складов.
+    Одновременные запросы ждут одну сборку отчета"""
+    catalog = get_catalog()
+    report = await report_cache.get(catalog.version, lambda: _build_report(catalog, progress))
+    if report['errors']:
+        # Отчет с ошибками чтения не кэшируем: следующий запрос повторит попытку
+        report_cache.invalidate(catalog.version)
+    return report
+
+async def _build_report(catalog, progress):
+    started = time.perf_counter()
+    spreadsheets = await spreadsheets_cache.get('all', lambda: asyncio.to_thread(_list_spreadsheets))
+    semaphore = asyncio.Semaphore(REPORT_CONCURRENCY)
+    errors = []
+    warehouses = [warehouse for warehouse in WAREHOUSES if warehouse in spreadsheets]
+    stocks = {}
+    loaded = [0]
+
+    async def load(warehouse):
+        async with semaphore:
+            try:
+                entry = await load_stock(warehouse, spreadsheets[warehouse], catalog)
+            except Exception as e:
+                logging.error("Ошибка чтения остатков склада %s: %s", warehouse, e)
+                errors.append(warehouse)
+                entry = None
+        if entry:
+            stocks[warehouse] = entry
+        loaded[0] += 1
+        if progress:
+            progress(f"📦 Прочитано складов: {loaded[0]} из {len(warehouses)}")
+
+    await asyncio.gather(*(load(warehouse) for warehouse in warehouses))
+
+    # Порядок складов — как в списке складов
+    stocks = {warehouse: stocks[warehouse] for warehouse in warehouses if warehouse in stocks}
+    totals, counted, extra = aggregate(catalog, stocks)
+    report = {
+        'catalog': catalog,
+        'loaded_at': time.time(),
+        'stocks': stocks,
+        'totals': totals,
+        'counted': counted,
+        'extra': extra,
+        'missing': [warehouse for warehouse in WAREHOUSES if warehouse not in stocks and warehouse not in errors],
+        'errors': errors
+    }
+    logging.info(
+        "Сводный отчет: %s складов за %.0f мс", len(stocks), (time.perf_counter() - started) * 1000
+    )
+    return report
+
+async def refresh_caches(within):
+    """Заранее перечитать таблицы, остатки и отчет, срок которых истекает в ближайшие within секунд,
+    чтобы пользователи не ждали обновления; возвращает число обновленных записей"""
+    refreshed = 0
+    if spreadsheets_cache.expiring(within):
+        await spreadsheets_cache.refresh('all', lambda: asyncio.to_thread(_list_spreadsheets))
+        refreshed += 1
+    spreadsheets = spreadsheets_cache.peek('all') or {}
+    catalog = get_catalog()
+    semaphore = asyncio.Semaphore(REPORT_CONCURRENCY)
+
+    async def refresh_stock(warehouse):
+        async with semaphore:
+            try:
+                await stock_cache.refresh(
+                    warehouse, lambda: asyncio.to_thread(read_latest_stock, spreadsheets[warehouse], warehouse, catalog)
+                )
+            except Exception as e:
+                # Прежнее значение остается в кэше до истечения срока
+                logging.error("Ошибка обновления остатков склада %s: %s", warehouse, e)
+
+    warehouses = [warehouse for warehouse in stock_cache.expiring(within) if warehouse in spreadsheets]
+    await asyncio.gather(*(refresh_stock(warehouse) for warehouse in warehouses))
+    refreshed += len(warehouses)
+    if catalog.version in report_cache.expiring(within):
+        report = await report_cache.refresh(catalog.version, lambda: _build_report(catalog, None))
+        if report['errors']:
+            report_cache.invalidate(catalog.version)
+        refreshed += 1
+    return refreshed
+
+def report_summary(report):
+    """Строки сводки отчета: сколько складов учтено, без инвентаризаций и с ошибками чтения"""
+    lines = [f"📦 Остатки по последним инвентаризациям: {len(report['stocks'])} из {len(WAREHOUSES)} складов"]
+    if report['missing']:
+        lines.append(f"Нет инвентаризаций: {len(report['missing'])}")
+    if report['errors']:
+        lines.append(f"⚠️ Не удалось прочитать: {', '.join(report['errors'])}")
+    return lines
+
+def format_quantity(quantity):
+    """Количество без лишних нулей"""
+    return f"{quantity:.3f}".rstrip('0').rstrip('.')
+
+def find_report_products(report, text):
+    """Товары отчета, в названии которых встречается текст"""
+    text = text.lower()
+    catalog = report['catalog']
+    return [
+        product_id for product_id, product in enumerate(catalog.products)
+        if report['counted'][product_id] and text in product.display.lower()
+    ]
+
+def write_report_csv(report):
+    """Сводный отчет в CSV: товар, итог и остатки по складам"""
+    warehouses = list(report['stocks'])
+    header = ['Продукт', 'Единица измерения', 'Итого'] + warehouses
+
+    def rows():
+        for product_id, product in enumerate(report['catalog'].products):
+            if not report['counted'][product_id]:
+                continue
+            row = [product.name, product.unit, report['totals'][product_id]]
+            for warehouse in warehouses:
+                quantity = report['stocks'][warehouse]['quantities'][product_id]
+                row.append("" if quantity != quantity else quantity)
+            yield row
+        for (name, unit), by_warehouse in sorted(report['extra'].items()):
+            row = [name, unit, sum(by_warehouse.values())]
+            row.extend(by_warehouse.get(warehouse, "") for warehouse in warehouses)
+            yield row
+
+    return write_csv(rows(), header=header)
@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import closing
+from dotenv import load_dotenv
+from catalog import get_catalog, new_quantities, iter_quantities
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Константы
+SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'memory')  # memory, sqlite или redis
+SESSION_URL = os.getenv('SESSION_URL', 'sessions.sqlite3')  # Файл SQLite или адрес redis://
+SESSION_TTL = 7 * 24 * 3600  # Сколько секунд хранится сессия без изменений
+
+# Поля сессии, которые не переживают передачу между процессами
+LOCAL_FIELDS = ('catalog', 'catalog_view', 'quantities')
+
+def build_session(session_id, fields, quantities):
+    """Сессия из сохраненных полей и количеств по полным названиям товаров.
+    Количества выравниваются по актуальному каталогу; товары, которых в нем нет, пропускаются"""
+    catalog = get_catalog()
+    session = {
+        'session_id': session_id,
+        'catalog': catalog,
+        'quantities': new_quantities(catalog),
+        'category_path': []
+    }
+    session.update(fields)
+    if 'current_product' in session:
+        # Товар, для которого вводится количество, хранится по названию, как и количества
+        product_id = catalog.product_index.get(session['current_product'])
+        if product_id is None:
+            del session['current_product']
+            session['step'] = 'selecting_category'
+        else:
+            session['current_product'] = product_id
+    for title, quantity in quantities.items():
+        product_id = catalog.product_index.get(title)
+        if product_id is None:
+            logging.warning("Товар '%s' отсутствует в каталоге, пропускаем при восстановлении", title)
+            continue
+        session['quantities'][product_id] = quantity
+    return session
+
+def dump_session(session):
+    """Сессия в JSON; количества хранятся по полным названиям, чтобы пережить смену версии каталога"""
+    fields = {key: value for key, value in session.items() if key not in LOCAL_FIELDS}
+    # Незавершенное сохранение принадлежит процессу, который его выполняет
+    if fields.get('save_state') == 'saving':
+        del fields['save_state']
+    quantities = {}
+    if 'catalog' in session:
+        if 'current_product' in fields:
+            fields['current_product'] = session['catalog'].products[fields['current_product']].display
+        quantities = {
+            product.display: quantity
+            for product, quantity in iter_quantities(session['catalog'], session['quantities'])
+        }
+    return json.dumps({'fields': fields, 'quantities': quantities}, ensure_ascii=False)
+
+def load_session(data):
+    """Сессия из JSON, записанного dump_session"""
+    state = json.loads(data)
+    fields = state['fields']
+    return build_session(fields.pop('session_id', None), fields, state['quantities'])
+
+class MemorySessionStore:
+    """Сессии в памяти процесса: режим одного процесса, хранилище не используется"""
+
+    shared = False
+
+    def get(self, user_id):
+        return None
+
+    def put(self, user_id, data):
+        pass
+
+    def delete(self, user_id):
+        pass
+
+    def evict(self):
+        return 0
+
+class SqliteSessionStore:
+    """Сессии в файле SQLite: общее хранилище процессов на одном сервере"""
+
+    shared = True
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        with closing(self._connect()) as connection, connection:
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _connection(self):
+        # Соединение SQLite нельзя делить между потоками
+        if getattr(self.local, 'connection', None) is None:
+            self.local.connection = self._connect()
+        return self.local.connection
+
+    def get(self, user_id):
+        row = self._connection().execute(
+            "SELECT data FROM sessions WHERE user_id = ? AND updated_at > ?",
+            (user_id, time.time() - SESSION_TTL)
+        ).fetchone()
+        return row[0] if row else None
+
+    def put(self, user_id, data):
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO sessions (user_id, data, updated_at) VALUES (?, ?, ?)",
+                (user_id, data, time.time())
+            )
+
+    def delete(self, user_id):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+
+    def evict(self):
+        """Удалить сессии, не менявшиеся дольше SESSION_TTL; возвращает число удаленных"""
+        with self._connection() as connection:
+            return connection.execute(
+                "DELETE FROM sessions WHERE updated_at <= ?", (time.time() - SESSION_TTL,)
+            ).rowcount
+
+class RedisSessionStore:
+    """Сессии в Redis (или совместимом хранилище): общее хранилище процессов на разных серверах"""
+
+    shared = True
+
+    def __init__(self, url):
+        # Клиент Redis нужен только в этом режиме
+        import redis
+        self.client = redis.Redis.from_url(url)
+
+    def _key(self, user_id):
+        return f"inventory:session:{user_id}"
+
+    def get(self, user_id):
+        data = self.client.get(self._key(user_id))
+        return data.decode('utf-8') if data is not None else None
+
+    def put(self, user_id, data):
+        self.client.set(self._key(user_id), data, ex=SESSION_TTL)
+
+    def delete(self, user_id):
+        self.client.delete(self._key(user_id))
+
+    def evict(self):
+        # Ключи истекают сами через SESSION_TTL
+        return 0
+
+def create_session_store(backend=SESSION_BACKEND, url=SESSION_URL):
+    """Хранилище сессий по настройке SESSION_BACKEND"""
+    if backend == 'memory':
+        return MemorySessionStore()
+    if backend == 'sqlite':
+        return SqliteSessionStore(url)
+    if backend == 'redis':
+        return RedisSessionStore(url)
+    raise ValueError(f"Неизвестное хранилище сессий: {backend}")
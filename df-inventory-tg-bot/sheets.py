@@ -1,15 +1,28 @@
 import os
+import re
+import time
+import uuid
+import random
 import logging
+import threading
+import httplib2
+from collections import OrderedDict
+from google.auth.exceptions import TransportError
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from datetime import datetime
 from dotenv import load_dotenv
 
 # Загрузка переменных окружения
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
 SERVICE_ACCOUNT_FILE = os.getenv('GOOGLE_SERVICE_ACCOUNT_FILE', 'service-account-key.json')
+# Режим хранения: tabs — лист на каждую инвентаризацию, ledger — строки в общем листе-журнале склада
+STORAGE_MODE = os.getenv('STORAGE_MODE', 'tabs')
 
 def get_google_sheets_service():
     """Получение сервиса Google Sheets"""
@@ -20,7 +33,7 @@ def get_google_sheets_service():
         )
         return build('sheets', 'v4', credentials=credentials)
     except Exception as e:
-        logging.error(f"Error creating sheets service: {str(e)}")
+        logger.error("Error creating sheets service: %s", e)
         raise
 
 def get_drive_service():
@@ -32,155 +45,650 @@ def get_drive_service():
         )
         return build('drive', 'v3', credentials=credentials)
     except Exception as e:
-        logging.error(f"Error creating drive service: {str(e)}")
+        logger.error("Error creating drive service: %s", e)
         raise
 
-def get_or_create_folder(drive_service, folder_name="Инвентаризации ДФ Сервис"):
+FOLDER_NAME = "Инвентаризации ДФ Сервис"
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+SPREADSHEET_MIME_TYPE = 'application/vnd.google-apps.spreadsheet'
+DRIVE_ID_TTL = 600  # Сколько секунд найденный id папки или таблицы используется без повторного поиска
+DRIVE_IDS_MAXSIZE = 256  # Сколько найденных файлов Drive помнить (рабочие таблицы складов и их архивы)
+
+# Найденные файлы Drive: (id родителя, название, mimeType) -> (id, время поиска, время последнего запроса).
+# Из нескольких файлов с одним названием всегда выбирается самый старый (затем меньший id),
+# поэтому все процессы приходят к одному файлу, а лишние убирает reconcile_duplicates в archive.py.
+# Не больше DRIVE_IDS_MAXSIZE записей (LRU); устаревшие записи удаляются при добавлении новых
+drive_ids = OrderedDict()
+drive_ids_lock = threading.Lock()
+creation_locks = {}
+
+def _quote(value):
+    """Строка для запроса files.list"""
+    return value.replace('\\', '\\\\').replace("'", "\\'")
+
+def _canonical_order(file):
+    """Порядок выбора среди одноименных файлов: самый старый, затем меньший id"""
+    return (file.get('createdTime', ''), file['id'])
+
+def find_drive_files(drive_service, name, mime_type, parent_id=None):
+    """Неудаленные файлы с названием и типом (в папке parent_id), начиная с основного"""
+    query = f"name='{_quote(name)}' and mimeType='{mime_type}' and trashed=false"
+    if parent_id:
+        query += f" and '{parent_id}' in parents"
+    results = drive_service.files().list(
+        q=query,
+        fields="files(id, name, createdTime, modifiedTime)",
+        orderBy='createdTime',
+        pageSize=100
+    ).execute()
+    return sorted(results.get('files', []), key=_canonical_order)
+
+def _get_creation_lock(key):
+    """Блокировка поиска и создания файла: одновременные запросы одного файла в процессе ждут первый"""
+    with drive_ids_lock:
+        if key not in creation_locks:
+            creation_locks[key] = threading.Lock()
+        return creation_locks[key]
+
+def _cached_drive_id(key):
+    with drive_ids_lock:
+        cached = drive_ids.get(key)
+        now = time.monotonic()
+        if cached and now - cached[1] < DRIVE_ID_TTL:
+            drive_ids[key] = (cached[0], cached[1], now)
+            drive_ids.move_to_end(key)
+            return cached[0]
+    return None
+
+def _store_drive_ids(found, resolved_at, requested=False):
+    """Запомнить найденные файлы {ключ: id}, убрав устаревшие и самые давние сверх DRIVE_IDS_MAXSIZE.
+    requested — файлы найдены по запросу (а не списком папки или заблаговременным обновлением)"""
+    with drive_ids_lock:
+        for key, file_id in found.items():
+            previous = drive_ids.get(key)
+            read_at = resolved_at if requested else previous[2] if previous else float('-inf')
+            drive_ids[key] = (file_id, resolved_at, read_at)
+            drive_ids.move_to_end(key)
+        now = time.monotonic()
+        for key in [key for key, cached in drive_ids.items() if now - cached[1] >= DRIVE_ID_TTL]:
+            del drive_ids[key]
+        while len(drive_ids) > DRIVE_IDS_MAXSIZE:
+            drive_ids.popitem(last=False)
+
+def forget_drive_file(file_id):
+    """Убрать файл из найденных (после переименования или удаления) вместе с индексом листов таблицы"""
+    with drive_ids_lock:
+        for key in [key for key, cached in drive_ids.items() if cached[0] == file_id]:
+            del drive_ids[key]
+    with sheet_index_lock:
+        sheet_index.pop(file_id, None)
+
+def resolve_drive_file(drive_service, name, mime_type, parent_id=None, create=True):
+    """id файла Drive по названию; при create=True отсутствующий файл создается.
+    Создание в процессе выполняется один раз на ключ. Если другой процесс успел создать такой же файл,
+    после создания остается основной (самый старый), а только что созданный пустой файл удаляется"""
+    key = (parent_id, name, mime_type)
+    file_id = _cached_drive_id(key)
+    if file_id:
+        return file_id
+    with _get_creation_lock(key):
+        # Пока ждали блокировку, файл мог найти или создать другой поток
+        file_id = _cached_drive_id(key)
+        if file_id:
+            return file_id
+        files = find_drive_files(drive_service, name, mime_type, parent_id)
+        if len(files) > 1:
+            logger.warning("Найдено %d файлов '%s', используется %s", len(files), name, files[0]['id'])
+        if not files:
+            if not create:
+                return None
+            body = {'name': name, 'mimeType': mime_type}
+            if parent_id:
+                body['parents'] = [parent_id]
+            created = drive_service.files().create(body=body, fields='id, createdTime').execute()
+            logger.info("Создан файл '%s' с ID: %s", name, created['id'])
+            # Проверяем, не создал ли такой же файл другой процесс
+            files = find_drive_files(drive_service, name, mime_type, parent_id) or [created]
+            if files[0]['id'] != created['id']:
+                logger.warning(
+                    "Файл '%s' одновременно создан другим процессом (%s), удаляем созданный %s",
+                    name, files[0]['id'], created['id']
+                )
+                drive_service.files().update(fileId=created['id'], body={'trashed': True}).execute()
+        file_id = files[0]['id']
+        _store_drive_ids({key: file_id}, time.monotonic(), requested=True)
+        return file_id
+
+def refresh_drive_ids(drive_service, within):
+    """Заново найти файлы, срок которых истекает в ближайшие within секунд (блокирующий вызов).
+    Только файлы, запрошенные за последние DRIVE_ID_TTL секунд; таблицы одной папки находятся одним списком.
+    Возвращает число обновленных записей"""
+    now = time.monotonic()
+    with drive_ids_lock:
+        expiring = [
+            key for key, (_, resolved_at, read_at) in drive_ids.items()
+            if now - resolved_at + within >= DRIVE_ID_TTL and now - read_at < DRIVE_ID_TTL
+        ]
+    found = {}
+    listed = set()
+    for parent_id, name, mime_type in expiring:
+        if parent_id and mime_type == SPREADSHEET_MIME_TYPE:
+            if parent_id in listed:
+                continue
+            listed.add(parent_id)
+            for file in list_folder_files(drive_service, parent_id, mime_type):
+                found.setdefault((parent_id, file['name'], mime_type), file['id'])
+        else:
+            files = find_drive_files(drive_service, name, mime_type, parent_id)
+            if files:
+                found[(parent_id, name, mime_type)] = files[0]['id']
+    _store_drive_ids(found, time.monotonic())
+    return sum(1 for key in expiring if key in found)
+
+def get_or_create_folder(drive_service, folder_name=FOLDER_NAME):
     """Получить или создать папку в Google Drive"""
     try:
-        logging.info(f"Поиск папки '{folder_name}' в Google Drive")
-        # Проверяем, существует ли папка
-        results = drive_service.files().list(
-            q=f"name='{folder_name}' and mimeType='application/vnd.google-apps.folder' and trashed=false",
-            fields="files(id, name)"
-        ).execute()
-        folders = results.get('files', [])
-        
-        if folders:
-            logging.info(f"Папка '{folder_name}' найдена с ID: {folders[0]['id']}")
-            # Папка существует, возвращаем её ID
-            return folders[0]['id']
-        else:
-            logging.info(f"Папка '{folder_name}' не найдена, создаем новую")
-            # Создаем новую папку
-            folder_metadata = {
-                'name': folder_name,
-                'mimeType': 'application/vnd.google-apps.folder'
-            }
-            folder = drive_service.files().create(
-                body=folder_metadata,
-                fields='id'
-            ).execute()
-            logging.info(f"Создана новая папка с ID: {folder.get('id')}")
-            return folder.get('id')
+        return resolve_drive_file(drive_service, folder_name, FOLDER_MIME_TYPE)
     except Exception as e:
-        logging.error(f"Ошибка при создании/поиске папки: {str(e)}")
+        logger.error("Ошибка при создании/поиске папки: %s", e)
         raise
 
+def find_spreadsheet(drive_service, warehouse_name):
+    """Найти таблицу склада в папке инвентаризаций, не создавая ее"""
+    folder_id = get_or_create_folder(drive_service)
+    return resolve_drive_file(drive_service, warehouse_name, SPREADSHEET_MIME_TYPE, folder_id, create=False)
+
+def list_folder_files(drive_service, folder_id, mime_type):
+    """Все файлы типа в папке, одноименные — начиная с основного"""
+    files = []
+    page_token = None
+    while True:
+        results = drive_service.files().list(
+            q=f"mimeType='{mime_type}' and '{folder_id}' in parents and trashed=false",
+            fields="nextPageToken, files(id, name, createdTime, modifiedTime)",
+            pageSize=1000,
+            pageToken=page_token
+        ).execute()
+        files.extend(results.get('files', []))
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return sorted(files, key=_canonical_order)
+
+def list_warehouse_spreadsheets(drive_service):
+    """Все таблицы складов в папке инвентаризаций: {название: id}"""
+    folder_id = get_or_create_folder(drive_service)
+    spreadsheets = {}
+    for file in list_folder_files(drive_service, folder_id, SPREADSHEET_MIME_TYPE):
+        spreadsheets.setdefault(file['name'], file['id'])
+    # Список заодно обновляет найденные id: поиск таблиц складов после него не ходит в Drive
+    _store_drive_ids(
+        {(folder_id, name, SPREADSHEET_MIME_TYPE): file_id for name, file_id in spreadsheets.items()},
+        time.monotonic()
+    )
+    return spreadsheets
+
 def get_or_create_spreadsheet(sheets_service, drive_service, warehouse_name):
     """Получить или создать таблицу для склада"""
     try:
-        logging.info(f"Поиск или создание таблицы для склада '{warehouse_name}'")
-        # Получаем или создаем папку
+        logger.info("Поиск или создание таблицы для склада '%s'", warehouse_name)
         folder_id = get_or_create_folder(drive_service)
-        logging.info(f"Получен ID папки: {folder_id}")
-        
-        # Ищем существующую таблицу в папке
-        results = drive_service.files().list(
-            q=f"name='{warehouse_name}' and mimeType='application/vnd.google-apps.spreadsheet' and '{folder_id}' in parents and trashed=false",
-            fields="files(id, name)"
-        ).execute()
-        files = results.get('files', [])
-        
-        if files:
-            logging.info(f"Найдена существующая таблица с ID: {files[0]['id']}")
-            # Таблица существует
-            return files[0]['id']
-        
-        logging.info("Создание новой таблицы")
-        # Создаем новую таблицу
-        spreadsheet = {
-            'properties': {
-                'title': warehouse_name
-            }
-        }
-        spreadsheet = sheets_service.spreadsheets().create(
-            body=spreadsheet,
-            fields='spreadsheetId'
-        ).execute()
-        
-        # Перемещаем таблицу в папку
-        file_id = spreadsheet.get('spreadsheetId')
-        logging.info(f"Создана новая таблица с ID: {file_id}")
-        
-        file = drive_service.files().get(
-            fileId=file_id,
-            fields='parents'
-        ).execute()
-        previous_parents = ",".join(file.get('parents', []))
-        
-        # Перемещаем файл в нужную папку
-        drive_service.files().update(
-            fileId=file_id,
-            addParents=folder_id,
-            removeParents=previous_parents,
-            fields='id, parents'
-        ).execute()
-        logging.info(f"Таблица перемещена в папку {folder_id}")
-        
-        return file_id
+        # Таблица создается через Drive сразу в папке: другие процессы видят ее без промежуточного переноса
+        return resolve_drive_file(drive_service, warehouse_name, SPREADSHEET_MIME_TYPE, folder_id)
     except Exception as e:
-        logging.error(f"Ошибка при создании/поиске таблицы: {str(e)}")
+        logger.error("Ошибка при создании/поиске таблицы: %s", e)
         raise
 
+# Кэш метаданных таблиц (общий для бота и сохранения):
+# spreadsheet_id -> {'titles': {title: sheetId}, 'rows': {title: rowCount}, 'counters': {base_title: номер},
+# 'ledger': {название инвентаризации из листа-журнала: (первая, последняя строка журнала)}, 'saved': {ID инвентаризации: название},
+# 'drafts': {ID инвентаризации: название листа, созданного для нее, но еще не заполненного}}.
+# Обновляется на месте по ответам batchUpdate и перечитывается при расхождении с Google, а также каждые
+# SHEET_INDEX_TTL секунд: листы, созданные и перенесенные в архив другими процессами, появляются в нем не позже.
+# Не больше SHEET_INDEX_MAXSIZE таблиц (LRU); индекс удаленной или объединенной таблицы убирает forget_drive_file
+sheet_index = OrderedDict()
+sheet_index_lock = threading.Lock()
+allocation_locks = {}
+sheet_index_metrics = {'hits': 0, 'misses': 0, 'refreshes': 0, 'updates': 0, 'evictions': 0}
+SHEET_INDEX_FIELDS = 'sheets.properties(sheetId,title,gridProperties.rowCount)'
+SHEET_INDEX_TTL = 60  # Сколько секунд индекс листов используется без перечитывания
+SHEET_INDEX_MAXSIZE = 256  # Сколько индексов таблиц держать в памяти
+MAX_ALLOCATION_ATTEMPTS = 3
+LEDGER_SHEET_TITLE = 'Журнал инвентаризаций'
+LEDGER_HEADER = ['Инвентаризация', 'ID', 'Дата', 'Склад', '№', 'Продукт', 'Количество', 'Единица измерения', 'Ответственное лицо', 'Телефон']
+LEDGER_INDEX_TITLE = 'Оглавление журнала'  # Строка на инвентаризацию журнала: где лежат ее строки
+LEDGER_INDEX_HEADER = ['Инвентаризация', 'ID', 'Первая строка', 'Последняя строка']
+LEDGER_VIEW_TITLE = 'Просмотр'  # Лист, на котором оформляется инвентаризация из журнала
+INVENTORY_HEADER_ROWS = 6  # Строк шапки на листе инвентаризации
+INVENTORY_ID_KEY = 'inventory_id'  # Ключ метаданных листа с ID сохраненной инвентаризации
+INVENTORY_DRAFT_KEY = 'inventory_draft'  # Ключ метаданных листа, созданного для инвентаризации до записи данных
+
+def _split_sheet_title(title):
+    """Разбить название листа на базовое название и номер"""
+    base_title, sep, number = title.rpartition('_')
+    if sep and number.isdigit():
+        return base_title, int(number)
+    # Если нет номера, считаем это первым листом
+    return title, 1
+
+def _register_sheet(index, title, sheet_id, row_count=None):
+    """Добавить лист в индекс и обновить счетчик номеров"""
+    index['titles'][title] = sheet_id
+    if row_count is not None:
+        index['rows'][title] = row_count
+    base_title, number = _split_sheet_title(title)
+    if number > index['counters'].get(base_title, 0):
+        index['counters'][base_title] = number
+
+def _register_properties(index, properties):
+    """Добавить лист в индекс по его SheetProperties"""
+    _register_sheet(
+        index,
+        properties['title'],
+        properties['sheetId'],
+        properties.get('gridProperties', {}).get('rowCount')
+    )
+
+def _unregister_sheet_id(index, sheet_id):
+    """Убрать лист из индекса по sheetId; возвращает его название"""
+    for title, known_id in list(index['titles'].items()):
+        if known_id == sheet_id:
+            del index['titles'][title]
+            index['rows'].pop(title, None)
+            for saved in (index['saved'], index['drafts']):
+                for inventory_id, saved_title in list(saved.items()):
+                    if saved_title == title:
+                        del saved[inventory_id]
+            return title
+    return None
+
+def _register_ledger_title(index, title, inventory_id, rows):
+    """Добавить инвентаризацию журнала в индекс; номер учитывается так же, как у листов.
+    rows — (первая, последняя) строки журнала; повторная запись той же инвентаризации заменяет прежнюю"""
+    index['ledger'][title] = rows
+    if inventory_id:
+        index['saved'][inventory_id] = title
+    base_title, number = _split_sheet_title(title)
+    if number > index['counters'].get(base_title, 0):
+        index['counters'][base_title] = number
+
+def _register_inventory_sheet(index, key, inventory_id, title):
+    """Запомнить лист инвентаризации по ключу метаданных: заполненный или только созданный"""
+    if key == INVENTORY_ID_KEY:
+        index['saved'][inventory_id] = title
+        index['drafts'].pop(inventory_id, None)
+    elif inventory_id not in index['saved']:
+        index['drafts'][inventory_id] = title
+
+def apply_batch_update(service, spreadsheet_id, requests, response):
+    """Обновить индекс по запросам batchUpdate и ответам на них, без повторной загрузки метаданных"""
+    index = get_sheet_index(service, spreadsheet_id)
+    with _get_allocation_lock(spreadsheet_id):
+        for request, reply in zip(requests, response.get('replies', [])):
+            if 'addSheet' in reply:
+                _register_properties(index, reply['addSheet']['properties'])
+            elif 'duplicateSheet' in reply:
+                _register_properties(index, reply['duplicateSheet']['properties'])
+            elif 'createDeveloperMetadata' in request:
+                metadata = request['createDeveloperMetadata']['developerMetadata']
+                if metadata['metadataKey'] not in (INVENTORY_ID_KEY, INVENTORY_DRAFT_KEY):
+                    continue
+                sheet_id = metadata['location']['sheetId']
+                for title, known_id in index['titles'].items():
+                    if known_id == sheet_id:
+                        _register_inventory_sheet(index, metadata['metadataKey'], metadata['metadataValue'], title)
+                        break
+            elif 'deleteSheet' in request:
+                _unregister_sheet_id(index, request['deleteSheet']['sheetId'])
+            elif 'appendDimension' in request:
+                append = request['appendDimension']
+                if append['dimension'] != 'ROWS':
+                    continue
+                for title, known_id in index['titles'].items():
+                    if known_id == append['sheetId'] and title in index['rows']:
+                        index['rows'][title] += append['length']
+                        break
+            elif 'updateSheetProperties' in request:
+                update = request['updateSheetProperties']
+                properties = update['properties']
+                if 'title' in update['fields'].split(','):
+                    # Переименованный лист (или скопированный из другой таблицы) встает под новым названием
+                    _unregister_sheet_id(index, properties['sheetId'])
+                    _register_sheet(index, properties['title'], properties['sheetId'])
+            else:
+                continue
+            sheet_index_metrics['updates'] += 1
+
+def batch_update(service, spreadsheet_id, requests):
+    """spreadsheets.batchUpdate с обновлением индекса листов по ответу"""
+    response = service.spreadsheets().batchUpdate(
+        spreadsheetId=spreadsheet_id,
+        body={'requests': requests}
+    ).execute()
+    apply_batch_update(service, spreadsheet_id, requests, response)
+    return response
+
+def _get_allocation_lock(spreadsheet_id):
+    """Блокировка выделения номеров листов для таблицы; повторный вход нужен batch_update под блокировкой"""
+    with sheet_index_lock:
+        if spreadsheet_id not in allocation_locks:
+            allocation_locks[spreadsheet_id] = threading.RLock()
+        return allocation_locks[spreadsheet_id]
+
+def refresh_sheet_index(service, spreadsheet_id):
+    """Загрузить индекс листов таблицы (только sheetId, названия и число строк)"""
+    sheet_index_metrics['refreshes'] += 1
+    spreadsheet = service.spreadsheets().get(
+        spreadsheetId=spreadsheet_id,
+        fields=SHEET_INDEX_FIELDS
+    ).execute()
+    index = {'titles': {}, 'rows': {}, 'counters': {}, 'ledger': {}, 'saved': {}, 'drafts': {}}
+    for sheet in spreadsheet.get('sheets', []):
+        _register_properties(index, sheet['properties'])
+    if LEDGER_INDEX_TITLE in index['titles']:
+        # Инвентаризации журнала нумеруются вместе с листами: читаем только оглавление, по строке на инвентаризацию
+        result = service.spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id,
+            range=a1_range(LEDGER_INDEX_TITLE, 'A2:D'),
+            valueRenderOption='UNFORMATTED_VALUE',
+            fields='values'
+        ).execute()
+        for row in result.get('values', []):
+            if len(row) >= 4:
+                _register_ledger_title(index, str(row[0]), str(row[1]), (int(row[2]), int(row[3])))
+    elif LEDGER_SHEET_TITLE in index['titles']:
+        # Журнал, записанный до появления оглавления: один раз находим строки инвентаризаций по столбцам A:E,
+        # оглавление заполнится при следующей записи в журнал
+        result = service.spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id,
+            range=a1_range(LEDGER_SHEET_TITLE, 'A2:E'),
+            valueRenderOption='UNFORMATTED_VALUE',
+            fields='values'
+        ).execute()
+        for title, block in _ledger_blocks(result.get('values', []), first_row=2).items():
+            _register_ledger_title(index, title, block['id'], block['rows'])
+    # Номера, уже выданные в этом процессе, не должны выдаваться повторно
+    previous = sheet_index.get(spreadsheet_id)
+    if previous:
+        for base_title, number in previous['counters'].items():
+            if number > index['counters'].get(base_title, 0):
+                index['counters'][base_title] = number
+        # Найденные метаданными листы остаются известными, пока лист на месте
+        for key in ('saved', 'drafts'):
+            for inventory_id, title in previous[key].items():
+                if title in index['titles']:
+                    index[key].setdefault(inventory_id, title)
+    index['loaded_at'] = time.monotonic()
+    with sheet_index_lock:
+        sheet_index[spreadsheet_id] = index
+        sheet_index.move_to_end(spreadsheet_id)
+        while len(sheet_index) > SHEET_INDEX_MAXSIZE:
+            sheet_index.popitem(last=False)
+            sheet_index_metrics['evictions'] += 1
+    return index
+
+def _is_fresh(index):
+    return index is not None and time.monotonic() - index['loaded_at'] < SHEET_INDEX_TTL
+
+def get_sheet_index(service, spreadsheet_id):
+    """Получить индекс листов таблицы из памяти или загрузить его (также по истечении SHEET_INDEX_TTL)"""
+    index = sheet_index.get(spreadsheet_id)
+    if not _is_fresh(index):
+        with _get_allocation_lock(spreadsheet_id):
+            index = sheet_index.get(spreadsheet_id)
+            if not _is_fresh(index):
+                sheet_index_metrics['misses'] += 1
+                index = refresh_sheet_index(service, spreadsheet_id)
+                return index
+    with sheet_index_lock:
+        if spreadsheet_id in sheet_index:
+            sheet_index.move_to_end(spreadsheet_id)
+    sheet_index_metrics['hits'] += 1
+    return index
+
+def get_sheet_index_metrics():
+    """Снимок метрик кэша метаданных таблиц"""
+    metrics = dict(sheet_index_metrics)
+    lookups = metrics['hits'] + metrics['misses']
+    metrics['hit_ratio'] = round(metrics['hits'] / lookups, 3) if lookups else 0.0
+    metrics['spreadsheets'] = len(sheet_index)
+    return metrics
+
 def get_next_sheet_number(service, spreadsheet_id, base_title):
     """Получает следующий доступный номер для листа с указанным базовым названием"""
     try:
-        # Получаем список всех листов в таблице
-        spreadsheet = service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
-        sheets = spreadsheet.get('sheets', [])
-        
-        # Создаем список существующих номеров для данного базового названия
-        existing_numbers = []
-        for sheet in sheets:
-            title = sheet['properties']['title']
-            if title.startswith(base_title):
-                try:
-                    # Пытаемся извлечь номер из названия
-                    num = int(title.split('_')[-1])
-                    existing_numbers.append(num)
-                except (ValueError, IndexError):
-                    # Если нет номера, считаем это первым листом
-                    existing_numbers.append(1)
-        
-        if not existing_numbers:
-            return 1
-        
-        # Возвращаем следующий номер
-        return max(existing_numbers) + 1
+        index = get_sheet_index(service, spreadsheet_id)
+        return index['counters'].get(base_title, 0) + 1
     except Exception as e:
-        print(f"Ошибка при получении следующего номера листа: {e}")
+        logger.error("Ошибка при получении следующего номера листа: %s", e)
         return 1
 
-def create_new_sheet(service, spreadsheet_id, warehouse, date):
-    """Создает новый лист для инвентаризации"""
+def allocate_sheet_title(service, spreadsheet_id, base_title):
+    """Занять следующий номер листа; номер не выдается повторно внутри процесса"""
+    index = get_sheet_index(service, spreadsheet_id)
+    with _get_allocation_lock(spreadsheet_id):
+        number = index['counters'].get(base_title, 0) + 1
+        index['counters'][base_title] = number
+    return f"{base_title}_{number}"
+
+def parse_inventory_title(title):
+    """Дата и номер инвентаризации из названия листа или None для других листов"""
+    base_title, number = _split_sheet_title(title)
+    if not base_title.startswith('Инвентаризация '):
+        return None
+    date = base_title[len('Инвентаризация '):]
+    try:
+        datetime.strptime(date, '%Y-%m-%d')
+    except ValueError:
+        return None
+    return date, number
+
+def get_inventory_titles(service, spreadsheet_id):
+    """Названия листов инвентаризаций таблицы, от новых к старым"""
+    index = get_sheet_index(service, spreadsheet_id)
+    titles = []
+    for title in set(index['titles']) | index['ledger'].keys():
+        parsed = parse_inventory_title(title)
+        if parsed:
+            titles.append((parsed, title))
+    return [title for _, title in sorted(titles, reverse=True)]
+
+def _row_number(value):
+    """Номер строки товара из столбца «№» или None"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _ledger_blocks(rows, first_row=1):
+    """Строки журнала по инвентаризациям; при повторной записи инвентаризации действует последняя.
+    Повторная запись с тем же ID (повтор после сбоя) начинается заново с № 1 и тоже заменяет прежнюю.
+    first_row — номер в журнале первой из rows; у блока 'rows' — его (первая, последняя) строки журнала"""
+    blocks = {}
+    for position, row in enumerate(rows, first_row):
+        if len(row) < 5:
+            continue
+        title, inventory_id = str(row[0]), str(row[1])
+        block = blocks.get(title)
+        number = _row_number(row[4])
+        last = _row_number(block['items'][-1][0]) if block else None
+        if block is None or block['id'] != inventory_id or (number is not None and last is not None and number <= last):
+            block = blocks[title] = {'id': inventory_id, 'row': row, 'items': [], 'rows': (position, position)}
+        block['items'].append([row[4], row[5] if len(row) > 5 else "", row[6] if len(row) > 6 else "", row[7] if len(row) > 7 else ""])
+        block['rows'] = (block['rows'][0], position)
+    return blocks
+
+def _ledger_layout(block):
+    """Инвентаризация из журнала в том же виде, что и отдельный лист (A1:D)"""
+    row = block['row'] + [""] * (len(LEDGER_HEADER) - len(block['row']))
+    return [
+        [f"Инвентаризация склада: {row[3]}"],
+        [f"Материально ответственное лицо: {row[8]}"],
+        [f"Телефон: {row[9]}"],
+        [f"Дата: {row[2]}"],
+        [""],
+        ["№", "Продукт", "Количество остатка", "Единица измерения"]
+    ] + block['items']
+
+def read_inventory_values(service, spreadsheet_id, titles, value_render_option='UNFORMATTED_VALUE'):
+    """Содержимое инвентаризаций (A1:D) по названиям — из отдельных листов или из журнала.
+    Инвентаризации журнала читаются по строкам из оглавления, а не всем журналом"""
+    index = get_sheet_index(service, spreadsheet_id)
+    requested = list(dict.fromkeys(titles))
+    ranges = []
+    for title in requested:
+        if title in index['ledger']:
+            first_row, last_row = index['ledger'][title]
+            ranges.append(a1_range(LEDGER_SHEET_TITLE, f"A{first_row}:J{last_row}"))
+        else:
+            ranges.append(a1_range(title, 'A1:D'))
+    values = {}
+    if ranges:
+        result = service.spreadsheets().values().batchGet(
+            spreadsheetId=spreadsheet_id,
+            ranges=ranges,
+            valueRenderOption=value_render_option,
+            fields='valueRanges(values)'
+        ).execute()
+        for title, value_range in zip(requested, result.get('valueRanges', [])):
+            rows = value_range.get('values', [])
+            if title not in index['ledger']:
+                values[title] = rows
+                continue
+            blocks = _ledger_blocks(rows)
+            if title in blocks:
+                values[title] = _ledger_layout(blocks[title])
+    return [values.get(title, []) for title in titles]
+
+def is_ledger_inventory(service, spreadsheet_id, sheet_title):
+    """Хранится ли инвентаризация в листе-журнале"""
+    return sheet_title in get_sheet_index(service, spreadsheet_id)['ledger']
+
+def inventory_id_request(sheet_id, inventory_id):
+    """Запрос batchUpdate, помечающий лист ID сохраненной инвентаризации"""
+    return {
+        'createDeveloperMetadata': {
+            'developerMetadata': {
+                'metadataKey': INVENTORY_ID_KEY,
+                'metadataValue': inventory_id,
+                'location': {'sheetId': sheet_id},
+                'visibility': 'DOCUMENT'
+            }
+        }
+    }
+
+def find_saved_inventory(service, spreadsheet_id, inventory_id):
+    """Название уже сохраненной инвентаризации с этим ID или None.
+    Журнал проверяется по индексу, листы — поиском метаданных, записанных последним запросом сохранения.
+    Тот же поиск находит лист, созданный для инвентаризации прошлой попыткой, но не заполненный:
+    он попадает в index['drafts']"""
+    index = get_sheet_index(service, spreadsheet_id)
+    if inventory_id in index['saved']:
+        return index['saved'][inventory_id]
+    result = service.spreadsheets().developerMetadata().search(
+        spreadsheetId=spreadsheet_id,
+        body={'dataFilters': [
+            {'developerMetadataLookup': {'metadataKey': key, 'metadataValue': inventory_id}}
+            for key in (INVENTORY_DRAFT_KEY, INVENTORY_ID_KEY)
+        ]},
+        fields='matchedDeveloperMetadata.developerMetadata(metadataKey,location.sheetId)'
+    ).execute()
+    titles = {known_id: title for title, known_id in index['titles'].items()}
+    with _get_allocation_lock(spreadsheet_id):
+        for match in result.get('matchedDeveloperMetadata', []):
+            metadata = match['developerMetadata']
+            title = titles.get(metadata['location'].get('sheetId'))
+            if title:
+                _register_inventory_sheet(index, metadata['metadataKey'], inventory_id, title)
+    return index['saved'].get(inventory_id)
+
+def get_previous_inventory_title(service, spreadsheet_id, sheet_title):
+    """Инвентаризация, предшествующая листу sheet_title, или None"""
+    # Пустой лист незавершенного сохранения не годится для сравнения
+    drafts = set(get_sheet_index(service, spreadsheet_id)['drafts'].values()) - {sheet_title}
+    titles = [title for title in get_inventory_titles(service, spreadsheet_id) if title not in drafts]
+    if sheet_title in titles:
+        position = titles.index(sheet_title) + 1
+        return titles[position] if position < len(titles) else None
+    return titles[0] if titles else None
+
+def a1_range(sheet_title, cells):
+    """Диапазон A1 с экранированным названием листа"""
+    escaped = sheet_title.replace("'", "''")
+    return f"'{escaped}'!{cells}"
+
+def is_transport_error(error):
+    """Сбой связи с Google или ошибка на его стороне (5xx, 429), в отличие от ошибки в данных запроса"""
+    if isinstance(error, HttpError):
+        return error.resp.status >= 500 or error.resp.status == 429
+    return isinstance(error, (OSError, httplib2.HttpLib2Error, TransportError))
+
+def describe_error(error):
+    """Краткое описание ошибки для пользователя: у ответа Google — код и его сообщение"""
+    if isinstance(error, HttpError):
+        return f"{error.resp.status} {error.reason}"
+    return str(error) or type(error).__name__
+
+def new_sheet_id(index):
+    """Случайный sheetId, не занятый листами из индекса: нужен, чтобы сослаться на новый лист
+    в том же batchUpdate, что его создает"""
+    used_ids = set(index['titles'].values())
+    sheet_id = random.randrange(1, 2 ** 31)
+    while sheet_id in used_ids:
+        sheet_id = random.randrange(1, 2 ** 31)
+    return sheet_id
+
+def _is_duplicate_title_error(error):
+    """Ошибка addSheet из-за уже существующего названия листа"""
+    return isinstance(error, HttpError) and error.resp.status == 400 and 'already exists' in str(error)
+
+def create_new_sheet(service, spreadsheet_id, warehouse, date, inventory_id=None):
+    """Создает новый лист для инвентаризации, возвращает (название, sheetId); ошибки пробрасываются.
+    С inventory_id лист тем же запросом помечается черновиком этой инвентаризации: повторная попытка
+    сохранения найдет его через find_saved_inventory и заполнит вместо создания еще одного листа"""
     try:
         # Формируем базовое название листа
         base_title = f"Инвентаризация {date}"
         
-        # Получаем следующий доступный номер для листа
-        next_number = get_next_sheet_number(service, spreadsheet_id, base_title)
-        
-        # Формируем полное название листа
-        sheet_title = f"{base_title}_{next_number}"
-        
-        # Создаем новый лист
-        body = {
-            'requests': [{
-                'addSheet': {
-                    'properties': {
-                        'title': sheet_title
+        for attempt in range(MAX_ALLOCATION_ATTEMPTS):
+            # Получаем следующий свободный номер и полное название листа
+            sheet_title = allocate_sheet_title(service, spreadsheet_id, base_title)
+            
+            # Создаем новый лист
+            body = {
+                'requests': [{
+                    'addSheet': {
+                        'properties': {
+                            'title': sheet_title
+                        }
                     }
-                }
-            }]
-        }
-        
-        response = service.spreadsheets().batchUpdate(
-            spreadsheetId=spreadsheet_id,
-            body=body
-        ).execute()
+                }]
+            }
+            if inventory_id:
+                # Метку можно поставить в том же запросе, только зная sheetId заранее: выбираем его сами
+                sheet_id = new_sheet_id(get_sheet_index(service, spreadsheet_id))
+                body['requests'][0]['addSheet']['properties']['sheetId'] = sheet_id
+                body['requests'].append({
+                    'createDeveloperMetadata': {
+                        'developerMetadata': {
+                            'metadataKey': INVENTORY_DRAFT_KEY,
+                            'metadataValue': inventory_id,
+                            'location': {'sheetId': sheet_id},
+                            'visibility': 'DOCUMENT'
+                        }
+                    }
+                })
+            
+            try:
+                response = batch_update(service, spreadsheet_id, body['requests'])
+                break
+            except HttpError as e:
+                if not _is_duplicate_title_error(e) or attempt == MAX_ALLOCATION_ATTEMPTS - 1:
+                    raise
+                # Лист с таким названием создан другим процессом: обновляем индекс
+                logger.warning("Лист '%s' уже существует, обновляем индекс листов", sheet_title)
+                refresh_sheet_index(service, spreadsheet_id)
         
-        # Получаем ID созданного листа
+        # ID созданного листа; в индекс лист добавлен по ответу batchUpdate
         sheet_id = response['replies'][0]['addSheet']['properties']['sheetId']
         
         # Форматируем заголовки
@@ -224,20 +732,24 @@ def create_new_sheet(service, spreadsheet_id, warehouse, date):
             body=body
         ).execute()
         
-        return True
+        return sheet_title, sheet_id
     except Exception as e:
-        print(f"Ошибка при создании нового листа: {e}")
-        return False
+        logger.error("Ошибка при создании нового листа: %s", e)
+        raise
 
-def save_inventory_data(service, spreadsheet_id, warehouse_name, date, user_name, phone, inventory_data):
-    """Сохранение данных инвентаризации в таблицу"""
+def save_inventory_data(service, spreadsheet_id, warehouse_name, date, user_name, phone, items, sheet_title=None, sheet_id=None, extra_requests=None, inventory_id=None, progress=None):
+    """Сохранение данных инвентаризации в таблицу; items — строки (название, количество, единица).
+    extra_requests добавляются в тот же batchUpdate, что и форматирование;
+    inventory_id записывается в метаданные листа тем же запросом, то есть только после записи данных.
+    progress(текст) вызывается в начале каждого этапа. Ошибки пробрасываются"""
     try:
-        logging.info(f"Начало сохранения данных для склада {warehouse_name}")
-        # Получаем название последнего созданного листа для этой даты
-        base_title = f"Инвентаризация {date}"
-        next_number = get_next_sheet_number(service, spreadsheet_id, base_title)
-        sheet_title = f"{base_title}_{next_number-1}"  # Используем текущий лист
-        logging.info(f"Используем лист: {sheet_title}")
+        logger.debug("Начало сохранения данных для склада %s", warehouse_name)
+        if sheet_title is None:
+            # Используем последний созданный лист для этой даты
+            base_title = f"Инвентаризация {date}"
+            next_number = get_next_sheet_number(service, spreadsheet_id, base_title)
+            sheet_title = f"{base_title}_{next_number-1}"
+        logger.debug("Используем лист: %s", sheet_title)
         
         # Подготовка данных для записи
         header_values = [
@@ -251,38 +763,30 @@ def save_inventory_data(service, spreadsheet_id, warehouse_name, date, user_name
         
         # Добавление данных о продуктах с нумерацией
         product_values = []
-        for i, (product, quantity) in enumerate(inventory_data.items(), 1):
-            # Извлекаем единицу измерения из названия продукта
-            unit = ""
-            if "[" in product and "]" in product:
-                unit = product[product.find("[")+1:product.find("]")]
-                product = product[:product.find("[")].strip()
+        for i, (product, quantity, unit) in enumerate(items, 1):
             product_values.append([i, product, quantity, unit])
         
         values = header_values + product_values
-        logging.info(f"Подготовлено {len(values)} строк данных для записи")
+        logger.debug("Подготовлено %s строк данных для записи", len(values))
         
         # Обновляем данные на листе
-        logging.info("Начинаем запись данных в таблицу")
+        logger.debug("Начинаем запись данных в таблицу")
+        if progress:
+            progress(f"✍️ Записываем {len(items)} строк…")
         service.spreadsheets().values().update(
             spreadsheetId=spreadsheet_id,
             range=f"{sheet_title}!A1:D{len(values)}",
             valueInputOption='RAW',
             body={'values': values}
         ).execute()
-        logging.info("Данные успешно записаны в таблицу")
+        logger.debug("Данные успешно записаны в таблицу")
         
-        # Получаем ID листа для форматирования
-        logging.info("Получаем ID листа для форматирования")
-        sheet_metadata = service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
-        sheet_id = None
-        for sheet in sheet_metadata.get('sheets', ''):
-            if sheet['properties']['title'] == sheet_title:
-                sheet_id = sheet['properties']['sheetId']
-                break
+        # Получаем ID листа для форматирования из индекса листов
+        if sheet_id is None:
+            sheet_id = get_sheet_index(service, spreadsheet_id)['titles'].get(sheet_title)
         
-        if sheet_id:
-            logging.info(f"Найден ID листа: {sheet_id}")
+        if sheet_id is not None:
+            logger.debug("Найден ID листа: %s", sheet_id)
             # Форматирование таблицы
             requests = [
                 # Объединяем ячейки в заголовке для каждой строки информации
@@ -417,22 +921,306 @@ def save_inventory_data(service, spreadsheet_id, warehouse_name, date, user_name
                     }
                 }
             ])
+            if inventory_id:
+                requests.append(inventory_id_request(sheet_id, inventory_id))
             
             # Применяем форматирование
-            logging.info("Применяем форматирование таблицы")
-            service.spreadsheets().batchUpdate(
-                spreadsheetId=spreadsheet_id,
-                body={'requests': requests}
-            ).execute()
-            logging.info("Форматирование успешно применено")
+            logger.debug("Применяем форматирование таблицы")
+            if progress:
+                progress("🎨 Форматируем лист…")
+            try:
+                # Листы, созданные дополнительными запросами, попадают в индекс по ответу
+                batch_update(service, spreadsheet_id, requests + (extra_requests or []))
+            except HttpError as e:
+                if not extra_requests or not _is_duplicate_title_error(e):
+                    raise
+                # Дополнительный лист уже создан параллельным сохранением: данные важнее
+                logger.warning("Дополнительные запросы пропущены: %s", e)
+                refresh_sheet_index(service, spreadsheet_id)
+                batch_update(service, spreadsheet_id, requests)
+            logger.debug("Форматирование успешно применено")
         else:
-            logging.warning("Не удалось найти ID листа для форматирования")
+            logger.warning("Не удалось найти ID листа для форматирования")
         
-        logging.info("Сохранение данных успешно завершено")
+        logger.info("Данные склада %s сохранены на лист %s: %s строк", warehouse_name, sheet_title, len(items))
         return True
     except Exception as e:
-        logging.error(f"Ошибка при сохранении данных: {str(e)}")
-        return False
+        logger.error("Ошибка при сохранении данных: %s", e)
+        raise
+
+def update_inventory_rows(service, spreadsheet_id, sheet_title, changes, next_row):
+    """Записать на лист инвентаризации только измененные товары одним запросом values.batchUpdate.
+    changes — строки (номер строки листа или None, название, количество или None, единица):
+    у товаров, уже бывших на листе, меняется только ячейка количества (None очищает ее),
+    новые товары дописываются в конец таблицы начиная со строки next_row.
+    Возвращает число записанных диапазонов"""
+    data = []
+    for row, product, quantity, unit in changes:
+        if row:
+            data.append({
+                'range': a1_range(sheet_title, f"C{row}"),
+                'values': [["" if quantity is None else quantity]]
+            })
+        elif quantity is not None:
+            data.append({
+                'range': a1_range(sheet_title, f"A{next_row}:D{next_row}"),
+                'values': [[next_row - INVENTORY_HEADER_ROWS, product, quantity, unit]]
+            })
+            next_row += 1
+    if not data:
+        return 0
+    # Дописанные строки не должны выйти за размер листа
+    index = get_sheet_index(service, spreadsheet_id)
+    row_count = index['rows'].get(sheet_title)
+    if row_count is not None and next_row - 1 > row_count:
+        batch_update(service, spreadsheet_id, [{
+            'appendDimension': {
+                'sheetId': index['titles'][sheet_title],
+                'dimension': 'ROWS',
+                'length': next_row - 1 - row_count
+            }
+        }])
+    service.spreadsheets().values().batchUpdate(
+        spreadsheetId=spreadsheet_id,
+        body={'valueInputOption': 'RAW', 'data': data},
+        fields='totalUpdatedCells'
+    ).execute()
+    logger.info("На листе %s исправлено строк: %s", sheet_title, len(data))
+    return len(data)
+
+def _ensure_ledger_sheet(service, spreadsheet_id):
+    """Создать лист-журнал и его оглавление с заголовками, если их еще нет.
+    Оглавление журнала, записанного до его появления, заполняется по индексу"""
+    index = get_sheet_index(service, spreadsheet_id)
+    with _get_allocation_lock(spreadsheet_id):
+        missing = [title for title in (LEDGER_SHEET_TITLE, LEDGER_INDEX_TITLE) if title not in index['titles']]
+        if not missing:
+            return
+        try:
+            batch_update(service, spreadsheet_id, [{
+                'addSheet': {
+                    'properties': {
+                        'title': title,
+                        'gridProperties': {'frozenRowCount': 1}
+                    }
+                }
+            } for title in missing])
+        except HttpError as e:
+            if not _is_duplicate_title_error(e):
+                raise
+            # Журнал создан другим процессом
+            refresh_sheet_index(service, spreadsheet_id)
+            return
+        # Заголовки пишутся под блокировкой: иначе values.append в пустой лист займет их строку
+        ids = {title: inventory_id for inventory_id, title in index['saved'].items()}
+        data = [{
+            'range': a1_range(LEDGER_INDEX_TITLE, 'A1'),
+            'values': [LEDGER_INDEX_HEADER] + [
+                [title, ids.get(title, ""), first_row, last_row]
+                for title, (first_row, last_row) in index['ledger'].items()
+            ]
+        }]
+        if LEDGER_SHEET_TITLE in missing:
+            data.append({'range': a1_range(LEDGER_SHEET_TITLE, 'A1'), 'values': [LEDGER_HEADER]})
+        service.spreadsheets().values().batchUpdate(
+            spreadsheetId=spreadsheet_id,
+            body={'valueInputOption': 'RAW', 'data': data},
+            fields='totalUpdatedCells'
+        ).execute()
+
+def _range_rows(updated_range):
+    """Первая и последняя строки диапазона A1 вида 'Лист'!A5:J10"""
+    rows = [int(number) for number in re.findall(r'\d+', updated_range.rpartition('!')[2])]
+    return rows[0], rows[-1]
+
+def _claim_ledger_title(service, spreadsheet_id, sheet_title, inventory_id, rows, index_row):
+    """Итоговое название только что дописанной инвентаризации журнала.
+    Процессы выдают номера независимо, но строки оглавления Google дописывает строго по очереди:
+    название принадлежит инвентаризации, чья строка оглавления выше. Опоздавшая инвентаризация
+    переименовывается в следующий свободный номер в журнале и оглавлении"""
+    first_row, last_row = rows
+    base_title, _ = _split_sheet_title(sheet_title)
+    for attempt in range(MAX_ALLOCATION_ATTEMPTS + 1):
+        result = service.spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id,
+            range=a1_range(LEDGER_INDEX_TITLE, f"A2:B{index_row - 1}"),
+            valueRenderOption='UNFORMATTED_VALUE',
+            fields='values'
+        ).execute() if index_row > 2 else {}
+        taken = {str(row[0]) for row in result.get('values', []) if len(row) >= 2 and str(row[1]) != inventory_id}
+        if sheet_title not in taken:
+            return sheet_title
+        if attempt == MAX_ALLOCATION_ATTEMPTS:
+            logger.error("Не удалось выбрать свободное название для инвентаризации %s, осталось '%s'", inventory_id, sheet_title)
+            return sheet_title
+        # Номера, занятые другими процессами, больше не выдаются
+        index = get_sheet_index(service, spreadsheet_id)
+        with _get_allocation_lock(spreadsheet_id):
+            for title in taken:
+                taken_base, number = _split_sheet_title(title)
+                if taken_base == base_title and number > index['counters'].get(base_title, 0):
+                    index['counters'][base_title] = number
+        new_title = allocate_sheet_title(service, spreadsheet_id, base_title)
+        logger.warning(
+            "Название '%s' в журнале уже занято другим процессом, инвентаризация %s записана как '%s'",
+            sheet_title, inventory_id, new_title
+        )
+        service.spreadsheets().values().batchUpdate(
+            spreadsheetId=spreadsheet_id,
+            body={'valueInputOption': 'RAW', 'data': [
+                {'range': a1_range(LEDGER_SHEET_TITLE, f"A{first_row}:A{last_row}"), 'values': [[new_title]] * (last_row - first_row + 1)},
+                {'range': a1_range(LEDGER_INDEX_TITLE, f"A{index_row}"), 'values': [[new_title]]}
+            ]},
+            fields='totalUpdatedCells'
+        ).execute()
+        sheet_title = new_title
+
+def append_ledger(service, spreadsheet_id, sheet_title, inventory_id, warehouse_name, date, user_name, phone, items, claim=True):
+    """Дописать инвентаризацию в лист-журнал одним запросом values.append, затем строку оглавления с ее строками.
+    Без строки оглавления инвентаризация не видна: прерванная запись повторяется целиком.
+    С claim=True название проверяется на занятость другими процессами (_claim_ledger_title);
+    без него инвентаризация намеренно заменяет прежнюю с тем же названием. Возвращает итоговое название"""
+    _ensure_ledger_sheet(service, spreadsheet_id)
+    rows = [
+        [sheet_title, inventory_id, date, warehouse_name, i, product, quantity, unit, user_name, phone]
+        for i, (product, quantity, unit) in enumerate(items, 1)
+    ]
+    response = service.spreadsheets().values().append(
+        spreadsheetId=spreadsheet_id,
+        range=a1_range(LEDGER_SHEET_TITLE, 'A1'),
+        valueInputOption='RAW',
+        insertDataOption='INSERT_ROWS',
+        body={'values': rows},
+        fields='updates(updatedRange)'
+    ).execute()
+    first_row, last_row = _range_rows(response['updates']['updatedRange'])
+    response = service.spreadsheets().values().append(
+        spreadsheetId=spreadsheet_id,
+        range=a1_range(LEDGER_INDEX_TITLE, 'A1'),
+        valueInputOption='RAW',
+        insertDataOption='INSERT_ROWS',
+        body={'values': [[sheet_title, inventory_id, first_row, last_row]]},
+        fields='updates(updatedRange)'
+    ).execute()
+    if claim:
+        index_row = _range_rows(response['updates']['updatedRange'])[0]
+        sheet_title = _claim_ledger_title(service, spreadsheet_id, sheet_title, inventory_id, (first_row, last_row), index_row)
+    index = get_sheet_index(service, spreadsheet_id)
+    with _get_allocation_lock(spreadsheet_id):
+        _register_ledger_title(index, sheet_title, inventory_id, (first_row, last_row))
+    logger.info("В журнал склада %s добавлено строк: %s", warehouse_name, len(rows))
+    return sheet_title
+
+def build_ledger_view(service, spreadsheet_id, sheet_title):
+    """Оформить инвентаризацию из журнала на листе «Просмотр»; возвращает sheetId листа"""
+    values = read_inventory_values(service, spreadsheet_id, [sheet_title])[0]
+    if not values:
+        return None
+    index = get_sheet_index(service, spreadsheet_id)
+    with _get_allocation_lock(spreadsheet_id):
+        sheet_id = index['titles'].get(LEDGER_VIEW_TITLE)
+        if sheet_id is None:
+            response = batch_update(
+                service, spreadsheet_id, [{'addSheet': {'properties': {'title': LEDGER_VIEW_TITLE}}}]
+            )
+            sheet_id = response['replies'][0]['addSheet']['properties']['sheetId']
+    service.spreadsheets().values().clear(
+        spreadsheetId=spreadsheet_id,
+        range=a1_range(LEDGER_VIEW_TITLE, 'A:D')
+    ).execute()
+    # Шапка журнала разбирается обратно в поля, оформление — как у отдельного листа
+    warehouse_name, user_name, phone, date = (row[0].split(': ', 1)[-1] for row in values[:4])
+    items = [(row[1], row[2], row[3]) for row in values[INVENTORY_HEADER_ROWS:]]
+    if not save_inventory_data(
+        service, spreadsheet_id, warehouse_name, date, user_name, phone, items,
+        sheet_title=LEDGER_VIEW_TITLE, sheet_id=sheet_id
+    ):
+        return None
+    return sheet_id
+
+def _ignore_progress(text):
+    """Заглушка для сохранения без сообщения о ходе"""
+
+def save_inventory(sheets_service, drive_service, warehouse_name, date, user_name, phone, items, prepare_requests=None, inventory_id=None, progress=None):
+    """Полный цикл сохранения инвентаризации: таблица склада, новый лист и данные.
+    prepare_requests(service, spreadsheet_id, sheet_title, previous_title) возвращает
+    дополнительные запросы для batchUpdate с форматированием.
+    progress(текст) сообщает о начале каждого этапа; вызывается из потока сохранения.
+    Возвращает название листа с данными; ошибки пробрасываются, сбои связи отличает is_transport_error"""
+    progress = progress or _ignore_progress
+    spreadsheet_id = get_or_create_spreadsheet(sheets_service, drive_service, warehouse_name)
+
+    if inventory_id:
+        # Повторная отправка той же инвентаризации (двойное нажатие, повтор после таймаута) не создает новый лист
+        saved_title = find_saved_inventory(sheets_service, spreadsheet_id, inventory_id)
+        if saved_title:
+            logger.info("Инвентаризация %s уже сохранена на листе %s", inventory_id, saved_title)
+            return saved_title
+
+    if STORAGE_MODE == 'ledger':
+        return save_inventory_ledger(
+            sheets_service, spreadsheet_id, warehouse_name, date, user_name, phone, items,
+            prepare_requests=prepare_requests, inventory_id=inventory_id, progress=progress
+        )
+
+    index = get_sheet_index(sheets_service, spreadsheet_id)
+    draft_title = index['drafts'].get(inventory_id) if inventory_id else None
+    if draft_title in index['titles']:
+        # Прошлая попытка создала лист, но не записала данные: заполняем его
+        logger.info("Инвентаризация %s записывается на созданный ранее лист %s", inventory_id, draft_title)
+        sheet_title, sheet_id = draft_title, index['titles'][draft_title]
+    else:
+        # Создаем новый лист для инвентаризации
+        progress("🗂 Создаем лист…")
+        sheet_title, sheet_id = create_new_sheet(sheets_service, spreadsheet_id, warehouse_name, date, inventory_id)
+
+    extra_requests = None
+    if prepare_requests:
+        progress("📉 Сравниваем с прошлой инвентаризацией…")
+        previous_title = get_previous_inventory_title(sheets_service, spreadsheet_id, sheet_title)
+        extra_requests = prepare_requests(sheets_service, spreadsheet_id, sheet_title, previous_title)
+
+    save_inventory_data(
+        sheets_service,
+        spreadsheet_id,
+        warehouse_name,
+        date,
+        user_name,
+        phone,
+        items,
+        sheet_title=sheet_title,
+        sheet_id=sheet_id,
+        extra_requests=extra_requests,
+        inventory_id=inventory_id,
+        progress=progress
+    )
+    return sheet_title
+
+def save_inventory_ledger(sheets_service, spreadsheet_id, warehouse_name, date, user_name, phone, items, editing_sheet=None, prepare_requests=None, inventory_id=None, progress=None):
+    """Сохранение в режиме журнала: время записи не зависит от числа прошлых инвентаризаций.
+    Расхождения считаются после записи: до нее название инвентаризации еще может смениться"""
+    progress = progress or _ignore_progress
+    try:
+        # Исправленная инвентаризация дописывается под тем же названием и заменяет прежние строки
+        sheet_title = editing_sheet or allocate_sheet_title(sheets_service, spreadsheet_id, f"Инвентаризация {date}")
+        progress(f"✍️ Записываем {len(items)} строк в журнал…")
+        sheet_title = append_ledger(
+            sheets_service, spreadsheet_id, sheet_title, inventory_id or uuid.uuid4().hex,
+            warehouse_name, date, user_name, phone, items, claim=editing_sheet is None
+        )
+        if prepare_requests:
+            progress("📉 Сравниваем с прошлой инвентаризацией…")
+            previous_title = get_previous_inventory_title(sheets_service, spreadsheet_id, sheet_title)
+            extra_requests = prepare_requests(sheets_service, spreadsheet_id, sheet_title, previous_title)
+            if extra_requests:
+                try:
+                    batch_update(sheets_service, spreadsheet_id, extra_requests)
+                except HttpError as e:
+                    logger.warning("Дополнительные запросы пропущены: %s", e)
+        return sheet_title
+    except Exception as e:
+        logger.error("Ошибка при сохранении в журнал: %s", e)
+        raise
 
 def get_inventory_history(service, spreadsheet_id, warehouse_name):
     """Получение истории инвентаризаций для склада"""
@@ -460,7 +1248,7 @@ def get_inventory_history(service, spreadsheet_id, warehouse_name):
         
         return sorted(history, key=lambda x: datetime.strptime(x['date'], '%Y-%m-%d'), reverse=True)
     except Exception as e:
-        print(f"Ошибка при получении истории: {e}")
+        logger.error("Ошибка при получении истории: %s", e)
         return []
 
 def move_existing_files_to_folder(drive_service):
@@ -492,5 +1280,5 @@ def move_existing_files_to_folder(drive_service):
                 fields='id, parents'
             ).execute()
         except Exception as e:
-            logging.error(f"Error moving file {file['name']}: {str(e)}")
+            logger.error("Error moving file %s: %s", file['name'], e)
             continue 
\ No newline at end of file
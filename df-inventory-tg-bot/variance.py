@@ -0,0 +1,147 @@
+import os
+import logging
+import numpy as np
+from dotenv import load_dotenv
+from sheets import get_sheet_index, new_sheet_id
+from catalog import get_catalog, align_items
+from report import stock_cache, read_stock, format_quantity
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Константы
+VARIANCE_ABS_THRESHOLD = float(os.getenv('VARIANCE_ABS_THRESHOLD', '10'))  # Крупное изменение в единицах товара
+VARIANCE_REL_THRESHOLD = float(os.getenv('VARIANCE_REL_THRESHOLD', '0.5'))  # Крупное изменение в долях от прошлого
+VARIANCE_SHEET_ENABLED = os.getenv('VARIANCE_SHEET', '1') == '1'  # Записывать расхождения на отдельный лист
+VARIANCE_SHEET_TITLE = 'Расхождения'
+VARIANCE_HEADER = ['Дата', 'Лист', 'Предыдущий лист', 'Тип', 'Продукт', 'Единица измерения', 'Было', 'Стало', 'Разница']
+VARIANCE_MESSAGE_LIMIT = 10  # Сколько строк расхождений показывать в сообщении
+
+# Виды расхождений
+NEW = 'new'
+MISSING = 'missing'
+CHANGED = 'changed'
+KIND_LABELS = {NEW: 'Новый товар', MISSING: 'Отсутствует', CHANGED: 'Изменение'}
+KIND_EMOJIS = {NEW: '🆕', MISSING: '❔', CHANGED: '↕️'}
+
+def is_large_change(previous, current):
+    """Превышает ли изменение абсолютный или относительный порог"""
+    difference = abs(current - previous)
+    if difference >= VARIANCE_ABS_THRESHOLD:
+        return True
+    return previous != 0 and difference / abs(previous) >= VARIANCE_REL_THRESHOLD
+
+def compute_variance(catalog, previous, current):
+    """Расхождения двух инвентаризаций: пары (количества каталога, товары вне каталога).
+    Возвращает строки (вид, название, единица, было, стало)"""
+    previous_quantities, previous_extra = previous
+    current_quantities, current_extra = current
+    changes = []
+    # Массивы выровнены по номерам товаров: маски видов расхождений считаются сразу по всем товарам,
+    # массивы array('d') читаются без копирования
+    size = min(len(previous_quantities), len(current_quantities))
+    was = np.frombuffer(previous_quantities, dtype=float)[:size]
+    now = np.frombuffer(current_quantities, dtype=float)[:size]
+    was_counted = ~np.isnan(was)
+    now_counted = ~np.isnan(now)
+    difference = np.abs(now - was)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        large = (difference >= VARIANCE_ABS_THRESHOLD) | ((was != 0) & (difference / np.abs(was) >= VARIANCE_REL_THRESHOLD))
+    new = now_counted & ~was_counted
+    missing = was_counted & ~now_counted
+    changed = was_counted & now_counted & large
+    for product_id in np.flatnonzero(new | missing | changed):
+        product = catalog.products[product_id]
+        if new[product_id]:
+            changes.append((NEW, product.name, product.unit, None, float(now[product_id])))
+        elif missing[product_id]:
+            changes.append((MISSING, product.name, product.unit, float(was[product_id]), None))
+        else:
+            changes.append((CHANGED, product.name, product.unit, float(was[product_id]), float(now[product_id])))
+    # Товары, которых уже нет в каталоге, сравниваются по названию
+    for key in sorted(set(previous_extra) | set(current_extra)):
+        was = previous_extra.get(key)
+        now = current_extra.get(key)
+        if was is None:
+            changes.append((NEW, key[0], key[1], None, now))
+        elif now is None:
+            changes.append((MISSING, key[0], key[1], was, None))
+        elif is_large_change(was, now):
+            changes.append((CHANGED, key[0], key[1], was, now))
+    return changes
+
+def load_previous(service, spreadsheet_id, warehouse, previous_title, catalog):
+    """Количества предыдущей инвентаризации; берутся из кэша сводного отчета, если он актуален"""
+    entry = stock_cache.peek(warehouse)
+    if entry and entry['title'] == previous_title and entry['catalog'] is catalog:
+        return entry['quantities'], entry['extra']
+    return read_stock(service, spreadsheet_id, previous_title, catalog)
+
+def _cell(value):
+    """Значение ячейки для запроса appendCells"""
+    if value is None:
+        return {}
+    if isinstance(value, (int, float)):
+        return {'userEnteredValue': {'numberValue': value}}
+    return {'userEnteredValue': {'stringValue': str(value)}}
+
+def variance_requests(service, spreadsheet_id, date, sheet_title, previous_title, changes):
+    """Запросы batchUpdate, дописывающие расхождения на лист «Расхождения»"""
+    index = get_sheet_index(service, spreadsheet_id)
+    sheet_id = index['titles'].get(VARIANCE_SHEET_TITLE)
+    requests = []
+    rows = []
+    if sheet_id is None:
+        # Номер листа задаем сами, чтобы дописать строки в том же batchUpdate
+        sheet_id = new_sheet_id(index)
+        requests.append({'addSheet': {'properties': {'sheetId': sheet_id, 'title': VARIANCE_SHEET_TITLE}}})
+        rows.append(VARIANCE_HEADER)
+    for kind, name, unit, was, now in changes:
+        difference = (now or 0) - (was or 0)
+        rows.append([date, sheet_title, previous_title, KIND_LABELS[kind], name, unit, was, now, difference])
+    requests.append({
+        'appendCells': {
+            'sheetId': sheet_id,
+            'rows': [{'values': [_cell(value) for value in row]} for row in rows],
+            'fields': 'userEnteredValue'
+        }
+    })
+    return requests
+
+def variance_hook(record, items):
+    """Функция для save_inventory: считает расхождения с предыдущей инвентаризацией,
+    сохраняет их в record['variance'] и возвращает запросы для листа «Расхождения»"""
+    def prepare_requests(service, spreadsheet_id, sheet_title, previous_title):
+        if previous_title is None:
+            return []
+        try:
+            catalog = get_catalog()
+            current = align_items(catalog, items)
+            previous = load_previous(service, spreadsheet_id, record['warehouse'], previous_title, catalog)
+            changes = compute_variance(catalog, previous, current)
+            record['variance'] = {'previous_title': previous_title, 'changes': changes}
+            if not changes or not VARIANCE_SHEET_ENABLED:
+                return []
+            return variance_requests(service, spreadsheet_id, record['date'], sheet_title, previous_title, changes)
+        except Exception as e:
+            # Расхождения не должны мешать сохранению инвентаризации
+            logging.error("Ошибка расчета расхождений для склада %s: %s", record['warehouse'], e)
+            return []
+    return prepare_requests
+
+def format_variance(variance, limit=VARIANCE_MESSAGE_LIMIT):
+    """Строки сообщения с расхождениями"""
+    changes = variance['changes']
+    counts = {kind: sum(1 for change in changes if change[0] == kind) for kind in KIND_LABELS}
+    lines = [
+        f"📉 Сравнение с {variance['previous_title']}: новых {counts[NEW]}, "
+        f"отсутствует {counts[MISSING]}, крупных изменений {counts[CHANGED]}"
+    ]
+    for kind, name, unit, was, now in changes[:limit]:
+        was_text = "—" if was is None else format_quantity(was)
+        now_text = "—" if now is None else format_quantity(now)
+        title = f"{name} [{unit}]" if unit else name
+        lines.append(f"{KIND_EMOJIS[kind]} {title}: {was_text} → {now_text}")
+    if len(changes) > limit:
+        lines.append(f"… и еще {len(changes) - limit}")
+    return lines
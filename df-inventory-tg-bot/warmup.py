@@ -0,0 +1,130 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+from sheets import (
+    get_google_sheets_service, get_drive_service, get_or_create_folder, get_or_create_spreadsheet,
+    list_warehouse_spreadsheets, get_sheet_index, SPREADSHEET_MIME_TYPE
+)
+from config import WAREHOUSES
+from logconfig import setup_logging
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Константы
+WARMUP_ON_START = os.getenv('WARMUP_ON_START', '0') == '1'  # Прогревать таблицы складов при запуске бота
+WARMUP_CONCURRENCY = int(os.getenv('WARMUP_CONCURRENCY', '8'))  # Сколько таблиц загружается одновременно
+PROVISION_BATCH_SIZE = 10  # Таблиц в одном пакетном запросе создания
+
+# Ход прогрева для /stats
+warmup_status = {'total': 0, 'done': 0, 'failed': 0, 'created': 0, 'duration': None}
+_services = threading.local()
+
+def _thread_services():
+    """Сервисы Google для рабочего потока: клиенты googleapiclient нельзя делить между потоками"""
+    if getattr(_services, 'sheets', None) is None:
+        _services.sheets = get_google_sheets_service()
+        _services.drive = get_drive_service()
+    return _services.sheets, _services.drive
+
+def warm_warehouse(warehouse, spreadsheet_id, create):
+    """Загрузить индекс листов таблицы склада, при create создав отсутствующую таблицу;
+    True, если таблица создана"""
+    sheets_service, drive_service = _thread_services()
+    created = False
+    if spreadsheet_id is None and create:
+        spreadsheet_id = get_or_create_spreadsheet(sheets_service, drive_service, warehouse)
+        created = True
+    if spreadsheet_id:
+        get_sheet_index(sheets_service, spreadsheet_id)
+    return created
+
+def warm_up(create=True):
+    """Прогрев папки, таблиц всех складов и их индексов листов (блокирующий вызов).
+    Без create отсутствующие таблицы не создаются"""
+    started = time.monotonic()
+    drive_service = get_drive_service()
+    get_or_create_folder(drive_service)
+    # Один список папки находит все существующие таблицы сразу
+    existing = list_warehouse_spreadsheets(drive_service)
+    warmup_status.update(total=len(WAREHOUSES), done=0, failed=0, created=0, duration=None)
+    with ThreadPoolExecutor(max_workers=WARMUP_CONCURRENCY, thread_name_prefix='warmup') as executor:
+        futures = {
+            executor.submit(warm_warehouse, warehouse, existing.get(warehouse), create): warehouse
+            for warehouse in WAREHOUSES
+        }
+        for future in as_completed(futures):
+            try:
+                warmup_status['created'] += future.result()
+            except Exception as e:
+                warmup_status['failed'] += 1
+                logging.error("Прогрев склада %s: %s", futures[future], e)
+            warmup_status['done'] += 1
+            logging.info(
+                "Прогрев таблиц складов: %s/%s (%s%%)",
+                warmup_status['done'], warmup_status['total'], warmup_status['done'] * 100 // warmup_status['total']
+            )
+    warmup_status['duration'] = round(time.monotonic() - started, 1)
+    logging.info(
+        "Прогрев завершен за %s с: складов %s, создано таблиц %s, ошибок %s",
+        warmup_status['duration'], warmup_status['total'], warmup_status['created'], warmup_status['failed']
+    )
+    return warmup_status
+
+def get_warmup_status():
+    """Снимок хода прогрева"""
+    status = dict(warmup_status)
+    status['percent'] = status['done'] * 100 // status['total'] if status['total'] else 0
+    return status
+
+async def run_warmup(create=True):
+    """Прогрев в фоне: бот уже принимает обновления, первые сохранения просто подождут свою таблицу"""
+    try:
+        await asyncio.to_thread(warm_up, create)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logging.error("Ошибка прогрева таблиц складов: %s", e)
+
+def provision():
+    """Создать отсутствующие таблицы складов пакетными запросами Drive (блокирующий вызов).
+    Одноименные таблицы, если их параллельно создаст бот, объединит reconcile_duplicates"""
+    drive_service = get_drive_service()
+    folder_id = get_or_create_folder(drive_service)
+    existing = list_warehouse_spreadsheets(drive_service)
+    missing = [warehouse for warehouse in WAREHOUSES if warehouse not in existing]
+    created = []
+
+    def on_created(request_id, response, exception):
+        if exception:
+            logging.error("Ошибка создания таблицы склада %s: %s", missing[int(request_id)], exception)
+        else:
+            created.append(response['id'])
+
+    for start in range(0, len(missing), PROVISION_BATCH_SIZE):
+        batch = drive_service.new_batch_http_request()
+        for i, warehouse in enumerate(missing[start:start + PROVISION_BATCH_SIZE], start):
+            batch.add(
+                drive_service.files().create(
+                    body={'name': warehouse, 'mimeType': SPREADSHEET_MIME_TYPE, 'parents': [folder_id]},
+                    fields='id'
+                ),
+                callback=on_created,
+                request_id=str(i)
+            )
+        batch.execute()
+        logging.info("Создание таблиц складов: %s/%s", min(start + PROVISION_BATCH_SIZE, len(missing)), len(missing))
+    return len(WAREHOUSES) - len(missing), len(created), len(missing) - len(created)
+
+if __name__ == '__main__':
+    setup_logging()
+    if sys.argv[1:] == ['--provision']:
+        existing, created, failed = provision()
+        print(f"Таблиц складов: было {existing}, создано {created}, ошибок {failed}")
+    else:
+        print("Использование: python warmup.py --provision")
@@ -0,0 +1,86 @@
+import os
+import signal
+import asyncio
+import logging
+import multiprocessing
+from dotenv import load_dotenv
+from telegram import Bot, Update
+from telegram.ext import Updater
+from logconfig import setup_logging
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Константы
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', '4'))  # Сколько процессов бота запускать
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # Публичный адрес вебхука; без него обновления получаются опросом
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+
+def worker_for(update, count):
+    """Номер процесса для обновления: обновления одного пользователя всегда идут по порядку в один процесс"""
+    user = update.effective_user
+    return user.id % count if user else 0
+
+def run_worker(index, count, updates):
+    """Точка входа процесса бота"""
+    # Остановку по Ctrl+C ведет диспетчер: процесс завершается, получив None из очереди
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    setup_logging(worker=index)
+    # Бот импортируется в процессе: его состояние у каждого процесса свое
+    from bot import serve_worker
+    asyncio.run(serve_worker(index, count, updates))
+
+async def dispatch(queues):
+    """Получать обновления через вебхук или опрос и раздавать их процессам по user_id"""
+    update_queue = asyncio.Queue()
+    bot = Bot(os.getenv('TELEGRAM_BOT_TOKEN'))
+    async with Updater(bot, update_queue) as updater:
+        if WEBHOOK_URL:
+            await updater.start_webhook(
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                url_path=WEBHOOK_PATH,
+                webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=Update.ALL_TYPES
+            )
+        else:
+            await updater.start_polling(allowed_updates=Update.ALL_TYPES)
+        logging.info("Диспетчер запущен: процессов бота %s", len(queues))
+        try:
+            while True:
+                update = await update_queue.get()
+                queues[worker_for(update, len(queues))].put(update.to_json())
+        finally:
+            await updater.stop()
+
+def main():
+    """Запуск диспетчера и процессов бота"""
+    setup_logging(worker='dispatcher')
+    from sessions import SESSION_BACKEND
+    if SESSION_BACKEND == 'memory':
+        raise SystemExit("Для нескольких процессов нужно общее хранилище сессий: SESSION_BACKEND=sqlite или redis")
+    context = multiprocessing.get_context('spawn')
+    queues = [context.Queue() for _ in range(BOT_WORKERS)]
+    processes = [
+        context.Process(target=run_worker, args=(index, BOT_WORKERS, queue), name=f"bot-worker-{index}")
+        for index, queue in enumerate(queues)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        asyncio.run(dispatch(queues))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Процессы дорабатывают полученные обновления и останавливаются
+        for queue in queues:
+            queue.put(None)
+        for process in processes:
+            process.join()
+
+if __name__ == '__main__':
+    main()